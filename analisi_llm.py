@@ -1,31 +1,47 @@
+from cache_llm import cache_risposte
+from client_llm import client_llm
 
-import requests
-import json
+# Versione del prompt del commento: incrementandola i commenti in cache vengono rigenerati
+VERSIONE_PROMPT_COMMENTO = 1
+
+# Prompt leggibile per AuditLLM con i dati estratti e i KPI
+def _prompt_commento(dati_estratti, kpi_df):
+    testo = "Dati estratti dal bilancio:\n"
+    for k, v in dati_estratti.items():
+        testo += f"- {k}: {v}\n"
+
+    testo += "\nKPI calcolati:\n"
+    for _, row in kpi_df.iterrows():
+        testo += f"- {row['KPI']}: {row['Valore']}\n"
+
+    return (
+        "Sei un revisore esperto. Analizza i dati seguenti e fornisci un commento dettagliato su: "
+        "redditività, solidità patrimoniale, performance operativa e eventuali aree di attenzione.\n\n" + testo
+    )
+
+def _chiave_commento(dati_estratti, kpi_df):
+    return cache_risposte.chiave(client_llm().modello, "commento_llm", VERSIONE_PROMPT_COMMENTO,
+                                 dati={"dati": dati_estratti, "kpi": kpi_df})
+
+# ✅ Commento di AuditLLM; gli errori vengono sollevati (usata dai commenti in batch)
+def commento_llm(dati_estratti, kpi_df, rigenera=False):
+    # Invio al modello AuditLLM locale (o commento già generato per gli stessi dati)
+    prompt = _prompt_commento(dati_estratti, kpi_df)
+    return cache_risposte.risposta(_chiave_commento(dati_estratti, kpi_df),
+                                   lambda: client_llm().genera(prompt), rigenera)
 
 # ✅ Funzione: invia a AuditLLM i dati estratti e riceve commento intelligente
-def genera_commento_llm(dati_estratti, kpi_df):
+def genera_commento_llm(dati_estratti, kpi_df, rigenera=False):
     try:
-        # Prepara prompt leggibile per AuditLLM
-        testo = "Dati estratti dal bilancio:\n"
-        for k, v in dati_estratti.items():
-            testo += f"- {k}: {v}\n"
-
-        testo += "\nKPI calcolati:\n"
-        for _, row in kpi_df.iterrows():
-            testo += f"- {row['KPI']}: {row['Valore']}\n"
-
-        prompt = (
-            "Sei un revisore esperto. Analizza i dati seguenti e fornisci un commento dettagliato su: "
-            "redditività, solidità patrimoniale, performance operativa e eventuali aree di attenzione.\n\n" + testo
-        )
-
-        # Invio al modello AuditLLM locale
-        response = requests.post("http://localhost:11434/api/generate", json={
-            "model": "mistral",
-            "prompt": prompt,
-            "stream": False
-        })
-
-        return response.json()["response"].strip()
+        return commento_llm(dati_estratti, kpi_df, rigenera)
     except Exception as e:
         return f"⚠️ Errore AuditLLM: {str(e)}"
+
+# ✅ Come genera_commento_llm, ma restituisce il commento un frammento alla volta
+def genera_commento_llm_stream(dati_estratti, kpi_df, rigenera=False):
+    try:
+        prompt = _prompt_commento(dati_estratti, kpi_df)
+        yield from cache_risposte.risposta_stream(_chiave_commento(dati_estratti, kpi_df),
+                                                  lambda: client_llm().genera_stream(prompt), rigenera)
+    except Exception as e:
+        yield f"⚠️ Errore AuditLLM: {str(e)}"
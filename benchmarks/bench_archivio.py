@@ -0,0 +1,101 @@
+# --- benchmarks/bench_archivio.py ---
+"""
+Apertura della pagina movimenti con un registro grande: caricamento di tutto il JSON in memoria
+contro l'archivio SQLite (solo le righe mostrate); inserimento a blocchi, ricerche e letture concorrenti.
+
+Uso: python benchmarks/bench_archivio.py [--movimenti 1000000] [--lettori 4]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from gestionale.archivio import ArchivioSQLite
+from gestionale.movimenti import MovimentoContabile, RegistroMovimentiColonnare, RegistroMovimentiSQLite
+
+CATEGORIE = ["Vendite", "Acquisti", "Finanziamenti", "Cassa", "Banca"]
+
+
+def movimento(i):
+    return {"codice": ["OIC_01", "OIC_02", "IAS_01", "IFRS_15"][i % 4], "descrizione": "Fattura attiva",
+            "categoria": CATEGORIE[i % 5], "data": f"{2020 + i % 5}-{i % 12 + 1:02d}-{i % 28 + 1:02d}",
+            "importo": float(i % 99991) * (100 if i % 1000 == 0 else 1), "valuta": "EUR", "standard": "OIC"}
+
+
+def apri_pagina(registro):
+    """Quello che la pagina dei movimenti legge all'apertura."""
+    ultimi = registro.ultimi(1000) if hasattr(registro, "ultimi") else registro.tabella()
+    return len(ultimi), registro.totali_per_categoria(), len(registro.verifica_movimenti_sospetti(1_000_000))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--movimenti", type=int, default=1_000_000)
+    parser.add_argument("--lettori", type=int, default=4)
+    args = parser.parse_args()
+
+    cartella = tempfile.TemporaryDirectory()
+    dati = [movimento(i) for i in range(args.movimenti)]
+    file_json = os.path.join(cartella.name, "movimenti.json")
+    with open(file_json, "w", encoding="utf-8") as f:
+        json.dump(dati, f)
+    print(f"{args.movimenti} movimenti")
+
+    t0 = time.perf_counter()
+    with open(file_json, encoding="utf-8") as f:
+        registro = RegistroMovimentiColonnare()
+        registro.carica_da_lista(json.load(f))
+    apri_pagina(registro)
+    print(f"apertura pagina, JSON in memoria:     {time.perf_counter() - t0:8.3f} s")
+
+    archivio = ArchivioSQLite(os.path.join(cartella.name, "gestionale.db"))
+    t0 = time.perf_counter()
+    RegistroMovimentiSQLite(archivio).aggiungi_tabella(dati)
+    print(f"inserimento con executemany:          {time.perf_counter() - t0:8.3f} s")
+
+    t0 = time.perf_counter()
+    registro = RegistroMovimentiSQLite(archivio)
+    apri_pagina(registro)
+    print(f"apertura pagina, archivio SQLite:     {time.perf_counter() - t0:8.3f} s")
+
+    t0 = time.perf_counter()
+    trovati = registro.cerca(categoria="Banca", dal="2024-03-01", al="2024-03-31")
+    print(f"ricerca categoria + mese (SQL):       {time.perf_counter() - t0:8.3f} s  ({len(trovati)} movimenti)")
+
+    # una sessione scrive movimento per movimento mentre le altre leggono (WAL)
+    fine = threading.Event()
+    letture = []
+
+    def lettore():
+        archivio_lettore = ArchivioSQLite(archivio.percorso)
+        r = RegistroMovimentiSQLite(archivio_lettore)
+        while not fine.is_set():
+            t = time.perf_counter()
+            apri_pagina(r)
+            letture.append(time.perf_counter() - t)
+
+    lettori = [threading.Thread(target=lettore) for _ in range(args.lettori)]
+    for t in lettori:
+        t.start()
+    t0 = time.perf_counter()
+    scritti = 0
+    while time.perf_counter() - t0 < 3:
+        registro.aggiungi_movimento(MovimentoContabile(**movimento(args.movimenti + scritti)))
+        scritti += 1
+    scrittura = (time.perf_counter() - t0) / scritti
+    fine.set()
+    for t in lettori:
+        t.join()
+    letture.sort()
+    print(f"con {args.lettori} lettori: {scritti} inserimenti da {scrittura * 1000:.2f} ms, "
+          f"{len(letture)} aperture pagina, mediana {letture[len(letture) // 2] * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
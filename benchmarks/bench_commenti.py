@@ -0,0 +1,92 @@
+# --- benchmarks/bench_commenti.py ---
+"""
+Commenti AuditLLM di più bilanci: uno alla volta contro commenti_batch, su un finto Ollama locale con latenza.
+
+Uso: python benchmarks/bench_commenti.py [--bilanci 12] [--latenza 1.0] [--concorrenza 4]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+class FintoOllama(BaseHTTPRequestHandler):
+    """Risponde a /api/generate dopo 'latenza' secondi; un prompt con 'LENTO' non risponde in tempo."""
+    protocol_version = "HTTP/1.1"
+    latenza = 1.0
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        corpo = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        time.sleep(self.latenza * (10 if "LENTO" in corpo.get("prompt", "") else 1))
+        risposta = json.dumps({"response": f"Commento di prova ({len(corpo['prompt'])} caratteri).",
+                               "done": True}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(risposta)))
+        self.end_headers()
+        self.wfile.write(risposta)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bilanci", type=int, default=12)
+    parser.add_argument("--latenza", type=float, default=1.0)
+    parser.add_argument("--concorrenza", type=int, default=4)
+    args = parser.parse_args()
+
+    FintoOllama.latenza = args.latenza
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FintoOllama)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ["OLLAMA_URL"] = f"http://127.0.0.1:{server.server_port}"
+    # i commenti di prova non devono finire nella cache del progetto
+    cartella = tempfile.TemporaryDirectory()
+    os.chdir(cartella.name)
+
+    from commenti_batch import commenti_stream, _richieste
+    from utils import INPUT_KPI
+
+    voci = {f"Azienda {i}": {k: float(v * (i + 1)) for k, v in INPUT_KPI.items()}
+            for i in range(args.bilanci)}
+
+    # rigenera=True: nessun commento dalla cache, si misura solo la generazione
+    t0 = time.perf_counter()
+    for _, genera in _richieste(voci, "auditllm", rigenera=True):
+        genera()
+    t_seq = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    primo = None
+    ordine = []
+    for nome, _, errore in commenti_stream(voci, concorrenza=args.concorrenza, rigenera=True):
+        primo = primo or time.perf_counter() - t0
+        ordine.append(nome)
+        assert errore is None, errore
+    t_par = time.perf_counter() - t0
+
+    print(f"{args.bilanci} bilanci, latenza {args.latenza:g} s")
+    print(f"uno alla volta:       {t_seq:6.2f} s")
+    print(f"concorrenza {args.concorrenza:<2}:       {t_par:6.2f} s  (primo commento dopo {primo:.2f} s)")
+    print(f"speed-up:             {t_seq / t_par:6.1f}x")
+
+    # un bilancio che non risponde in tempo non blocca gli altri
+    voci["Azienda 0"] = dict(voci["Azienda 0"], nota="LENTO")
+    t0 = time.perf_counter()
+    esiti = dict((nome, errore) for nome, _, errore in
+                 commenti_stream(voci, concorrenza=args.concorrenza, timeout=args.latenza * 3, rigenera=True))
+    print(f"con un timeout:       {time.perf_counter() - t0:6.2f} s  ({esiti['Azienda 0']})")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# --- benchmarks/bench_fuzzy.py ---
+"""
+Confronto righe/secondo del fallback fuzzy: difflib per riga contro indice a trigrammi.
+
+Uso: python benchmarks/bench_fuzzy.py [--mb 1] [--soglia 0.85]
+"""
+
+import argparse
+import difflib
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from ricerca_termini import IndiceTrigrammi
+from utils import keywords_map
+
+RIGHE_TIPO = [
+    "{voce}{sep}{num}",
+    "{voce} {anno}{sep}{num}   {num}",
+    "Totale {voce}{sep}{num}",
+    "Nota {n} - {voce}",
+    "Il gruppo ha registrato {voce} pari a {num} milioni di euro rispetto al {anno}",
+    "{testo}",
+]
+TESTO_LIBERO = [
+    "Relazione sulla gestione al 31 dicembre",
+    "Consolidated statement of financial position",
+    "Principi contabili e criteri di valutazione adottati nella redazione del bilancio",
+    "Informazioni sui rischi finanziari e sulla continuità aziendale",
+    "Fatti di rilievo avvenuti dopo la chiusura dell'esercizio",
+]
+
+def genera_testo(mb, seed=0):
+    """Testo sintetico di un bilancio di circa 'mb' megabyte."""
+    r = random.Random(seed)
+    voci = [t for k, syn in keywords_map.items() for t in [k] + syn]
+    righe, dim = [], 0
+    while dim < mb * 1_000_000:
+        voce = r.choice(voci)
+        if r.random() < 0.1:
+            # refuso tipico da OCR
+            i = r.randrange(len(voce))
+            voce = voce[:i] + voce[i + 1:]
+        riga = r.choice(RIGHE_TIPO).format(
+            voce=voce, sep=r.choice([" ", ": ", "\t"]), num=f"{r.randint(1, 10**8):,}".replace(",", "."),
+            anno=r.choice(["2022", "2023", "2024"]), n=r.randint(1, 40), testo=r.choice(TESTO_LIBERO))
+        righe.append(riga)
+        dim += len(riga) + 1
+    return righe
+
+def bench_difflib(righe, termini, soglia):
+    trovate = 0
+    for line in righe:
+        ll = line.lower()
+        if any(difflib.get_close_matches(t, [ll], cutoff=soglia) for t in termini):
+            trovate += 1
+    return trovate
+
+def bench_indice(righe, termini, soglia):
+    indice = IndiceTrigrammi(termini, soglia)
+    trovate = 0
+    for line in righe:
+        if indice.corrispondenze(line.lower().strip()):
+            trovate += 1
+    return trovate
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mb", type=float, default=1.0)
+    parser.add_argument("--soglia", type=float, default=0.85)
+    args = parser.parse_args()
+
+    righe = genera_testo(args.mb)
+    termini = list(dict.fromkeys(t.lower() for k, syn in keywords_map.items() for t in [k] + syn))
+    print(f"Testo: {sum(len(r) + 1 for r in righe) / 1e6:.2f} MB, {len(righe)} righe, {len(termini)} termini")
+    # Come nello scanner, il fallback fuzzy riguarda solo le righe senza match esatto
+    righe = [r for r in righe if not any(t in r.lower() for t in termini)]
+    print(f"Righe senza match esatto: {len(righe)}")
+
+    for nome, fn in [("difflib (prima)", bench_difflib), ("trigrammi (dopo)", bench_indice)]:
+        t0 = time.perf_counter()
+        trovate = fn(righe, termini, args.soglia)
+        dt = time.perf_counter() - t0
+        print(f"{nome:<18} {len(righe) / dt:>12,.0f} righe/s  {dt:8.2f} s  righe con match: {trovate}")
+
+if __name__ == "__main__":
+    main()
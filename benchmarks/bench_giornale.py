@@ -0,0 +1,83 @@
+# --- benchmarks/bench_giornale.py ---
+"""
+Inserimento di movimenti in un registro già grande: riscrittura completa del JSON (metodo storico)
+contro il giornale append-only con le tre politiche di fsync; caricamento e crash durante una scrittura.
+
+Uso: python benchmarks/bench_giornale.py [--movimenti 100000] [--inserimenti 200]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from gestionale.giornale import Giornale
+
+
+def movimento(i):
+    return {"codice": "OIC_01", "descrizione": "Fattura attiva", "categoria": "Vendite",
+            "data": f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}", "importo": float(i % 9973), "valuta": "EUR",
+            "standard": "OIC"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--movimenti", type=int, default=100_000)
+    parser.add_argument("--inserimenti", type=int, default=200)
+    args = parser.parse_args()
+
+    cartella = tempfile.TemporaryDirectory()
+    esistenti = [movimento(i) for i in range(args.movimenti)]
+    nuovi = [movimento(args.movimenti + i) for i in range(args.inserimenti)]
+    print(f"registro di {args.movimenti} movimenti, {args.inserimenti} inserimenti")
+
+    percorso = os.path.join(cartella.name, "riscrittura.json")
+    lista = list(esistenti)
+    t0 = time.perf_counter()
+    for m in nuovi:
+        lista.append(m)
+        with open(percorso, "w", encoding="utf-8") as f:
+            json.dump(lista, f, indent=2)
+    t = (time.perf_counter() - t0) / len(nuovi)
+    print(f"riscrittura completa:        {t * 1000:9.3f} ms per inserimento")
+
+    for sincronizzazione in ("sempre", "periodica", "mai"):
+        percorso = os.path.join(cartella.name, f"{sincronizzazione}.json")
+        giornale = Giornale(percorso, sincronizzazione=sincronizzazione)
+        giornale.riscrivi(esistenti)
+        t0 = time.perf_counter()
+        for m in nuovi:
+            giornale.aggiungi(m)
+        t = (time.perf_counter() - t0) / len(nuovi)
+        giornale.chiudi()
+        print(f"giornale, fsync {sincronizzazione:10}   {t * 1000:9.3f} ms per inserimento")
+
+    # caricamento: istantanea più giornale rieseguito
+    t0 = time.perf_counter()
+    record = Giornale(percorso).carica()
+    print(f"caricamento con replay:      {(time.perf_counter() - t0) * 1000:9.1f} ms  ({len(record)} movimenti)")
+
+    # crash a metà di una scrittura: l'ultima riga è troncata, il resto del registro è intatto
+    with open(percorso + ".giornale", "ab") as f:
+        f.write(json.dumps({"n": 10 ** 9, "dati": movimento(0)}).encode()[:40])
+    record = Giornale(percorso).carica()
+    print(f"dopo una scrittura troncata: {len(record)} movimenti caricati")
+
+    # compattazione in background: gli inserimenti non aspettano la riscrittura dell'istantanea
+    giornale = Giornale(percorso)
+    t0 = time.perf_counter()
+    giornale.compatta()
+    for m in nuovi:
+        giornale.aggiungi(m)
+    t = (time.perf_counter() - t0) / len(nuovi)
+    giornale.chiudi()
+    print(f"durante la compattazione:    {t * 1000:9.3f} ms per inserimento  "
+          f"(giornale dopo: {os.path.getsize(percorso + '.giornale')} byte)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# --- benchmarks/bench_indici.py ---
+"""
+Ricerche sul registro movimenti: indici secondari (hash e date ordinate) contro la scansione completa.
+
+Uso: python benchmarks/bench_indici.py [--righe 1000000] [--colonne 10000000]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from gestionale.movimenti import MovimentoContabile, RegistroMovimenti, RegistroMovimentiColonnare
+
+CATEGORIE = ["Vendite", "Acquisti", "Finanziamenti", "Cassa", "Banca"]
+
+RICERCHE = {
+    "codice (un movimento)": dict(codice="M00123456"),
+    "un giorno": dict(dal="2024-03-15", al="2024-03-15"),
+    "Banca, marzo 2024": dict(categoria="Banca", dal="2024-03-01", al="2024-03-31"),
+    "Banca + IFRS + una settimana": dict(categoria="Banca", standard="IFRS", dal="2024-03-01", al="2024-03-07"),
+}
+
+
+def genera_movimenti(n, seed=0):
+    """Movimenti casuali su due anni, con codici univoci."""
+    rng = np.random.default_rng(seed)
+    giorni = pd.Timestamp("2023-01-01") + pd.to_timedelta(np.sort(rng.integers(0, 730, n)), unit="D")
+    return pd.DataFrame({
+        "codice": [f"M{i:08d}" for i in range(n)],
+        "descrizione": "Movimento",
+        "categoria": np.array(CATEGORIE, dtype=object)[rng.integers(0, len(CATEGORIE), n)],
+        "data": giorni.strftime("%Y-%m-%d"),
+        "importo": np.round(rng.lognormal(8, 2, n), 2),
+        "valuta": "EUR",
+        "standard": np.array(["OIC", "IAS", "IFRS"], dtype=object)[rng.integers(0, 3, n)],
+    })
+
+
+def scansione(movimenti, dal=None, al=None, **criteri):
+    return [m for m in movimenti if all(getattr(m, c) == v for c, v in criteri.items())
+            and (dal is None or m.data >= dal) and (al is None or m.data <= al)]
+
+
+def maschera(df, dal=None, al=None, **criteri):
+    tieni = np.ones(len(df), dtype=bool)
+    for c, v in criteri.items():
+        tieni &= (df[c] == v).to_numpy()
+    if dal is not None:
+        tieni &= (df["data"] >= dal).to_numpy()
+    if al is not None:
+        tieni &= (df["data"] <= al).to_numpy()
+    return df[tieni]
+
+
+def cronometra(f, ripetizioni=5):
+    migliore = float("inf")
+    for _ in range(ripetizioni):
+        t0 = time.perf_counter()
+        risultato = f()
+        migliore = min(migliore, time.perf_counter() - t0)
+    return migliore, len(risultato)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--righe", type=int, default=1_000_000, help="movimenti del registro a oggetti")
+    parser.add_argument("--colonne", type=int, default=10_000_000, help="movimenti del registro a colonne")
+    args = parser.parse_args()
+
+    dati = genera_movimenti(args.righe)
+    registro = RegistroMovimenti()
+    t0 = time.perf_counter()
+    for r in dati.itertuples(index=False):
+        registro.aggiungi_movimento(MovimentoContabile(*r))
+    t_ins = (time.perf_counter() - t0) / args.righe
+    print(f"Registro a oggetti, {args.righe} movimenti (aggiunta con indici: {t_ins * 1e6:.1f} µs)")
+    for nome, criteri in RICERCHE.items():
+        t_idx, n = cronometra(lambda: registro.cerca(**criteri))
+        t_scan, _ = cronometra(lambda: scansione(registro.movimenti, **criteri), 1)
+        print(f"  {nome:30} {n:7d} risultati  indici {t_idx * 1000:8.3f} ms   scansione {t_scan * 1000:8.1f} ms")
+
+    dati = genera_movimenti(args.colonne)
+    colonnare = RegistroMovimentiColonnare()
+    colonnare.aggiungi_tabella(dati)
+    del dati
+    t0 = time.perf_counter()
+    colonnare.cerca(codice="")
+    t_indice = time.perf_counter() - t0
+    print(f"Registro a colonne, {args.colonne} movimenti (indici creati in {t_indice:.2f} s)")
+    df = colonnare.tabella()
+    for nome, criteri in RICERCHE.items():
+        # solo le posizioni: la SelezioneMovimenti copia poi le righe trovate
+        t_idx, n = cronometra(lambda: colonnare._indice.cerca(df, **criteri))
+        t_scan, _ = cronometra(lambda: maschera(df, **criteri), 1)
+        print(f"  {nome:30} {n:7d} risultati  indici {t_idx * 1000:8.3f} ms   maschere  {t_scan * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# --- benchmarks/bench_layout.py ---
+"""
+Confronto tra scanner per righe e abbinamento spaziale (modalità layout) su un PDF
+con prospetti a più colonne: tempo di estrazione e valori dell'esercizio corrente trovati.
+Il tempo dell'abbinamento voce/valore è misurato anche da solo, senza la lettura del PDF
+comune alle due modalità.
+
+Uso: python benchmarks/bench_layout.py [--pagine 60] [--ripetizioni 5]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+import fitz
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils import (
+    _estrai_valori_layout, _leggi_pdf, estrai_valori_righe, extract_financial_data, keywords_map,
+    righe_documento
+)
+
+def _importo(r):
+    return f"{r.randint(10_000, 90_000_000):,}".replace(",", ".")
+
+def genera_pdf(percorso, n_pagine, seed=0):
+    """
+    PDF sintetico: pagine narrative e prospetti con colonne "Note | 2024 | 2023".
+    Ritorna i valori attesi dell'esercizio corrente (2024) per ogni voce.
+    """
+    r = random.Random(seed)
+    attesi = {}
+    doc = fitz.open()
+    chiavi = list(keywords_map)
+    for n in range(n_pagine):
+        page = doc.new_page()
+        if n % 4:
+            testo = "Il gruppo ha proseguito il piano industriale e la revisione dei processi.\n" * 45
+            page.insert_text((40, 40), testo, fontsize=8)
+            continue
+        page.insert_text((40, 40), "Prospetto consolidato - Stato patrimoniale e conto economico", fontsize=10)
+        page.insert_text((330, 58), "Note", fontsize=8)
+        page.insert_text((400, 58), "2024", fontsize=8)
+        page.insert_text((480, 58), "2023", fontsize=8)
+        y = 74
+        for key in r.sample(chiavi, 8):
+            etichetta = r.choice([key] + keywords_map[key])
+            # ogni voce ha lo stesso valore in tutti i prospetti in cui compare
+            if key not in attesi:
+                attesi[key] = (_importo(r), _importo(r))
+            corrente, precedente = attesi[key]
+            page.insert_text((40, y), etichetta, fontsize=8)
+            page.insert_text((330, y), str(r.randint(1, 30)), fontsize=8)
+            page.insert_text((400, y), corrente, fontsize=8)
+            page.insert_text((480, y), precedente, fontsize=8)
+            y += 13
+    doc.save(percorso)
+    return attesi
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pagine", type=int, default=60)
+    parser.add_argument("--ripetizioni", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cartella:
+        percorso = os.path.join(cartella, "bilancio.pdf")
+        attesi = genera_pdf(percorso, args.pagine)
+        print(f"PDF: {args.pagine} pagine, {len(attesi)} voci attese")
+
+        for modalita in ("righe", "layout"):
+            tempi = []
+            for _ in range(args.ripetizioni):
+                t0 = time.perf_counter()
+                data = extract_financial_data(percorso, use_cache=False, workers=1,
+                                              pagine_prospetti=None, modalita=modalita)
+                tempi.append(time.perf_counter() - t0)
+            corretti = sum(1 for k, (v, _) in attesi.items() if data.get(k) == float(v.replace(".", "")))
+            print(f"{modalita:<7} {min(tempi) * 1000:8.1f} ms  "
+                  f"valori dell'esercizio corrente: {corretti}/{len(attesi)}")
+
+        # solo l'abbinamento voce/valore, sulle pagine già lette
+        pagine, selezionate, layout = _leggi_pdf(percorso, {}, workers=1, pagine_prospetti=None)
+        abbinamenti = {
+            "righe": lambda: estrai_valori_righe(righe_documento([pagine[n] for n in selezionate],
+                                                                 [n + 1 for n in selezionate])),
+            "layout": lambda: _estrai_valori_layout(pagine, selezionate, layout),
+        }
+        for modalita, abbina in abbinamenti.items():
+            tempi = []
+            for _ in range(args.ripetizioni):
+                t0 = time.perf_counter()
+                abbina()
+                tempi.append(time.perf_counter() - t0)
+            print(f"{modalita:<7} {min(tempi) * 1000:8.1f} ms  solo abbinamento")
+
+if __name__ == "__main__":
+    main()
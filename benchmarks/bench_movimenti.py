@@ -0,0 +1,83 @@
+# --- benchmarks/bench_movimenti.py ---
+"""
+Registro movimenti: lista di oggetti (RegistroMovimenti) contro colonne (RegistroMovimentiColonnare).
+
+Uso: python benchmarks/bench_movimenti.py [--righe 1000000]   (anche --righe 10000000)
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from gestionale.movimenti import RegistroMovimenti, RegistroMovimentiColonnare
+
+CATEGORIE = ["Vendite", "Acquisti", "Finanziamenti", "Cassa", "Banca"]
+# oltre questo numero di righe il registro a oggetti viene misurato su un campione e proiettato
+MAX_RIGHE_OGGETTI = 1_000_000
+
+
+def genera_movimenti(n, seed=0):
+    """DataFrame di 'n' movimenti casuali con le colonne di MovimentoContabile."""
+    rng = np.random.default_rng(seed)
+    giorni = pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 366, n), unit="D")
+    return pd.DataFrame({
+        "codice": np.array(["OIC_01", "OIC_02", "IAS_01", "IFRS_15"], dtype=object)[rng.integers(0, 4, n)],
+        "descrizione": np.array(["Fattura attiva", "Fattura passiva", "Incasso", "Bonifico"], dtype=object)[rng.integers(0, 4, n)],
+        "categoria": np.array(CATEGORIE, dtype=object)[rng.integers(0, len(CATEGORIE), n)],
+        "data": giorni.strftime("%Y-%m-%d"),
+        "importo": np.round(rng.lognormal(8, 2, n) * rng.choice([-1, 1], n), 2),
+        "valuta": np.array(["EUR", "USD", "GBP", "CHF"], dtype=object)[rng.integers(0, 4, n)],
+        "standard": np.array(["OIC", "IAS", "IFRS"], dtype=object)[rng.integers(0, 3, n)],
+    })
+
+
+def misura(registro, tabella):
+    """Tempi delle interrogazioni; 'tabella' prepara i movimenti da mostrare in pagina."""
+    tempi = {}
+    for nome, f in [("tabella per la pagina", tabella),
+                    ("filtra_per_categoria", lambda: registro.filtra_per_categoria("Banca")),
+                    ("totali_per_categoria", registro.totali_per_categoria),
+                    ("verifica_movimenti_sospetti", lambda: registro.verifica_movimenti_sospetti(1_000_000))]:
+        t0 = time.perf_counter()
+        f()
+        tempi[nome] = time.perf_counter() - t0
+    return tempi
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--righe", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    movimenti = genera_movimenti(args.righe)
+
+    t0 = time.perf_counter()
+    colonnare = RegistroMovimentiColonnare()
+    colonnare.aggiungi_tabella(movimenti)
+    t_carica = time.perf_counter() - t0
+    tempi_col = misura(colonnare, colonnare.tabella)
+
+    campione = min(args.righe, MAX_RIGHE_OGGETTI)
+    oggetti = RegistroMovimenti()
+    oggetti.carica_da_lista(movimenti.head(campione).to_dict("records"))
+    scala = args.righe / campione
+    tempi_ogg = misura(oggetti, lambda: [m.to_dict() for m in oggetti.movimenti])
+    tempi_ogg = {k: v * scala for k, v in tempi_ogg.items()}
+
+    print(f"{args.righe} movimenti (colonne caricate in {t_carica:.2f} s)")
+    stima = " (stima)" if scala > 1 else ""
+    print(f"{'':30} {'oggetti':>12} {'colonne':>10}")
+    for nome in tempi_col:
+        rapporto = tempi_ogg[nome] / max(tempi_col[nome], 1e-9)
+        print(f"{nome:30} {tempi_ogg[nome]:10.3f} s{stima} {tempi_col[nome]:8.4f} s  "
+              + (f"{rapporto:6.0f}x" if rapporto < 1000 else " >1000x"))
+
+
+if __name__ == "__main__":
+    main()
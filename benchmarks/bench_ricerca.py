@@ -0,0 +1,95 @@
+# --- benchmarks/bench_ricerca.py ---
+"""
+Domande su un bilancio lungo: dimensione del prompt con i soli passaggi BM25 contro il documento intero,
+tempi di costruzione dell'indice, di ricarica dalla cache e di ricerca.
+
+Uso: python benchmarks/bench_ricerca.py [--pagine 200]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from llm_utils import PASSAGGI_DOMANDA, prompt_documento
+import ricerca_documento
+from ricerca_documento import indice_documento
+
+DOMANDE = [
+    "A quanto ammontano i debiti verso banche esigibili oltre l'esercizio successivo?",
+    "Come sono valutate le rimanenze di magazzino?",
+    "Ci sono contenziosi fiscali o passività potenziali?",
+    "Qual è la composizione dei ricavi delle vendite per area geografica?",
+]
+
+TEMI = [
+    "I debiti verso banche esigibili oltre l'esercizio successivo ammontano a euro {n} e riguardano mutui ipotecari.",
+    "Le rimanenze di magazzino sono valutate al minore tra costo medio ponderato e valore di realizzo, pari a {n}.",
+    "Non risultano contenziosi fiscali in corso; le passività potenziali stimate sono pari a {n} euro.",
+    "I ricavi delle vendite sono ripartiti per area geografica: Italia {n}, estero il resto.",
+]
+
+
+def genera_pagine(n, seed=0):
+    """Pagine di nota integrativa: testo di riempimento con poche frasi sui temi delle domande."""
+    rng = np.random.default_rng(seed)
+    riempitivo = ("la società ha proseguito la propria attività nel rispetto dei principi contabili nazionali "
+                  "applicando criteri di prudenza e competenza nella redazione del presente documento ").split()
+    pagine = []
+    for i in range(n):
+        parole = list(rng.choice(riempitivo, 420))
+        if i % 25 == 7:
+            parole[200:200] = TEMI[(i // 25) % len(TEMI)].format(n=int(rng.integers(1e4, 1e7))).split()
+        pagine.append(" ".join(parole))
+    return pagine
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pagine", type=int, default=200)
+    args = parser.parse_args()
+
+    pagine = genera_pagine(args.pagine)
+    cartella = tempfile.TemporaryDirectory()
+    ricerca_documento._cache_indici.cartella = cartella.name
+    file_path = os.path.join(cartella.name, "bilancio.txt")
+    with open(file_path, "w", encoding="utf-8") as f:
+        f.write("\f".join(pagine))
+
+    t0 = time.perf_counter()
+    indice = indice_documento(file_path, pagine)
+    t_costruzione = time.perf_counter() - t0
+
+    ricerca_documento._in_memoria.clear()
+    t0 = time.perf_counter()
+    indice = indice_documento(file_path, pagine)
+    t_disco = time.perf_counter() - t0
+
+    dati = {"Ricavi": 1.2e7, "Utile Netto": 3.4e5, "Totale Attivo": 2.1e7}
+    parole_documento = sum(len(p.split()) for p in pagine)
+    t0 = time.perf_counter()
+    for domanda in DOMANDE:
+        indice.cerca(domanda, PASSAGGI_DOMANDA)
+    t_ricerca = (time.perf_counter() - t0) / len(DOMANDE)
+
+    print(f"{args.pagine} pagine, {parole_documento} parole, {len(indice.blocchi)} passaggi")
+    print(f"costruzione indice:   {t_costruzione * 1000:8.1f} ms")
+    print(f"indice dalla cache:   {t_disco * 1000:8.1f} ms")
+    print(f"ricerca per domanda:  {t_ricerca * 1000:8.2f} ms")
+    for tema, domanda in enumerate(DOMANDE):
+        passaggi = indice.cerca(domanda, PASSAGGI_DOMANDA)
+        prompt = prompt_documento(domanda, dati, passaggi)
+        # pagine (da 1) in cui compare la frase sul tema della domanda
+        attese = {i + 1 for i in range(args.pagine) if i % 25 == 7 and (i // 25) % len(TEMI) == tema}
+        pertinente = bool(passaggi) and passaggi[0][1] in attese
+        print(f"- {domanda[:50]:50}  prompt {len(prompt.split()):5d} parole "
+              f"({parole_documento / len(prompt.split()):4.0f}x meno), primo passaggio pertinente: {pertinente}")
+
+
+if __name__ == "__main__":
+    main()
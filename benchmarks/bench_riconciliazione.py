@@ -0,0 +1,86 @@
+# --- benchmarks/bench_riconciliazione.py ---
+"""
+Riconciliazione di due registri grandi: confronto esatto per stringhe JSON (metodo storico) contro riconcilia().
+
+Uso: python benchmarks/bench_riconciliazione.py [--righe 1000000]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from gestionale.riconciliazione import riconcilia
+
+CATEGORIE = ["Vendite", "Acquisti", "Finanziamenti", "Cassa", "Banca"]
+# il confronto per stringhe JSON è lento: si misura un campione e si proietta
+CAMPIONE_JSON = 200_000
+
+
+def genera_registri(n, seed=0):
+    """
+    Registro interno di 'n' movimenti e registro esterno con le differenze tipiche:
+    2% di date spostate di un giorno, 2% di arrotondamenti al centesimo,
+    1% in dollari, 1% di movimenti mancanti e 1% di movimenti in più.
+    """
+    rng = np.random.default_rng(seed)
+    interni = pd.DataFrame({
+        "codice": np.array(["OIC_01", "OIC_02", "IAS_01", "IFRS_15"], dtype=object)[rng.integers(0, 4, n)],
+        "descrizione": np.array(["Fattura attiva", "Fattura passiva", "Incasso", "Bonifico"], dtype=object)[rng.integers(0, 4, n)],
+        "categoria": np.array(CATEGORIE, dtype=object)[rng.integers(0, len(CATEGORIE), n)],
+        "data": pd.Timestamp("2023-01-01") + pd.to_timedelta(rng.integers(0, 730, n), unit="D"),
+        "importo": np.round(rng.lognormal(8, 2, n), 2),
+        "valuta": "EUR",
+        "standard": np.array(["OIC", "IAS", "IFRS"], dtype=object)[rng.integers(0, 3, n)],
+    })
+    esterni = interni.copy()
+    caso = rng.random(n)
+    spostate = caso < 0.02
+    esterni.loc[spostate, "data"] += pd.to_timedelta(rng.choice([-1, 1], spostate.sum()), unit="D")
+    arrotondate = (caso >= 0.02) & (caso < 0.04)
+    esterni.loc[arrotondate, "importo"] += rng.choice([-0.01, 0.01], arrotondate.sum())
+    dollari = (caso >= 0.04) & (caso < 0.05)
+    esterni.loc[dollari, "importo"] = np.round(esterni.loc[dollari, "importo"] / 0.92, 2)
+    esterni.loc[dollari, "valuta"] = "USD"
+    esterni = esterni[~((caso >= 0.05) & (caso < 0.06))]
+    extra = interni.sample(n // 100, random_state=seed).assign(importo=lambda d: d["importo"] + 1000)
+    esterni = pd.concat([esterni, extra], ignore_index=True).sample(frac=1, random_state=seed)
+    return interni, esterni.reset_index(drop=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--righe", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    interni, esterni = genera_registri(args.righe)
+    print(f"{len(interni)} movimenti interni, {len(esterni)} esterni")
+
+    campione = min(CAMPIONE_JSON, args.righe)
+    dizionari = lambda df: df.assign(data=df["data"].dt.strftime("%Y-%m-%d")).to_dict("records")
+    t0 = time.perf_counter()
+    chiavi = {json.dumps(r, sort_keys=True) for r in dizionari(esterni.head(campione))}
+    [r for r in dizionari(interni.head(campione)) if json.dumps(r, sort_keys=True) not in chiavi]
+    t_json = (time.perf_counter() - t0) * args.righe / campione
+    print(f"confronto JSON esatto         {t_json:7.2f} s (stima)")
+
+    for nome, tolleranze in [("esatta", {}),
+                             ("±1 giorno, ±1 cent., cambi", dict(giorni=1, centesimi=1, relativa=0.005,
+                                                                 cambi={"EUR": 1.0, "USD": 0.92}))]:
+        t0 = time.perf_counter()
+        esito = riconcilia(interni, esterni, **tolleranze)
+        t = time.perf_counter() - t0
+        print(f"riconcilia {nome:27} {t:7.2f} s   abbinati {len(esito['abbinati'])}, "
+              f"non abbinati {len(esito['interni'])} interni / {len(esito['esterni'])} esterni")
+        print("    motivi abbinati:", esito["abbinati"]["motivo"].value_counts().to_dict())
+        print("    motivi interni: ", esito["interni"]["motivo"].value_counts().to_dict())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# --- benchmarks/bench_xbrl.py ---
+"""
+Tempo e memoria di picco della lettura iXBRL al crescere della dimensione del file.
+
+Uso: python benchmarks/bench_xbrl.py [--mb 1 5 20]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from estrazione_xbrl import CONCETTI_XBRL, estrai_valori_xbrl
+
+TESTA = """<?xml version="1.0" encoding="utf-8"?>
+<html xmlns="http://www.w3.org/1999/xhtml" xmlns:ix="http://www.xbrl.org/2013/inlineXBRL"
+ xmlns:xbrli="http://www.xbrl.org/2003/instance" xmlns:xbrldi="http://xbrl.org/2006/xbrldi"
+ xmlns:ifrs-full="http://xbrl.ifrs.org/taxonomy/2023-03-23/ifrs-full"
+ xmlns:ixt="http://www.xbrl.org/inlineXBRL/transformation/2020-02-12">
+<body><div style="display:none"><ix:header><ix:resources>
+<xbrli:context id="c2024"><xbrli:entity><xbrli:identifier scheme="x">1</xbrli:identifier></xbrli:entity>
+<xbrli:period><xbrli:instant>2024-12-31</xbrli:instant></xbrli:period></xbrli:context>
+<xbrli:context id="c2023"><xbrli:entity><xbrli:identifier scheme="x">1</xbrli:identifier></xbrli:entity>
+<xbrli:period><xbrli:instant>2023-12-31</xbrli:instant></xbrli:period></xbrli:context>
+<xbrli:context id="c2024seg"><xbrli:entity><xbrli:identifier scheme="x">1</xbrli:identifier>
+<xbrli:segment><xbrldi:explicitMember dimension="ifrs-full:SegmentsAxis">A</xbrldi:explicitMember></xbrli:segment>
+</xbrli:entity><xbrli:period><xbrli:instant>2024-12-31</xbrli:instant></xbrli:period></xbrli:context>
+</ix:resources></ix:header></div>
+"""
+CODA = "</body></html>\n"
+
+
+def genera_ixbrl(percorso, mb, seed=0):
+    """
+    Documento iXBRL di circa 'mb' megabyte: paragrafi di testo e tabelle con fatti
+    ifrs-full. Ogni concetto ha lo stesso valore ogni volta che compare nel 2024.
+    Ritorna i valori attesi per voce.
+    """
+    r = random.Random(seed)
+    concetti = {voce: nomi[-1] for voce, nomi in CONCETTI_XBRL.items() if nomi}
+    attesi = {voce: r.randint(10_000, 10_000_000) for voce in concetti}
+    with open(percorso, "w", encoding="utf-8") as f:
+        f.write(TESTA)
+        dim = len(TESTA)
+        while dim < mb * 1_000_000:
+            parti = ["<div><p>" + " ".join(r.choice(["bilancio", "gruppo", "esercizio", "rischi", "ricavi"])
+                                           for _ in range(80)) + "</p><table>"]
+            for voce, concetto in concetti.items():
+                corrente = f"{attesi[voce] / 1000:,.3f}".replace(",", "_").replace(".", ",").replace("_", ".")
+                parti.append(
+                    f'<tr><td>{voce}</td>'
+                    f'<td><ix:nonFraction name="ifrs-full:{concetto}" contextRef="c2024" unitRef="EUR" '
+                    f'format="ixt:num-comma-decimal" scale="3" decimals="0">{corrente}</ix:nonFraction></td>'
+                    f'<td><ix:nonFraction name="ifrs-full:{concetto}" contextRef="c2023" unitRef="EUR" '
+                    f'format="ixt:num-dot-decimal" decimals="0">{r.randint(1, 10**6):,}</ix:nonFraction></td>'
+                    f'<td><ix:nonFraction name="ifrs-full:{concetto}" contextRef="c2024seg" unitRef="EUR" '
+                    f'decimals="0">{r.randint(1, 10**6)}</ix:nonFraction></td></tr>')
+            parti.append("</table></div>\n")
+            blocco = "".join(parti)
+            f.write(blocco)
+            dim += len(blocco)
+        f.write(CODA)
+    return attesi
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mb", type=float, nargs="+", default=[1, 5, 20])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for mb in args.mb:
+            percorso = os.path.join(tmp, f"bilancio_{mb}.xhtml")
+            attesi = genera_ixbrl(percorso, mb)
+            tracemalloc.start()
+            t0 = time.perf_counter()
+            data, dettagli = estrai_valori_xbrl(percorso)
+            durata = time.perf_counter() - t0
+            _, picco = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            corretti = sum(data[v] == atteso for v, atteso in attesi.items())
+            print(f"{os.path.getsize(percorso) / 1e6:6.1f} MB  {durata:6.2f} s  "
+                  f"picco memoria {picco / 1e6:5.2f} MB  fatti {dettagli['fatti_letti']}  "
+                  f"voci corrette {corretti}/{len(attesi)}")
+
+
+if __name__ == "__main__":
+    main()
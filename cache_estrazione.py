@@ -0,0 +1,104 @@
+# --- cache_estrazione.py ---
+# Cache su disco dei risultati di estrazione, indirizzata per contenuto del file.
+
+import os
+import json
+import hashlib
+import tempfile
+
+CACHE_DIR = os.path.join(".auditflow_cache", "estrazioni")
+CACHE_MAX_BYTES = 200 * 1024 * 1024
+CACHE_MAX_VOCI = 500
+
+
+def hash_file(file_path, chunk_size=1024 * 1024):
+    """SHA-256 del contenuto del file, letto a blocchi."""
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for blocco in iter(lambda: f.read(chunk_size), b""):
+            h.update(blocco)
+    return h.hexdigest()
+
+
+def json_default(o):
+    # scalari numpy/pandas (es. valori letti da Excel)
+    if hasattr(o, "item"):
+        return o.item()
+    return str(o)
+
+
+class CacheEstrazione:
+    """
+    Cache su disco con eviction LRU per numero di voci e dimensione totale.
+    Ogni voce è un file JSON il cui nome è la chiave; l'mtime del file
+    viene aggiornato a ogni lettura e funge da timestamp di ultimo accesso.
+    """
+
+    def __init__(self, cartella=CACHE_DIR, max_bytes=CACHE_MAX_BYTES, max_voci=CACHE_MAX_VOCI):
+        self.cartella = cartella
+        self.max_bytes = max_bytes
+        self.max_voci = max_voci
+
+    def chiave(self, file_path, versione):
+        """Chiave della voce: hash del contenuto, formato del file e versione dell'estrattore."""
+        formato = os.path.splitext(file_path)[1].lower().lstrip(".")
+        return f"{hash_file(file_path)}-{formato}-v{versione}"
+
+    def _percorso(self, chiave):
+        return os.path.join(self.cartella, f"{chiave}.json")
+
+    def leggi(self, chiave):
+        """Restituisce la voce salvata o None se assente/illeggibile."""
+        percorso = self._percorso(chiave)
+        try:
+            with open(percorso, "r", encoding="utf-8") as f:
+                voce = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        try:
+            os.utime(percorso)
+        except OSError:
+            pass
+        return voce
+
+    def scrivi(self, chiave, voce):
+        """Salva la voce in modo atomico e applica l'eviction."""
+        os.makedirs(self.cartella, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.cartella, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(voce, f, default=json_default)
+            os.replace(tmp, self._percorso(chiave))
+        except Exception:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self._evict()
+
+    def rimuovi(self, chiave):
+        try:
+            os.remove(self._percorso(chiave))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        """Elimina le voci usate meno di recente finché si rientra nei limiti."""
+        voci = []
+        for nome in os.listdir(self.cartella):
+            if not nome.endswith(".json"):
+                continue
+            try:
+                st = os.stat(os.path.join(self.cartella, nome))
+            except FileNotFoundError:
+                continue
+            voci.append((st.st_mtime, st.st_size, nome))
+
+        voci.sort()
+        totale = sum(size for _, size, _ in voci)
+        while voci and (len(voci) > self.max_voci or totale > self.max_bytes):
+            _, size, nome = voci.pop(0)
+            try:
+                os.remove(os.path.join(self.cartella, nome))
+            except FileNotFoundError:
+                pass
+            totale -= size
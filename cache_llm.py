@@ -0,0 +1,117 @@
+# --- cache_llm.py ---
+# Cache su disco delle risposte dei modelli linguistici (commenti AI e AuditLLM).
+
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+
+from cache_estrazione import CacheEstrazione
+
+CACHE_LLM_DIR = os.path.join(".auditflow_cache", "llm")
+CACHE_LLM_MAX_BYTES = 50 * 1024 * 1024
+CACHE_LLM_MAX_VOCI = 2000
+# Dopo questo tempo (secondi) una risposta viene rigenerata
+CACHE_LLM_TTL = 7 * 24 * 3600
+# Cifre significative dei numeri nella chiave: variazioni più piccole non rigenerano il commento
+CIFRE_SIGNIFICATIVE = 6
+
+
+def normalizza(valore):
+    """Versione canonica di dati e opzioni per la chiave: numeri arrotondati, spazi compattati."""
+    if hasattr(valore, "to_dict") and hasattr(valore, "columns") and {"KPI", "Valore"} <= set(valore.columns):
+        # DataFrame dei KPI come restituito da calculate_kpis
+        valore = dict(zip(valore["KPI"], valore["Valore"]))
+    if hasattr(valore, "item") and not isinstance(valore, (list, dict, str)):
+        valore = valore.item()
+    if isinstance(valore, dict):
+        return {str(k): normalizza(v) for k, v in sorted(valore.items(), key=lambda kv: str(kv[0]))}
+    if isinstance(valore, (list, tuple)):
+        return [normalizza(v) for v in valore]
+    if isinstance(valore, bool) or valore is None:
+        return valore
+    if isinstance(valore, (int, float)):
+        return float(f"{valore:.{CIFRE_SIGNIFICATIVE}g}")
+    if isinstance(valore, str):
+        return re.sub(r"\s+", " ", valore).strip()
+    return str(valore)
+
+
+class CacheLLM:
+    """
+    Risposte dei modelli su disco, con la stessa eviction LRU di CacheEstrazione
+    più una scadenza (TTL) per voce. Conta i colpi e i mancati del processo.
+    """
+
+    def __init__(self, cartella=CACHE_LLM_DIR, max_bytes=CACHE_LLM_MAX_BYTES,
+                 max_voci=CACHE_LLM_MAX_VOCI, ttl=CACHE_LLM_TTL):
+        self._disco = CacheEstrazione(cartella, max_bytes, max_voci)
+        self.ttl = ttl
+        self.colpi = 0
+        self.mancati = 0
+        self._lock = threading.Lock()
+
+    def chiave(self, modello, modello_prompt, versione, dati=None, opzioni=None):
+        """
+        Hash di (modello, nome e versione del modello di prompt, dati e opzioni normalizzati).
+        Per le domande libere 'dati' è il prompt stesso.
+        """
+        contenuto = json.dumps({"modello": modello, "prompt": modello_prompt, "versione": versione,
+                                "dati": normalizza(dati), "opzioni": normalizza(opzioni or {})},
+                               sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(contenuto.encode("utf-8")).hexdigest()
+
+    def leggi(self, chiave):
+        """Testo in cache per 'chiave', o None se assente o scaduto (aggiorna i contatori)."""
+        try:
+            voce = self._disco.leggi(chiave)
+        except OSError:
+            voce = None
+        if voce is not None and time.time() - voce.get("creato", 0) > self.ttl:
+            self._disco.rimuovi(chiave)
+            voce = None
+        with self._lock:
+            if voce is None:
+                self.mancati += 1
+            else:
+                self.colpi += 1
+        return None if voce is None else voce["testo"]
+
+    def scrivi(self, chiave, testo):
+        try:
+            self._disco.scrivi(chiave, {"creato": time.time(), "testo": testo})
+        except OSError:
+            pass
+
+    def risposta(self, chiave, genera, rigenera=False):
+        """Testo in cache oppure genera() (salvato in cache); con rigenera=True ignora la cache."""
+        testo = None if rigenera else self.leggi(chiave)
+        if testo is None:
+            testo = genera()
+            self.scrivi(chiave, testo)
+        return testo
+
+    def risposta_stream(self, chiave, genera_stream, rigenera=False):
+        """
+        Come risposta() per i generatori di frammenti: in caso di colpo il testo arriva
+        in un solo frammento; altrimenti i frammenti sono inoltrati e, se lo stream
+        si conclude, il testo completo viene salvato.
+        """
+        testo = None if rigenera else self.leggi(chiave)
+        if testo is not None:
+            yield testo
+            return
+        parti = []
+        for parte in genera_stream():
+            parti.append(parte)
+            yield parte
+        self.scrivi(chiave, "".join(parti).strip())
+
+    def statistiche(self):
+        return {"colpi": self.colpi, "mancati": self.mancati}
+
+
+# Cache condivisa dal processo
+cache_risposte = CacheLLM()
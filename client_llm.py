@@ -0,0 +1,88 @@
+# --- client_llm.py ---
+# Client HTTP condiviso per AuditLLM (Ollama): connessioni riutilizzate, timeout, retry e streaming.
+
+import os
+import json
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
+MODELLO = "mistral"
+# Timeout (connessione, lettura) in secondi; in streaming la lettura è l'attesa tra due token
+TIMEOUT = (3.05, 120)
+# Per quanto Ollama tiene il modello in memoria dopo l'ultima richiesta
+KEEP_ALIVE = "30m"
+TENTATIVI = 3
+BACKOFF = 0.5
+
+
+class ClientLLM:
+    """
+    Client per l'API /api/generate di Ollama su una requests.Session condivisa:
+    le connessioni restano aperte tra una richiesta e l'altra. Gli errori di
+    connessione e le risposte 429/5xx vengono ritentati con backoff esponenziale;
+    una generazione già iniziata non viene mai ripetuta.
+    """
+
+    def __init__(self, url=OLLAMA_URL, modello=MODELLO, keep_alive=KEEP_ALIVE,
+                 timeout=TIMEOUT, tentativi=TENTATIVI, backoff=BACKOFF, connessioni=8):
+        self.url = url.rstrip("/")
+        self.modello = modello
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        retry = Retry(total=tentativi, connect=tentativi, read=0, status=tentativi,
+                      backoff_factor=backoff, status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=None, raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=connessioni, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _richiesta(self, prompt, stream, opzioni):
+        corpo = {"model": self.modello, "prompt": prompt, "stream": stream,
+                 "keep_alive": self.keep_alive}
+        if opzioni:
+            corpo["options"] = opzioni
+        risposta = self.session.post(f"{self.url}/api/generate", json=corpo,
+                                     timeout=self.timeout, stream=stream)
+        risposta.raise_for_status()
+        return risposta
+
+    def genera(self, prompt, **opzioni):
+        """Risposta completa del modello a 'prompt'."""
+        return self._richiesta(prompt, False, opzioni).json()["response"].strip()
+
+    def genera_stream(self, prompt, **opzioni):
+        """Generatore dei frammenti di risposta, man mano che il modello li produce (NDJSON)."""
+        with self._richiesta(prompt, True, opzioni) as risposta:
+            for riga in risposta.iter_lines():
+                if not riga:
+                    continue
+                evento = json.loads(riga)
+                if evento.get("error"):
+                    raise RuntimeError(evento["error"])
+                if evento.get("response"):
+                    yield evento["response"]
+                if evento.get("done"):
+                    break
+
+    def precarica(self):
+        """Carica il modello in memoria senza generare testo, così la prima domanda non attende il caricamento."""
+        corpo = {"model": self.modello, "keep_alive": self.keep_alive}
+        self.session.post(f"{self.url}/api/generate", json=corpo, timeout=self.timeout).raise_for_status()
+
+
+_client = None
+_lock = threading.Lock()
+
+
+def client_llm():
+    """Client condiviso dal processo (creato al primo uso)."""
+    global _client
+    with _lock:
+        if _client is None:
+            _client = ClientLLM()
+        return _client
@@ -0,0 +1,89 @@
+# --- commenti_batch.py ---
+# Commenti AI di più bilanci in parallelo (confronto tra aziende/anni): limite di concorrenza,
+# timeout per richiesta, risultati man mano che arrivano.
+
+import asyncio
+
+import pandas as pd
+
+from utils import calcola_kpi, commento_ai
+from analisi_llm import commento_llm
+
+# Richieste contemporanee al modello (Ollama serve in parallelo fino a OLLAMA_NUM_PARALLEL richieste)
+CONCORRENZA = 4
+# Secondi massimi per un singolo commento
+TIMEOUT_COMMENTO = 180
+
+# motore → funzione(dati, kpi_df, rigenera) che restituisce il commento o solleva un errore
+MOTORI = {
+    "auditllm": lambda dati, kpi_df, rigenera: commento_llm(dati, kpi_df, rigenera),
+    "openai": lambda dati, kpi_df, rigenera: commento_ai(dati, rigenera),
+}
+
+
+def _richieste(voci, motore, rigenera):
+    """(nome, funzione senza argomenti) per ogni bilancio; i KPI sono calcolati tutti insieme."""
+    genera = MOTORI[motore]
+    kpi = calcola_kpi(pd.DataFrame.from_dict(voci, orient="index"))
+    richieste = []
+    for nome, dati in voci.items():
+        kpi_df = kpi.loc[nome].rename_axis("KPI").reset_index(name="Valore")
+        richieste.append((nome, lambda d=dati, k=kpi_df: genera(d, k, rigenera)))
+    return richieste
+
+
+async def _commento(nome, genera, semaforo, timeout):
+    """
+    Un commento in un thread, con al più 'semaforo' richieste attive.
+    Ritorna (nome, commento, errore): gli errori non interrompono gli altri commenti.
+    """
+    async with semaforo:
+        try:
+            testo = await asyncio.wait_for(asyncio.to_thread(genera), timeout)
+            return nome, testo, None
+        except asyncio.TimeoutError:
+            return nome, None, f"nessuna risposta entro {timeout:g} s"
+        except Exception as e:
+            return nome, None, str(e)
+
+
+async def commenti_async(voci, motore="auditllm", concorrenza=CONCORRENZA,
+                         timeout=TIMEOUT_COMMENTO, rigenera=False):
+    """
+    Generatore asincrono dei commenti di {nome: dati} nell'ordine in cui vengono completati:
+    (nome, commento, errore), con errore None se il commento è riuscito.
+    Se il generatore viene chiuso o cancellato, le richieste non ancora partite sono annullate.
+    Una richiesta scaduta o annullata mentre è in corso termina comunque nel suo thread
+    (il client HTTP ha il suo timeout) e il commento finisce in cache.
+    """
+    semaforo = asyncio.Semaphore(concorrenza)
+    attivita = [asyncio.ensure_future(_commento(nome, genera, semaforo, timeout))
+                for nome, genera in _richieste(voci, motore, rigenera)]
+    try:
+        for prossima in asyncio.as_completed(attivita):
+            yield await prossima
+    finally:
+        for a in attivita:
+            a.cancel()
+        await asyncio.gather(*attivita, return_exceptions=True)
+
+
+def commenti_stream(voci, motore="auditllm", **opzioni):
+    """Come commenti_async, ma da codice sincrono (es. Streamlit): un normale generatore."""
+    loop = asyncio.new_event_loop()
+    agen = commenti_async(voci, motore, **opzioni)
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(agen.__anext__())
+            except StopAsyncIteration:
+                return
+    finally:
+        loop.run_until_complete(agen.aclose())
+        loop.close()
+
+
+def raccogli_commenti(voci, motore="auditllm", **opzioni):
+    """Tutti i commenti, nell'ordine di 'voci': {nome: (commento, errore)}."""
+    risultati = {nome: (commento, errore) for nome, commento, errore in commenti_stream(voci, motore, **opzioni)}
+    return {nome: risultati[nome] for nome in voci}
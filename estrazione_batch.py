@@ -0,0 +1,219 @@
+# --- estrazione_batch.py ---
+# Estrazione e KPI da riga di comando su cartelle di bilanci, senza Streamlit.
+# Uso: python estrazione_batch.py bilanci/ "archivio/**/*.pdf" -o risultati.jsonl [--workers 8]
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from cache_estrazione import hash_file, json_default
+from utils import calculate_kpis, extract_financial_data
+
+ESTENSIONI = (".pdf", ".xlsx", ".xls", ".xbrl", ".xml", ".xhtml", ".txt", ".md", ".csv")
+# Con output Parquet i record vengono scritti in file parziali (cartella output + ".parti")
+# ogni PARQUET_RECORD_PER_PARTE record o PARQUET_SECONDI_PER_PARTE secondi, e riuniti
+# nell'output a fine elaborazione
+PARQUET_RECORD_PER_PARTE = 20
+PARQUET_SECONDI_PER_PARTE = 30.0
+
+
+def trova_file(sorgenti, estensioni=ESTENSIONI):
+    """File da elaborare: cartelle (visitate ricorsivamente), glob o singoli file, senza duplicati."""
+    trovati = []
+    for sorgente in sorgenti:
+        if os.path.isdir(sorgente):
+            for radice, _, nomi in os.walk(sorgente):
+                trovati.extend(os.path.join(radice, n) for n in sorted(nomi))
+        else:
+            trovati.extend(sorted(glob.glob(sorgente, recursive=True)) or [sorgente])
+    return [f for f in dict.fromkeys(trovati)
+            if os.path.isfile(f) and f.lower().endswith(estensioni)]
+
+
+def _parti_parquet(output):
+    """File parziali Parquet di un'elaborazione in corso o interrotta, in ordine di scrittura."""
+    cartella = output + ".parti"
+    if not os.path.isdir(cartella):
+        return []
+    return sorted(os.path.join(cartella, n) for n in os.listdir(cartella) if n.endswith(".parquet"))
+
+
+def _leggi_parquet(output, columns=None):
+    """Output Parquet più i file parziali non ancora riuniti (None se non c'è nulla)."""
+    percorsi = ([output] if os.path.exists(output) else []) + _parti_parquet(output)
+    tabelle = [pd.read_parquet(p, columns=columns) for p in percorsi]
+    return pd.concat(tabelle, ignore_index=True) if tabelle else None
+
+
+def hash_elaborati(output, riprova_errori=False):
+    """Hash dei file già presenti nell'output (JSONL o Parquet), per riprendere un'elaborazione."""
+    if output.endswith(".parquet"):
+        df = _leggi_parquet(output, ["hash", "errore"])
+        if df is None:
+            return set()
+        if riprova_errori:
+            df = df[df["errore"].isna()]
+        return set(df["hash"])
+    if not os.path.exists(output):
+        return set()
+    elaborati = set()
+    with open(output, "r", encoding="utf-8") as f:
+        for riga in f:
+            try:
+                record = json.loads(riga)
+            except json.JSONDecodeError:
+                # ultima riga troncata da un'interruzione
+                continue
+            if not (riprova_errori and record.get("errore")):
+                elaborati.add(record["hash"])
+    return elaborati
+
+
+def elabora_file(percorso, hash_contenuto, opzioni):
+    """
+    Estrazione e KPI di un file. Ritorna un record con dati, KPI, tempo
+    impiegato ed eventuale errore; le eccezioni non interrompono il batch.
+    """
+    t0 = time.perf_counter()
+    record = {"file": percorso, "hash": hash_contenuto,
+              "formato": os.path.splitext(percorso)[1].lower().lstrip("."),
+              "dati": {}, "kpi": {}, "errore": None}
+    try:
+        data, debug = extract_financial_data(percorso, return_debug=True, **opzioni)
+        record["errore"] = debug.get("errore")
+        record["dati"] = data
+        if not record["errore"]:
+            kpis = calculate_kpis(data)
+            record["kpi"] = dict(zip(kpis["KPI"], kpis["Valore"]))
+    except Exception as e:
+        record["errore"] = f"{type(e).__name__}: {e}"
+    record["tempo_s"] = round(time.perf_counter() - t0, 3)
+    return record
+
+
+def _elabora(lavori, workers, opzioni):
+    """Generatore dei record, nell'ordine in cui vengono completati."""
+    if workers <= 1 or len(lavori) <= 1:
+        for percorso, h in lavori:
+            yield elabora_file(percorso, h, opzioni)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(elabora_file, percorso, h, opzioni) for percorso, h in lavori]
+        for fut in as_completed(futures):
+            yield fut.result()
+
+
+def _scrivi_parte(output, records):
+    """Scrive i record (dati e KPI come colonne) in un nuovo file parziale dell'output Parquet."""
+    cartella = output + ".parti"
+    os.makedirs(cartella, exist_ok=True)
+    percorso = os.path.join(cartella, f"parte-{time.time_ns()}.parquet")
+    tmp = percorso + ".tmp"
+    pd.json_normalize(records).to_parquet(tmp, index=False)
+    os.replace(tmp, percorso)
+
+
+def _riunisci_parquet(output):
+    """
+    Riscrive l'output Parquet con i file parziali e poi li elimina. Se l'eliminazione
+    si interrompe, le righe ripetute vengono tolte alla riunione successiva.
+    """
+    parti = _parti_parquet(output)
+    if not parti:
+        return
+    df = _leggi_parquet(output).drop_duplicates(ignore_index=True)
+    tmp = output + ".tmp"
+    df.to_parquet(tmp, index=False)
+    os.replace(tmp, output)
+    for percorso in parti:
+        os.remove(percorso)
+    try:
+        os.rmdir(output + ".parti")
+    except OSError:
+        pass
+
+
+def esegui_batch(sorgenti, output, workers=None, riprova_errori=False, **opzioni):
+    """
+    Elabora i file di 'sorgenti' su 'workers' processi e scrive un record per file
+    in 'output' (.jsonl o .parquet). I file il cui hash è già nell'output vengono saltati.
+    Con JSONL ogni record è scritto appena pronto, quindi un'interruzione perde al più
+    i file in corso; con Parquet i record vanno in file parziali scritti durante
+    l'elaborazione (si perdono al più gli ultimi PARQUET_RECORD_PER_PARTE record),
+    riuniti nell'output alla fine o alla ripresa dopo un crash.
+    Ritorna un riepilogo con i conteggi.
+    """
+    workers = workers or os.cpu_count() or 1
+    # ogni worker elabora un file alla volta: niente pool OCR annidati
+    opzioni.setdefault("workers", 1)
+
+    fatti = hash_elaborati(output, riprova_errori)
+    lavori = []
+    saltati = 0
+    for percorso in trova_file(sorgenti):
+        h = hash_file(percorso)
+        if h in fatti:
+            saltati += 1
+            continue
+        fatti.add(h)
+        lavori.append((percorso, h))
+
+    riepilogo = {"da_elaborare": len(lavori), "saltati": saltati, "elaborati": 0, "errori": 0}
+    parquet = output.endswith(".parquet")
+    in_attesa = []
+    t0 = ultima_parte = time.perf_counter()
+    f = None if parquet else open(output, "a", encoding="utf-8")
+    try:
+        for record in _elabora(lavori, workers, opzioni):
+            riepilogo["elaborati"] += 1
+            riepilogo["errori"] += bool(record["errore"])
+            if parquet:
+                in_attesa.append(record)
+                if (len(in_attesa) >= PARQUET_RECORD_PER_PARTE
+                        or time.perf_counter() - ultima_parte >= PARQUET_SECONDI_PER_PARTE):
+                    _scrivi_parte(output, in_attesa)
+                    in_attesa = []
+                    ultima_parte = time.perf_counter()
+            else:
+                f.write(json.dumps(record, ensure_ascii=False, default=json_default) + "\n")
+                f.flush()
+            print(f"[{riepilogo['elaborati']}/{len(lavori)}] {record['file']} "
+                  f"{record['tempo_s']:.2f} s{' ERRORE: ' + record['errore'] if record['errore'] else ''}",
+                  file=sys.stderr)
+    finally:
+        if f:
+            f.close()
+        if parquet:
+            if in_attesa:
+                _scrivi_parte(output, in_attesa)
+            _riunisci_parquet(output)
+    riepilogo["tempo_s"] = round(time.perf_counter() - t0, 3)
+    return riepilogo
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Estrazione batch di bilanci (PDF, Excel, XBRL, testo).")
+    parser.add_argument("sorgenti", nargs="+", help="cartelle, glob o file da elaborare")
+    parser.add_argument("-o", "--output", default="risultati_auditflow.jsonl",
+                        help="file di output .jsonl o .parquet")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="processi paralleli (default: numero di CPU)")
+    parser.add_argument("--modalita", choices=["righe", "layout"], default="righe")
+    parser.add_argument("--no-cache", action="store_true", help="non usare la cache delle estrazioni")
+    parser.add_argument("--riprova-errori", action="store_true",
+                        help="rielabora i file che nell'output hanno un errore")
+    args = parser.parse_args(argv)
+
+    riepilogo = esegui_batch(args.sorgenti, args.output, args.workers, args.riprova_errori,
+                             modalita=args.modalita, use_cache=not args.no_cache)
+    print(json.dumps(riepilogo))
+
+
+if __name__ == "__main__":
+    main()
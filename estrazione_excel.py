@@ -0,0 +1,254 @@
+# --- estrazione_excel.py ---
+# Lettura in streaming dei bilanci Excel: voci per riga o per colonna, tutti i periodi.
+
+import re
+import heapq
+from datetime import date, datetime
+
+import pandas as pd
+from openpyxl import load_workbook
+
+from ricerca_termini import AhoCorasick
+from layout_spaziale import valore_parola
+
+ANNO = re.compile(r"\b((?:19|20)\d{2})\b")
+INTESTAZIONE_PERIODO = re.compile(r"anno|esercizio|periodo|data|year|period", re.I)
+# Dopo la prima voce trovata, righe consecutive senza voci oltre le quali si smette di leggere il foglio
+RIGHE_SENZA_VOCI = 500
+# Periodi tenuti in memoria (i più recenti): un foglio per colonne ne ha uno per riga
+MAX_PERIODI = 100
+# Qualità dell'etichetta di una voce: nome della voce, sinonimo, termine contenuto nella cella
+NOME, SINONIMO, CONTENUTO = 0, 1, 2
+
+
+def _anno(cella):
+    """Anno (stringa) di una cella di intestazione: numero, data o testo come '31/12/2024'."""
+    if isinstance(cella, (datetime, date)):
+        return str(cella.year)
+    if isinstance(cella, (int, float)) and not isinstance(cella, bool):
+        if float(cella).is_integer() and 1900 <= cella <= 2100:
+            return str(int(cella))
+        return None
+    if isinstance(cella, str):
+        m = ANNO.search(cella)
+        return m.group(1) if m else None
+    return None
+
+
+def _numero(cella):
+    """Valore numerico di una cella (anche testo in formato italiano), None se non numerica."""
+    if isinstance(cella, bool) or cella is None:
+        return None
+    if isinstance(cella, (int, float)):
+        return None if pd.isna(cella) else float(cella)
+    if isinstance(cella, str) and cella.strip():
+        return valore_parola(cella.strip().replace("€", "").replace(" ", ""))
+    return None
+
+
+def _vuota(riga):
+    return all(c is None or (isinstance(c, str) and not c.strip()) for c in riga)
+
+
+class _Etichette:
+    """
+    Riconosce le voci nelle celle di testo, con la qualità della corrispondenza:
+    la cella uguale al nome della voce (NOME) o a un sinonimo (SINONIMO), altrimenti
+    il termine più lungo contenuto nella cella (CONTENUTO).
+    """
+
+    def __init__(self, voci):
+        self.voci = list(voci)
+        self.termini = {}
+        self.esatti = {}
+        for key, syn in voci.items():
+            self.esatti.setdefault(key.lower(), (key, NOME))
+            for t in [key] + list(syn):
+                self.termini.setdefault(t.lower(), key)
+                self.esatti.setdefault(t.lower(), (key, SINONIMO))
+        self.automa = AhoCorasick(self.termini)
+
+    def voce(self, cella):
+        """(voce, qualità) della cella, None se non contiene nessuna voce."""
+        if not isinstance(cella, str):
+            return None
+        testo = " ".join(cella.lower().split())
+        if testo in self.esatti:
+            return self.esatti[testo]
+        presenti = self.automa.termini_presenti(testo)
+        return (self.termini[max(presenti, key=len)], CONTENUTO) if presenti else None
+
+
+class _Periodi:
+    """
+    Valori letti, periodo → voce → valore. Una voce già letta viene sostituita solo
+    da un'etichetta di qualità migliore (es. "Costi" dopo "Oneri finanziari").
+    Si tengono al più 'massimo' periodi: quelli con l'anno più recente, poi gli
+    altri nell'ordine del file; la memoria non cresce con le righe del foglio.
+    """
+
+    def __init__(self, voci, massimo=MAX_PERIODI):
+        self.voci = voci
+        self.massimo = massimo
+        self.valori = {}      # periodo → voce → (qualità, valore)
+        self.qualita = {}     # voce → migliore qualità letta
+        self.scartati = 0
+        self._heap = []       # (priorità, periodo): in cima il primo da scartare
+        self._ordine = 0
+
+    def aggiungi(self, periodo, voce, valore, qualita):
+        voci = self.valori.get(periodo)
+        if voci is None:
+            self._ordine += 1
+            priorita = (1, int(periodo), 0) if ANNO.fullmatch(periodo) else (0, 0, -self._ordine)
+            if len(self.valori) >= self.massimo:
+                self.scartati += 1
+                if priorita <= self._heap[0][0]:
+                    return
+                _, vecchio = heapq.heapreplace(self._heap, (priorita, periodo))
+                del self.valori[vecchio]
+            else:
+                heapq.heappush(self._heap, (priorita, periodo))
+            voci = self.valori[periodo] = {}
+        if voce not in voci or qualita < voci[voce][0]:
+            voci[voce] = (qualita, valore)
+        if qualita < self.qualita.get(voce, CONTENUTO + 1):
+            self.qualita[voce] = qualita
+
+    def migliore(self, voce, qualita):
+        """True se un'etichetta di questa qualità può cambiare i valori della voce."""
+        return qualita <= self.qualita.get(voce, CONTENUTO + 1)
+
+    def completi(self):
+        """Tutte le voci trovate con il loro nome o un sinonimo: non serve leggere oltre."""
+        return len(self.voci) == sum(1 for q in self.qualita.values() if q <= SINONIMO)
+
+    def tabella(self):
+        """DataFrame periodi × voci: prima i periodi con un anno, dal più recente, poi gli altri."""
+        con_anno = sorted((p for p in self.valori if ANNO.fullmatch(p)), reverse=True)
+        altri = [p for p in self.valori if not ANNO.fullmatch(p)]
+        valori = {p: {v: val for v, (_, val) in voci.items()} for p, voci in self.valori.items()}
+        periodi = pd.DataFrame.from_dict(valori, orient="index", columns=self.voci)
+        return periodi.reindex(con_anno + altri)
+
+
+def _leggi_foglio(nome, righe, etichette, periodi, dettagli):
+    """
+    Legge le righe di un foglio e registra in 'periodi' le voci trovate.
+    Riconosce due orientamenti:
+    - per colonne: una riga di intestazione con almeno due voci, un periodo per riga
+      sotto (colonna 'anno'/'esercizio'/... se presente);
+    - per righe: l'etichetta della voce in una cella e gli importi alla sua destra,
+      con i periodi dalla più recente riga di intestazione con gli anni.
+    Se più celle corrispondono alla stessa voce vale la corrispondenza migliore
+    (nome della voce, poi sinonimo, poi termine contenuto), a parità la prima.
+    Si ferma quando tutte le voci sono state trovate per nome o sinonimo, o dopo
+    RIGHE_SENZA_VOCI righe senza voci.
+    """
+    intestazione = None    # colonna → (voce, qualità) (orientamento per colonne)
+    col_periodo = None
+    anni = {}              # colonna → anno (orientamento per righe)
+    senza_voci = None
+
+    for n, riga in enumerate(righe, 1):
+        dettagli["righe_lette"] += 1
+
+        if intestazione is not None:
+            if _vuota(riga):
+                # fine della tabella
+                intestazione = None
+                if periodi.completi():
+                    return
+                continue
+            if col_periodo is not None and col_periodo < len(riga) and riga[col_periodo] is not None:
+                periodo = _anno(riga[col_periodo]) or str(riga[col_periodo])
+            else:
+                periodo = f"{nome}!{n}"
+            for col, (voce, qualita) in intestazione.items():
+                v = _numero(riga[col]) if col < len(riga) else None
+                if v is not None:
+                    periodi.aggiungi(periodo, voce, v, qualita)
+            continue
+
+        migliori = {}          # voce → (qualità, colonna)
+        for col, cella in enumerate(riga):
+            trovata = etichette.voce(cella)
+            if trovata and (trovata[0] not in migliori or trovata[1] < migliori[trovata[0]][0]):
+                migliori[trovata[0]] = (trovata[1], col)
+        trovate_riga = {col: (voce, qualita) for voce, (qualita, col) in migliori.items()}
+
+        if len(trovate_riga) >= 2:
+            intestazione = {col: vq for col, vq in trovate_riga.items() if periodi.migliore(*vq)}
+            col_periodo = next((c for c, cella in enumerate(riga) if c not in trovate_riga
+                                and isinstance(cella, str) and INTESTAZIONE_PERIODO.search(cella)), None)
+            dettagli["orientamento"][nome] = "colonne"
+            senza_voci = 0
+            continue
+
+        if len(trovate_riga) == 1:
+            (col, (voce, qualita)), = trovate_riga.items()
+            importi = [(c, _numero(riga[c])) for c in range(col + 1, len(riga))]
+            importi = [(c, v) for c, v in importi if v is not None]
+            if anni:
+                # solo le colonne con un anno in intestazione (non le note)
+                importi = [(anni[c], v) for c, v in importi if c in anni]
+            else:
+                importi = [(nome, v) for _, v in importi[:1]]
+            if importi:
+                for periodo, v in importi:
+                    periodi.aggiungi(periodo, voce, v, qualita)
+                dettagli["orientamento"][nome] = "righe"
+                senza_voci = 0
+                if periodi.completi():
+                    return
+                continue
+
+        if not trovate_riga:
+            riga_anni = {c: a for c, a in ((c, _anno(cella)) for c, cella in enumerate(riga)) if a}
+            piene = sum(not _vuota([c]) for c in riga)
+            if riga_anni and len(riga_anni) * 2 >= piene:
+                anni = riga_anni
+
+        if senza_voci is not None:
+            senza_voci += 1
+            if senza_voci > RIGHE_SENZA_VOCI:
+                return
+
+
+def _fogli_xls(file_path):
+    """Righe dei fogli di un .xls (formato binario, non leggibile da openpyxl)."""
+    for nome, df in pd.read_excel(file_path, sheet_name=None, header=None).items():
+        df = df.astype(object).where(df.notna(), None)
+        yield nome, df.itertuples(index=False, name=None)
+
+
+def leggi_excel(file_path, voci):
+    """
+    Voci di bilancio da una cartella Excel, per tutti i periodi trovati.
+    I fogli .xlsx sono letti in sola lettura, riga per riga, senza caricare la cartella
+    in memoria; la lettura si ferma appena tutte le voci sono state trovate.
+    Ritorna (DataFrame periodi × voci, dettagli). I periodi con un anno sono in ordine
+    dal più recente; gli altri seguono nell'ordine del file. Si tengono al più
+    MAX_PERIODI periodi (i più recenti); gli altri sono contati in dettagli["periodi_scartati"].
+    """
+    etichette = _Etichette(voci)
+    periodi = _Periodi(etichette.voci)
+    dettagli = {"righe_lette": 0, "orientamento": {}}
+
+    if file_path.lower().endswith(".xls"):
+        for nome, righe in _fogli_xls(file_path):
+            _leggi_foglio(nome, righe, etichette, periodi, dettagli)
+            if periodi.completi():
+                break
+    else:
+        wb = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            for ws in wb.worksheets:
+                _leggi_foglio(ws.title, ws.iter_rows(values_only=True), etichette, periodi, dettagli)
+                if periodi.completi():
+                    break
+        finally:
+            wb.close()
+
+    dettagli["periodi_scartati"] = periodi.scartati
+    return periodi.tabella(), dettagli
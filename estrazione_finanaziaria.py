@@ -1,9 +1,12 @@
-import pdfplumber
 import re
 import json
+import sys
+
+import fitz                      # PyMuPDF per lettura PDF
+
+from layout_spaziale import ANNO_PAROLA, NUMERO_PAROLA, valore_parola
 
 # === CONFIGURAZIONE ===
-pdf_path = "Stellantis_NV_2024.pdf"  # rinomina il file PDF al momento del caricamento
 output_json = "dati_auditflow_2024.json"
 
 # === VOCI TARGET DA ESTRARRE ===
@@ -20,6 +23,58 @@ target_keywords = [
     "Revenues"
 ]
 
+# === PARAMETRI DI LAYOUT ===
+# Parole nella stessa riga: centri verticali entro questa frazione dell'altezza della parola
+TOLLERANZA_RIGA = 0.5
+# Nuova cella quando lo spazio orizzontale tra due parole supera questa frazione dell'altezza
+SPAZIO_CELLA = 0.8
+
+# === RICOSTRUZIONE RIGHE E CELLE DALLE PAROLE ===
+def raggruppa_righe(parole):
+    """
+    Raggruppa le parole di page.get_text("words") in righe (dall'alto in basso)
+    e ogni riga in celle (da sinistra a destra). Ritorna una lista di righe,
+    ognuna lista di stringhe (celle). È l'unico layout della pagina: da qui
+    derivano sia il testo per lo scoring sia le righe delle tabelle.
+    """
+    parole = sorted(parole, key=lambda w: ((w[1] + w[3]) / 2, w[0]))
+    righe = []
+    corrente = []
+    centro = None
+    for w in parole:
+        yc = (w[1] + w[3]) / 2
+        h = max(w[3] - w[1], 1.0)
+        if corrente and abs(yc - centro) > TOLLERANZA_RIGA * h:
+            righe.append(corrente)
+            corrente = []
+        if not corrente:
+            centro = yc
+        corrente.append(w)
+    if corrente:
+        righe.append(corrente)
+
+    risultato = []
+    for riga in righe:
+        riga.sort(key=lambda w: w[0])
+        celle = [[riga[0][4]]]
+        for prec, w in zip(riga, riga[1:]):
+            h = max(w[3] - w[1], 1.0)
+            if w[0] - prec[2] > SPAZIO_CELLA * h:
+                celle.append([w[4]])
+            else:
+                celle[-1].append(w[4])
+        risultato.append([" ".join(c) for c in celle])
+    return risultato
+
+def testo_da_righe(righe):
+    """Testo della pagina: una riga per riga di layout, celle separate da tabulazione."""
+    return "\n".join("\t".join(celle) for celle in righe)
+
+def righe_tabella(righe):
+    """Righe che hanno l'aspetto di righe di tabella: almeno due celle, di cui una numerica."""
+    return [celle for celle in righe
+            if len(celle) >= 2 and any(re.search(r"\d", c) for c in celle[1:])]
+
 # === FUNZIONE PER MATCHING FUZZY DELLE VOCI ===
 def matches_target(row, keywords):
     row_text = " ".join([cell for cell in row if cell])
@@ -28,47 +83,90 @@ def matches_target(row, keywords):
             return key
     return None
 
-# === FUNZIONE PER ESTRARRE IL PRIMO NUMERO PLAUSIBILE (>=1000) ===
-def extract_better_value_from_row(row):
-    numeric_values = []
-    for cell in reversed(row):
-        if cell:
-            match = re.search(r"[\d.,]+", cell)
-            if match:
-                raw_number = match.group().replace(",", "").replace(".", "")
-                try:
-                    value = int(raw_number)
-                    if value >= 1000:
-                        numeric_values.append(value)
-                except ValueError:
-                    continue
-    return numeric_values[0] if numeric_values else None
-
-# === ESTRAZIONE DAL PDF ===
-extracted_candidates = {}
-final_data_cleaned = {}
-
-with pdfplumber.open(pdf_path) as pdf:
-    for page in pdf.pages:
-        tables = page.extract_tables()
-        for table in tables:
-            for row in table:
-                match = matches_target(row, target_keywords)
-                if match:
-                    if match not in extracted_candidates:
-                        extracted_candidates[match] = []
-                    extracted_candidates[match].append(row)
-
-# === SELEZIONE DEI VALORI CORRETTI ===
-for key, rows in extracted_candidates.items():
-    for row in rows:
-        val = extract_better_value_from_row(row)
-        if val:
-            final_data_cleaned[key] = val
-            break
-
-# === SALVATAGGIO SU JSON ===
-with open(output_json, "w") as f:
-    json.dump(final_data_cleaned, f, indent=2)
-
-print("Estrazione completata. Dati salvati in:", output_json)
+# === IMPORTI E INTESTAZIONI DI COLONNA ===
+def importo_cella(cell):
+    """Importo di una cella che contiene solo un numero (decimali e segno inclusi), altrimenti None."""
+    testo = (cell or "").replace("€", "").replace(" ", "")
+    if not NUMERO_PAROLA.match(testo) or ANNO_PAROLA.match(testo):
+        return None
+    return valore_parola(testo)
+
+def anni_intestazione(row):
+    """
+    Anni delle colonne se la riga è un'intestazione di tabella (celle numeriche
+    tutte anni, es. "2024 | 2023" o "31.12.2024 | 31.12.2023"), altrimenti None.
+    """
+    anni = []
+    for cell in row:
+        m = ANNO_PAROLA.match((cell or "").strip())
+        if m:
+            anni.append(int(m.group(1)))
+        elif re.search(r"\d", cell or ""):
+            return None
+    return anni or None
+
+# === FUNZIONE PER ESTRARRE IL VALORE DELL'ESERCIZIO CORRENTE ===
+def extract_better_value_from_row(row, anni=None):
+    """
+    Importo dell'esercizio corrente nella riga. Con gli anni dell'intestazione le
+    colonne di importi sono allineate a destra con quelle degli anni e vale la
+    colonna dell'anno più recente; senza intestazione, il primo importo plausibile
+    (in valore assoluto >= 1000) da sinistra.
+    """
+    importi = [v for v in (importo_cella(c) for c in row) if v is not None]
+    if not importi:
+        return None
+    if anni and len(importi) >= len(anni):
+        return importi[len(importi) - len(anni) + anni.index(max(anni))]
+    plausibili = [v for v in importi if abs(v) >= 1000]
+    return plausibili[0] if plausibili else None
+
+# === ESTRAZIONE DALLE TABELLE ===
+def estrai_valori_tabelle(righe_pagine, voci=None, numeri_pagina=None):
+    """
+    Cerca le voci nelle righe di tabella delle pagine già analizzate.
+    'righe_pagine' è una lista (una per pagina) di righe come da raggruppa_righe();
+    'voci' associa a ogni chiave i termini da cercare (default: target_keywords).
+    Il valore è quello della colonna dell'esercizio corrente secondo l'ultima
+    intestazione con gli anni incontrata nella pagina.
+    Ritorna chiave → {"valore", "riga", "pagina"} per la prima riga con un valore.
+    """
+    if voci is None:
+        voci = {k: [k] for k in target_keywords}
+    if numeri_pagina is None:
+        numeri_pagina = range(1, len(righe_pagine) + 1)
+    termini = {t: key for key, terms in voci.items() for t in terms}
+
+    final_data_cleaned = {}
+    for n, righe in zip(numeri_pagina, righe_pagine):
+        anni = None
+        for row in righe_tabella(righe or []):
+            intestazione = anni_intestazione(row)
+            if intestazione:
+                anni = intestazione
+                continue
+            match = matches_target(row, termini)
+            if not match or termini[match] in final_data_cleaned:
+                continue
+            val = extract_better_value_from_row(row, anni)
+            if val is not None:
+                final_data_cleaned[termini[match]] = {"valore": val, "riga": " | ".join(row), "pagina": n}
+    return final_data_cleaned
+
+# === ESTRAZIONE DA RIGA DI COMANDO ===
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.exit("Uso: python estrazione_finanaziaria.py file.pdf [output.json]")
+    pdf_path = sys.argv[1]
+    if len(sys.argv) > 2:
+        output_json = sys.argv[2]
+
+    with fitz.open(pdf_path) as doc:
+        righe_pagine = [raggruppa_righe(page.get_text("words")) for page in doc]
+    final_data_cleaned = {k: v["valore"] for k, v in estrai_valori_tabelle(righe_pagine).items()}
+
+    # === SALVATAGGIO SU JSON ===
+    with open(output_json, "w") as f:
+        json.dump(final_data_cleaned, f, indent=2)
+
+    print("Estrazione completata. Dati salvati in:", output_json)
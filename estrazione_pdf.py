@@ -0,0 +1,138 @@
+# --- estrazione_pdf.py ---
+# Estrazione del testo dalle pagine PDF (PyMuPDF + OCR) su un pool di processi.
+
+import os
+import io
+import time
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz                      # PyMuPDF per lettura PDF
+
+from cache_estrazione import CacheEstrazione
+from estrazione_finanaziaria import raggruppa_righe, testo_da_righe
+
+# Supporto OCR
+OCR_AVAILABLE = False
+try:
+    import pytesseract
+    from PIL import Image
+    OCR_AVAILABLE = True
+except ImportError:
+    pass
+
+# Parametri OCR (72 dpi è la risoluzione di default di page.get_pixmap())
+OCR_DPI = 72
+OCR_LANG = "ita"
+# Risoluzione delle anteprime usate per localizzare le pagine dei prospetti: sotto i
+# 100 dpi tesseract non riconosce più il testo. Le anteprime a risoluzione non
+# inferiore a quella dell'OCR completo valgono già come OCR completo
+OCR_DPI_ANTEPRIMA = 100
+OCR_CACHE_DIR = os.path.join(".auditflow_cache", "ocr")
+OCR_CACHE_MAX_BYTES = 100 * 1024 * 1024
+OCR_CACHE_MAX_VOCI = 20000
+# Dopo questo tempo (secondi) l'OCR di una pagina viene ripetuto
+OCR_CACHE_TTL = 30 * 24 * 3600
+
+# Sotto questo numero di pagine da OCR il costo di avvio del pool non conviene
+PAGINE_MIN_PARALLELO = 4
+# Intervalli di pagine per worker: più intervalli piccoli bilanciano meglio il carico
+INTERVALLI_PER_WORKER = 4
+
+
+def ocr_pagina(page, dpi=OCR_DPI, lang=OCR_LANG, cache_dir=OCR_CACHE_DIR):
+    """
+    OCR di una pagina PyMuPDF. Il testo viene salvato su disco con chiave
+    l'hash dell'immagine renderizzata (più la lingua), così una nuova
+    elaborazione dello stesso documento non ripete l'OCR. La cache ha la
+    stessa eviction LRU di CacheEstrazione più una scadenza (OCR_CACHE_TTL).
+    """
+    pix = page.get_pixmap(dpi=dpi)
+    png = pix.tobytes()
+    chiave = hashlib.sha256(png + lang.encode()).hexdigest()
+    cache = CacheEstrazione(cache_dir, OCR_CACHE_MAX_BYTES, OCR_CACHE_MAX_VOCI) if cache_dir else None
+
+    if cache:
+        try:
+            voce = cache.leggi(chiave)
+        except OSError:
+            voce = None
+        if voce is not None and time.time() - voce.get("creato", 0) <= OCR_CACHE_TTL:
+            return voce["testo"]
+
+    testo = pytesseract.image_to_string(Image.open(io.BytesIO(png)), lang=lang)
+
+    if cache:
+        try:
+            cache.scrivi(chiave, {"creato": time.time(), "testo": testo})
+        except OSError:
+            pass
+    return testo
+
+
+def parole_pagine(file_path, indici=None):
+    """
+    Parole del text layer con le coordinate, come da page.get_text("words"), delle
+    pagine 'indici' (default: tutte). Le pagine vengono prodotte una alla volta:
+    chi le consuma decide cosa tenere in memoria.
+    """
+    with fitz.open(file_path) as doc:
+        for n in range(len(doc)) if indici is None else indici:
+            yield doc[n].get_text("words")
+
+
+def layout_pagine(file_path):
+    """Per ogni pagina le righe (liste di celle) ricostruite dalle coordinate delle parole."""
+    return [raggruppa_righe(parole) for parole in parole_pagine(file_path)]
+
+
+def testo_pagine(file_path):
+    """Testo nativo (text layer) di ogni pagina; è veloce e non usa l'OCR."""
+    return [testo_da_righe(raggruppa_righe(parole)) for parole in parole_pagine(file_path)]
+
+
+def _ocr_intervallo(file_path, indici, ocr_dpi, ocr_lang, ocr_cache_dir):
+    """OCR delle pagine 'indici': ogni worker apre il proprio documento."""
+    with fitz.open(file_path) as doc:
+        return [ocr_pagina(doc[n], ocr_dpi, ocr_lang, ocr_cache_dir) for n in indici]
+
+
+def ocr_pagine(file_path, indici, workers=None, ocr_dpi=OCR_DPI, ocr_lang=OCR_LANG,
+               ocr_cache_dir=OCR_CACHE_DIR):
+    """
+    OCR delle pagine 'indici' (in ordine), distribuite a intervalli contigui
+    su 'workers' processi (default: numero di CPU).
+    """
+    indici = list(indici)
+    workers = min(workers or os.cpu_count() or 1, len(indici))
+    if workers <= 1 or len(indici) < PAGINE_MIN_PARALLELO:
+        return _ocr_intervallo(file_path, indici, ocr_dpi, ocr_lang, ocr_cache_dir)
+
+    n_intervalli = min(len(indici), workers * INTERVALLI_PER_WORKER)
+    confini = [round(i * len(indici) / n_intervalli) for i in range(n_intervalli + 1)]
+
+    testi = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_ocr_intervallo, file_path, indici[inizio:fine],
+                               ocr_dpi, ocr_lang, ocr_cache_dir)
+                   for inizio, fine in zip(confini[:-1], confini[1:])]
+        for fut in futures:
+            testi.extend(fut.result())
+    return testi
+
+
+def estrai_testi_pdf(file_path, workers=None, ocr_dpi=OCR_DPI, ocr_lang=OCR_LANG,
+                     ocr_cache_dir=OCR_CACHE_DIR):
+    """
+    Restituisce la lista dei testi delle pagine, in ordine.
+    Il text layer viene letto nel processo corrente; le pagine senza testo
+    passano all'OCR, eseguito in parallelo da 'workers' processi.
+    """
+    testi = testo_pagine(file_path)
+    if OCR_AVAILABLE:
+        da_ocr = [n for n, t in enumerate(testi) if not t]
+        if da_ocr:
+            ocr = ocr_pagine(file_path, da_ocr, workers, ocr_dpi, ocr_lang, ocr_cache_dir)
+            for n, testo in zip(da_ocr, ocr):
+                testi[n] = testo
+    return testi
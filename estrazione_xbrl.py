@@ -0,0 +1,176 @@
+# --- estrazione_xbrl.py ---
+# Lettura in streaming dei fatti XBRL / iXBRL e mappatura dei concetti sulle voci di bilancio.
+
+import xml.etree.ElementTree as ET
+
+# Concetti della tassonomia (nome locale, senza prefisso) per ogni voce di keywords_map,
+# in ordine di preferenza: itcc-ci (bilancio civilistico italiano) e ifrs-full.
+CONCETTI_XBRL = {
+    "Ricavi": ["ValoreProduzioneRicaviVenditePrestazioni", "RicaviVenditePrestazioni",
+               "Revenue", "RevenueFromContractsWithCustomers"],
+    "Costi": ["CostiProduzione", "TotaleCostiProduzione", "OperatingExpense", "CostOfSales"],
+    "Utile Netto": ["UtilePerditaEsercizio", "ProfitLoss", "ProfitLossAttributableToOwnersOfParent"],
+    "EBITDA": [],
+    "EBIT": ["DifferenzaValoreCostiProduzione", "ProfitLossFromOperatingActivities"],
+    "Cash Flow Operativo": ["FlussoFinanziarioAttivitaOperativa",
+                            "CashFlowsFromUsedInOperatingActivities"],
+
+    "Totale Attivo": ["TotaleAttivo", "Assets"],
+    "Attivo Corrente": ["TotaleAttivoCircolante", "AttivoCircolante", "CurrentAssets"],
+    "Patrimonio Netto": ["TotalePatrimonioNetto", "PatrimonioNetto", "Equity"],
+    "Debiti a Breve": ["DebitiEsigibiliEntroEsercizioSuccessivo", "DebitiEsigibiliEntroEsercizio",
+                       "CurrentLiabilities"],
+    "Debiti a Lungo": ["DebitiEsigibiliOltreEsercizioSuccessivo", "DebitiEsigibiliOltreEsercizio",
+                       "NoncurrentLiabilities"],
+    "Cash Equivalents": ["TotaleDisponibilitaLiquide", "DisponibilitaLiquide",
+                         "CashAndCashEquivalents"],
+}
+
+XSI_NIL = "{http://www.w3.org/2001/XMLSchema-instance}nil"
+
+
+def _locale(nome):
+    """Nome locale di un tag '{uri}nome' o di un QName 'prefisso:nome'."""
+    return nome.rsplit("}", 1)[-1].rsplit(":", 1)[-1]
+
+
+def valore_ixbrl(testo, formato="", scala=None, segno=None):
+    """
+    Valore numerico di un ix:nonFraction: testo formattato secondo 'formato'
+    (trasformazioni ixt), moltiplicato per 10**scala e con il segno esplicito.
+    """
+    formato = _locale(formato or "").lower()
+    testo = testo.strip()
+    if "zero" in formato or "dash" in formato or testo in ("", "-", "—", "–"):
+        val = 0.0
+    else:
+        if "comma" in formato:
+            # 1.234.567,89
+            testo = testo.replace(".", "").replace(" ", "").replace("\xa0", "").replace(",", ".")
+        else:
+            # 1,234,567.89
+            testo = testo.replace(",", "").replace(" ", "").replace("\xa0", "")
+        val = float(testo)
+    if scala:
+        val *= 10 ** int(scala)
+    return -val if segno == "-" else val
+
+
+def fatti_xbrl(file_path, concetti):
+    """
+    Generatore dei fatti numerici di un'istanza XBRL o di un documento iXBRL
+    i cui concetti (nome locale) sono in 'concetti'. Ogni fatto è un dizionario
+    {"concetto", "valore", "contesto", "periodo", "dimensioni"}; periodo e
+    dimensioni vengono dal contesto, risolto anche se dichiarato dopo il fatto.
+
+    Il file viene letto con iterparse: gli elementi già elaborati sono rimossi
+    dall'albero, quindi la memoria non cresce con la dimensione del documento.
+    """
+    contesti = {}
+    in_attesa = []   # fatti il cui contesto non è ancora stato letto
+    aperti = []      # pila degli elementi aperti, per staccare dal padre quelli chiusi
+    protetti = 0     # elementi aperti di cui serve il contenuto (contesti e fatti)
+
+    def _completa(fatto):
+        periodo, dimensioni = contesti[fatto["contesto"]]
+        fatto["periodo"], fatto["dimensioni"] = periodo, dimensioni
+        return fatto
+
+    def _valore(elem):
+        if elem.get(XSI_NIL) == "true":
+            return None
+        testo = "".join(elem.itertext())
+        try:
+            if _locale(elem.tag) == "nonFraction":
+                return valore_ixbrl(testo, elem.get("format"), elem.get("scale"), elem.get("sign"))
+            return float(testo.strip())
+        except ValueError:
+            return None
+
+    def _interessa(elem):
+        tag = _locale(elem.tag)
+        if tag == "context":
+            return True
+        ctx = elem.get("contextRef")
+        if ctx is None:
+            return False
+        concetto = _locale(elem.get("name", "")) if tag == "nonFraction" else tag
+        return concetto in concetti
+
+    for evento, elem in ET.iterparse(file_path, events=("start", "end")):
+        if evento == "start":
+            aperti.append(elem)
+            if _interessa(elem):
+                protetti += 1
+            continue
+
+        aperti.pop()
+        if _interessa(elem):
+            protetti -= 1
+            tag = _locale(elem.tag)
+            if tag == "context":
+                fine = None
+                dimensioni = False
+                for figlio in elem.iter():
+                    nome = _locale(figlio.tag)
+                    if nome in ("instant", "endDate"):
+                        fine = (figlio.text or "").strip()
+                    elif nome in ("segment", "scenario"):
+                        dimensioni = True
+                contesti[elem.get("id")] = (fine, dimensioni)
+                ancora = []
+                for fatto in in_attesa:
+                    if fatto["contesto"] in contesti:
+                        yield _completa(fatto)
+                    else:
+                        ancora.append(fatto)
+                in_attesa = ancora
+            else:
+                concetto = _locale(elem.get("name", "")) if tag == "nonFraction" else tag
+                fatto = {"concetto": concetto, "valore": _valore(elem),
+                         "contesto": elem.get("contextRef"), "periodo": None, "dimensioni": False}
+                if fatto["valore"] is not None:
+                    if fatto["contesto"] in contesti:
+                        yield _completa(fatto)
+                    else:
+                        in_attesa.append(fatto)
+
+        if not protetti:
+            elem.clear()
+            if aperti:
+                aperti[-1].remove(elem)
+
+    # fatti con un contesto mai dichiarato: periodo sconosciuto
+    yield from in_attesa
+
+
+def estrai_valori_xbrl(file_path, concetti_voci=None):
+    """
+    Valori delle voci da un file XBRL/iXBRL. Per ogni voce si sceglie il fatto
+    senza dimensioni (totale dell'entità) del periodo più recente; a parità di
+    periodo vale l'ordine dei concetti in 'concetti_voci' (default: CONCETTI_XBRL).
+    Ritorna (data, dettagli): dettagli ha il numero di fatti letti ("fatti_letti")
+    e per ogni voce trovata {"concetto", "contesto", "periodo", "valore"} ("voci").
+    """
+    if concetti_voci is None:
+        concetti_voci = CONCETTI_XBRL
+    priorita = {}
+    for voce, nomi in concetti_voci.items():
+        for i, nome in enumerate(nomi):
+            priorita.setdefault(nome, []).append((voce, i))
+
+    migliori = {}
+    letti = 0
+    for fatto in fatti_xbrl(file_path, priorita):
+        letti += 1
+        for voce, i in priorita[fatto["concetto"]]:
+            chiave = (not fatto["dimensioni"], fatto["periodo"] or "", -i)
+            if voce not in migliori or chiave > migliori[voce][0]:
+                migliori[voce] = (chiave, fatto)
+
+    data = {voce: 0.0 for voce in concetti_voci}
+    dettagli = {}
+    for voce, (_, fatto) in migliori.items():
+        data[voce] = fatto["valore"]
+        dettagli[voce] = {k: fatto[k] for k in ("concetto", "contesto", "periodo", "valore")}
+    return data, {"fatti_letti": letti, "voci": dettagli}
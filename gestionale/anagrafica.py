@@ -3,6 +3,8 @@
 import json
 from dataclasses import dataclass, asdict
 
+from gestionale.archivio import RegistroSQLite, Tabella, condizioni, contiene
+
 @dataclass
 class AnagraficaVoce:
     codice: str
@@ -46,3 +48,44 @@ class RegistroAnagrafica:
                     self.aggiungi_voce(AnagraficaVoce(**voce))
         except FileNotFoundError:
             pass
+
+
+TABELLA_ANAGRAFICA = Tabella(
+    "anagrafica",
+    {"codice": "TEXT", "ragione_sociale": "TEXT", "tipo": "TEXT", "indirizzo": "TEXT", "partita_iva": "TEXT",
+     "email": "TEXT"},
+    indici=(("codice",), ("tipo",), ("partita_iva",)),
+)
+# Campi in cui cerca() cerca il testo
+CAMPI_RICERCA = ("codice", "ragione_sociale", "partita_iva", "email")
+
+
+class RegistroAnagraficaSQLite(RegistroSQLite):
+    """RegistroAnagrafica sull'archivio SQLite condiviso: modifiche e rimozioni sono scritte subito."""
+    schema = TABELLA_ANAGRAFICA
+    classe = AnagraficaVoce
+
+    def aggiungi_voce(self, voce: AnagraficaVoce):
+        self._aggiungi([voce])
+
+    def cerca_voce(self, codice: str):
+        voci = self._voci(*condizioni(codice=codice), limite=1)
+        return voci[0] if voci else None
+
+    def rimuovi_voce(self, codice: str):
+        self.archivio.esegui("DELETE FROM anagrafica WHERE codice = ?", (codice,))
+
+    def aggiorna_voce(self, codice: str, voce: AnagraficaVoce):
+        """Sostituisce con 'voce' i campi della voce con 'codice' (anche il codice stesso)."""
+        colonne = list(self.schema.colonne)
+        self.archivio.esegui(f"UPDATE anagrafica SET {', '.join(c + ' = ?' for c in colonne)} WHERE codice = ?",
+                             (*(getattr(voce, c) for c in colonne), codice))
+
+    def cerca(self, testo="", tipo=None):
+        """Voci del 'tipo' (None = tutti) con 'testo' in codice, ragione sociale, partita IVA o email."""
+        dove, parametri = condizioni(**({"tipo": tipo} if tipo else {}))
+        if testo:
+            ricerca, altri = contiene(CAMPI_RICERCA, testo)
+            dove += (" AND " if dove else " WHERE ") + ricerca
+            parametri += altri
+        return self._voci(dove, parametri)
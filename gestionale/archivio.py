@@ -0,0 +1,247 @@
+# --- gestionale/archivio.py ---
+# Archivio SQLite (modalità WAL) condiviso dai registri del gestionale.
+
+import json
+import os
+import sqlite3
+import threading
+from dataclasses import dataclass
+
+import pandas as pd
+
+from gestionale.giornale import Giornale
+from gestionale.indici import chiave_data
+
+DB_FILE = "gestionale.db"
+# Attesa massima (s) quando un'altra sessione sta scrivendo
+TIMEOUT_BLOCCO = 30.0
+# Istruzioni compilate tenute in cache da ogni connessione
+ISTRUZIONI_IN_CACHE = 256
+# Cache delle pagine per connessione (KiB): gli indici restano in memoria durante gli inserimenti a blocchi
+CACHE_KB = 64 * 1024
+
+
+@dataclass(frozen=True)
+class Tabella:
+    """
+    Schema di una tabella: colonne (nome → tipo SQL), indici (tuple di colonne) e
+    altre istruzioni da eseguire dopo la creazione (es. trigger di tabelle riassuntive).
+    """
+    nome: str
+    colonne: dict
+    indici: tuple = ()
+    altre: tuple = ()
+
+    def crea(self):
+        colonne = ", ".join(f"{c} {tipo}" for c, tipo in self.colonne.items())
+        istruzioni = [f"CREATE TABLE IF NOT EXISTS {self.nome} (id INTEGER PRIMARY KEY, {colonne})"]
+        for indice in self.indici:
+            istruzioni.append(f"CREATE INDEX IF NOT EXISTS {self.nome}_{'_'.join(indice)} "
+                              f"ON {self.nome} ({', '.join(indice)})")
+        return istruzioni + list(self.altre)
+
+
+def condizioni(dal=None, al=None, **criteri):
+    """
+    Clausola WHERE e parametri: colonne uguali ai valori di 'criteri' e colonna
+    data tra 'dal' e 'al' inclusi (date "YYYY-MM-DD", confrontabili come testo).
+    """
+    parti = [f"{c} = ?" for c in criteri]
+    parametri = list(criteri.values())
+    if dal is not None:
+        parti.append("data >= ?")
+        parametri.append(chiave_data(dal))
+    if al is not None:
+        parti.append("data <= ?")
+        parametri.append(chiave_data(al))
+    if not parti:
+        return "", ()
+    return " WHERE " + " AND ".join(parti), tuple(parametri)
+
+
+def contiene(colonne, testo):
+    """
+    Condizione (con i parametri) vera se 'testo' compare in almeno una delle colonne,
+    senza distinzione di maiuscole (LIKE); % e _ del testo sono presi alla lettera.
+    """
+    testo = testo.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    sql = " OR ".join(f"CAST({c} AS TEXT) LIKE ? ESCAPE '\\'" for c in colonne)
+    return f"({sql})", (f"%{testo}%",) * len(colonne)
+
+
+class ArchivioSQLite:
+    """
+    Database SQLite locale in modalità WAL: una sessione può scrivere mentre le
+    altre leggono. Ogni thread ha la sua connessione (Streamlit esegue ogni
+    sessione in un thread); le query sono parametrizzate con SQL fisso, quindi
+    compilate una volta e riusate dalla cache delle istruzioni di sqlite3.
+    """
+
+    def __init__(self, percorso=DB_FILE):
+        self.percorso = percorso
+        self._locale = threading.local()
+        self._create = set()
+        self._lock = threading.Lock()
+
+    def connessione(self) -> sqlite3.Connection:
+        conn = getattr(self._locale, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.percorso, timeout=TIMEOUT_BLOCCO, cached_statements=ISTRUZIONI_IN_CACHE)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            # con il WAL, NORMAL non perde transazioni confermate se si blocca il processo
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA cache_size=-{CACHE_KB}")
+            self._locale.conn = conn
+        return conn
+
+    def crea(self, tabella: Tabella):
+        """Crea tabella e indici se non esistono (una volta per processo)."""
+        with self._lock:
+            if tabella.nome in self._create:
+                return
+            conn = self.connessione()
+            with conn:
+                conn.execute("CREATE TABLE IF NOT EXISTS importazioni "
+                             "(tabella TEXT, origine TEXT, PRIMARY KEY (tabella, origine))")
+                for istruzione in tabella.crea():
+                    conn.execute(istruzione)
+            self._create.add(tabella.nome)
+
+    def sql_inserimento(self, tabella: Tabella):
+        """INSERT parametrizzata con le colonne della tabella, nell'ordine dello schema."""
+        colonne = list(tabella.colonne)
+        return f"INSERT INTO {tabella.nome} ({', '.join(colonne)}) VALUES ({', '.join('?' * len(colonne))})"
+
+    def inserisci(self, tabella: Tabella, righe):
+        """Inserisce le righe (dizionari con le colonne della tabella) in una transazione, con executemany."""
+        sql, colonne = self.sql_inserimento(tabella), list(tabella.colonne)
+        conn = self.connessione()
+        with conn:
+            cur = conn.executemany(sql, ([r[c] for c in colonne] for r in righe))
+        return max(cur.rowcount, 0)
+
+    def importato(self, tabella: Tabella, origine):
+        return self.valore("SELECT EXISTS (SELECT 1 FROM importazioni WHERE tabella = ? AND origine = ?)",
+                           (tabella.nome, origine)) == 1
+
+    def importa(self, tabella: Tabella, righe, origine):
+        """
+        Come inserisci, ma una sola volta per 'origine' (es. il file da cui vengono le righe):
+        l'importazione è registrata nella stessa transazione. Ritorna le righe inserite.
+        """
+        sql, colonne = self.sql_inserimento(tabella), list(tabella.colonne)
+        conn = self.connessione()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            if conn.execute("SELECT 1 FROM importazioni WHERE tabella = ? AND origine = ?",
+                            (tabella.nome, origine)).fetchone():
+                return 0
+            cur = conn.executemany(sql, ([r[c] for c in colonne] for r in righe))
+            conn.execute("INSERT INTO importazioni (tabella, origine) VALUES (?, ?)", (tabella.nome, origine))
+        return max(cur.rowcount, 0)
+
+    def esegui(self, sql, parametri=()):
+        """Istruzione di modifica in una transazione; ritorna le righe toccate."""
+        conn = self.connessione()
+        with conn:
+            return conn.execute(sql, parametri).rowcount
+
+    def righe(self, sql, parametri=()):
+        """Risultato di una query come lista di dizionari."""
+        return [dict(r) for r in self.connessione().execute(sql, parametri)]
+
+    def valore(self, sql, parametri=()):
+        """Primo valore della prima riga (None se la query non dà righe)."""
+        riga = self.connessione().execute(sql, parametri).fetchone()
+        return None if riga is None else riga[0]
+
+    def tabella(self, sql, parametri=()) -> pd.DataFrame:
+        """Risultato di una query come DataFrame, senza passare da oggetti Python per riga."""
+        return pd.read_sql_query(sql, self.connessione(), params=parametri)
+
+    def chiudi(self):
+        conn = getattr(self._locale, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._locale.conn = None
+
+
+_archivi = {}
+_lock_archivi = threading.Lock()
+
+
+def apri_archivio(percorso=DB_FILE):
+    """Archivio di 'percorso', condiviso nel processo."""
+    chiave = os.path.abspath(percorso)
+    with _lock_archivi:
+        if chiave not in _archivi:
+            _archivi[chiave] = ArchivioSQLite(percorso)
+        return _archivi[chiave]
+
+
+class RegistroSQLite:
+    """
+    Base dei registri su archivio SQLite: una tabella le cui colonne sono gli
+    argomenti di 'classe' (la classe delle voci). Filtri e aggregati sono query
+    sulla tabella: le voci vengono create solo per le righe lette.
+    """
+    schema: Tabella
+    classe: type
+
+    def __init__(self, archivio: ArchivioSQLite = None):
+        self.archivio = archivio or apri_archivio()
+        self.archivio.crea(self.schema)
+
+    def _riga(self, voce) -> dict:
+        return {c: getattr(voce, c) for c in self.schema.colonne}
+
+    def _select(self, dove="", ordine="id", limite=None):
+        sql = f"SELECT {', '.join(self.schema.colonne)} FROM {self.schema.nome}{dove} ORDER BY {ordine}"
+        if limite is not None:
+            sql += f" LIMIT {int(limite)}"
+        return sql
+
+    def _voci(self, dove="", parametri=(), ordine="id", limite=None):
+        return [self.classe(**r) for r in self.archivio.righe(self._select(dove, ordine, limite), parametri)]
+
+    def _aggiungi(self, voci):
+        return self.archivio.inserisci(self.schema, (self._riga(v) for v in voci))
+
+    def __len__(self):
+        return self.archivio.valore(f"SELECT COUNT(*) FROM {self.schema.nome}")
+
+    def __bool__(self):
+        # senza contare tutte le righe
+        return self.archivio.valore(f"SELECT EXISTS (SELECT 1 FROM {self.schema.nome})") == 1
+
+    @property
+    def voci(self):
+        """Tutte le voci (lette dall'archivio a ogni accesso)."""
+        return self._voci()
+
+    def to_list(self):
+        return [v.to_dict() for v in self.voci]
+
+    def _da_dizionario(self, item):
+        return self.classe(**item)
+
+    def carica_da_file(self, filename):
+        """Importa le voci di un file JSON dei registri in memoria (lista, o istantanea più giornale)."""
+        return self._aggiungi(self._da_dizionario(item) for item in Giornale(filename).carica())
+
+    def importa_da_file(self, filename):
+        """
+        Migrazione dai registri in memoria: importa le voci di 'filename' una sola volta,
+        anche con più sessioni aperte. Ritorna le voci importate.
+        """
+        origine = os.path.abspath(filename)
+        if self.archivio.importato(self.schema, origine):
+            return 0
+        voci = (self._da_dizionario(item) for item in Giornale(filename).carica())
+        return self.archivio.importa(self.schema, (self._riga(v) for v in voci), origine)
+
+    def salva_su_file(self, filename):
+        """Esporta le voci in un file JSON nel formato dei registri in memoria."""
+        with open(filename, "w", encoding="utf-8") as f:
+            json.dump(self.to_list(), f, indent=2)
@@ -1,7 +1,10 @@
 # --- gestionale/fatture.py ---
-import json
+import os
 from dataclasses import dataclass, asdict
 
+from gestionale.archivio import RegistroSQLite, Tabella, condizioni, contiene
+from gestionale.giornale import apri_giornale
+
 @dataclass
 class Documento:
     numero: str
@@ -17,6 +20,9 @@ class Documento:
 class RegistroDocumenti:
     def __init__(self):
         self.documenti = []
+        # file da cui il registro è stato caricato o su cui è stato salvato e quanti documenti contiene
+        self._file = None
+        self._salvati = 0
 
     def aggiungi_documento(self, doc: Documento):
         self.documenti.append(doc)
@@ -25,14 +31,67 @@ class RegistroDocumenti:
         return [d.to_dict() for d in self.documenti]
 
     def salva_su_file(self, filename):
-        with open(filename, "w", encoding="utf-8") as f:
-            json.dump(self.to_list(), f, indent=2)
+        """
+        Salva i documenti in 'filename' (istantanea più giornale, vedi gestionale.giornale):
+        se il registro viene da quel file si aggiungono al giornale solo i documenti nuovi.
+        """
+        giornale = apri_giornale(filename)
+        if self._file == os.path.abspath(filename):
+            giornale.estendi(d.to_dict() for d in self.documenti[self._salvati:])
+        else:
+            giornale.riscrivi(self.to_list())
+        self._file, self._salvati = os.path.abspath(filename), len(self.documenti)
 
     def carica_da_file(self, filename):
-        with open(filename, "r", encoding="utf-8") as f:
-            lista = json.load(f)
-            for item in lista:
-                self.documenti.append(Documento(**item))
+        if not os.path.exists(filename) and not os.path.exists(filename + ".giornale"):
+            raise FileNotFoundError(filename)
+        gia_presenti = len(self.documenti)
+        for item in apri_giornale(filename).carica():
+            self.documenti.append(Documento(**item))
+        if not gia_presenti:
+            self._file, self._salvati = os.path.abspath(filename), len(self.documenti)
 
     def filtra_per_tipo(self, tipo):
         return [d for d in self.documenti if d.tipo == tipo]
+
+
+TABELLA_DOCUMENTI = Tabella(
+    "documenti",
+    {"numero": "TEXT", "tipo": "TEXT", "data": "TEXT", "cliente": "TEXT", "importo": "REAL", "descrizione": "TEXT"},
+    indici=(("data",), ("tipo", "data"), ("numero",), ("cliente",)),
+)
+
+
+class RegistroDocumentiSQLite(RegistroSQLite):
+    """RegistroDocumenti sull'archivio SQLite condiviso: ogni documento è scritto subito."""
+    schema = TABELLA_DOCUMENTI
+    classe = Documento
+
+    @property
+    def documenti(self):
+        return self.voci
+
+    def aggiungi_documento(self, doc: Documento):
+        self._aggiungi([doc])
+
+    def filtra_per_tipo(self, tipo):
+        return self._voci(*condizioni(tipo=tipo))
+
+    def _filtro(self, dal, al, campo, testo):
+        dove, parametri = condizioni(dal, al)
+        if testo:
+            if campo not in self.schema.colonne:
+                raise KeyError(f"Campo sconosciuto: {campo}")
+            ricerca, altri = contiene([campo], testo)
+            dove += (" AND " if dove else " WHERE ") + ricerca
+            parametri += altri
+        return dove, parametri
+
+    def cerca(self, dal=None, al=None, campo="numero", testo=""):
+        """Documenti con data tra 'dal' e 'al' (inclusi) e 'testo' contenuto nel 'campo'."""
+        return self._voci(*self._filtro(dal, al, campo, testo))
+
+    def tabella(self, dal=None, al=None, campo="numero", testo=""):
+        """Come cerca, ma un DataFrame con le colonne dei documenti."""
+        dove, parametri = self._filtro(dal, al, campo, testo)
+        return self.archivio.tabella(self._select(dove), parametri)
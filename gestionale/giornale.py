@@ -0,0 +1,236 @@
+# --- gestionale/giornale.py ---
+# Persistenza dei registri come giornale append-only (JSONL) più un'istantanea compattata.
+
+import json
+import os
+import tempfile
+import threading
+import time
+
+# fsync dopo ogni scrittura ("sempre"), al più ogni INTERVALLO_FSYNC secondi ("periodica")
+# o mai ("mai": decide il sistema operativo). Il flush verso il sistema operativo è sempre immediato.
+SINCRONIZZAZIONE = "sempre"
+INTERVALLO_FSYNC = 1.0
+# Il giornale viene compattato nell'istantanea quando supera questa dimensione
+# e quella dell'istantanea: il costo della riscrittura resta costante per inserimento
+MIN_BYTES_COMPATTAZIONE = 1024 * 1024
+
+
+def _fsync(f):
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def scrivi_atomico(percorso, contenuto):
+    """Scrive 'contenuto' come JSON in un file temporaneo e lo sostituisce a 'percorso'."""
+    cartella = os.path.dirname(os.path.abspath(percorso))
+    fd, tmp = tempfile.mkstemp(dir=cartella, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(contenuto, f, ensure_ascii=False)
+            _fsync(f)
+        os.replace(tmp, percorso)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+class Giornale:
+    """
+    Registro persistente di record (dizionari) su due file:
+    - l'istantanea 'percorso': {"sequenza": n, "record": [...]} (una lista JSON dei
+      vecchi salvataggi viene letta come istantanea con sequenza 0);
+    - il giornale 'percorso'.giornale: una riga {"n": ..., "dati": {...}} per ogni
+      record aggiunto, scritta in append, quindi a costo costante.
+    Al caricamento l'istantanea viene letta e il giornale rieseguito (solo le righe
+    con n oltre la sequenza dell'istantanea). Una riga troncata da un crash durante
+    la scrittura viene scartata senza toccare il resto del registro.
+    La compattazione riscrive l'istantanea in un thread e poi tronca il giornale.
+    """
+
+    def __init__(self, percorso, sincronizzazione=SINCRONIZZAZIONE, intervallo=INTERVALLO_FSYNC,
+                 min_bytes_compattazione=MIN_BYTES_COMPATTAZIONE):
+        if sincronizzazione not in ("sempre", "periodica", "mai"):
+            raise ValueError(f"Sincronizzazione non valida: {sincronizzazione}")
+        self.percorso = percorso
+        self.percorso_giornale = percorso + ".giornale"
+        self.sincronizzazione = sincronizzazione
+        self.intervallo = intervallo
+        self.min_bytes_compattazione = min_bytes_compattazione
+        self._lock = threading.Lock()
+        self._file = None
+        self._sequenza = None
+        self._ultimo_fsync = 0.0
+        self._compattazione = None
+
+    # --- lettura ---
+
+    def _leggi_istantanea(self):
+        try:
+            with open(self.percorso, encoding="utf-8") as f:
+                contenuto = json.load(f)
+        except FileNotFoundError:
+            return 0, []
+        if isinstance(contenuto, list):
+            return 0, contenuto
+        return contenuto["sequenza"], contenuto["record"]
+
+    def _leggi_giornale(self, fine=None):
+        """Righe (n, dati) del giornale fino al byte 'fine'; le righe illeggibili sono saltate."""
+        try:
+            with open(self.percorso_giornale, "rb") as f:
+                testo = f.read() if fine is None else f.read(fine)
+        except FileNotFoundError:
+            return []
+        righe = []
+        for riga in testo.splitlines():
+            try:
+                voce = json.loads(riga)
+                righe.append((voce["n"], voce["dati"]))
+            except (ValueError, KeyError, TypeError):
+                continue
+        return righe
+
+    def _ultima_sequenza(self):
+        return max([self._leggi_istantanea()[0]] + [n for n, _ in self._leggi_giornale()])
+
+    def carica(self):
+        """Record del registro: istantanea più giornale rieseguito."""
+        with self._lock:
+            sequenza, record = self._leggi_istantanea()
+            for n, dati in self._leggi_giornale():
+                if n > sequenza:
+                    record.append(dati)
+                    sequenza = n
+            if self._sequenza is None:
+                self._sequenza = sequenza
+        return record
+
+    # --- scrittura ---
+
+    def _apri(self):
+        """Handle in append sul giornale; una riga finale troncata da un crash viene tolta."""
+        if self._sequenza is None:
+            self._sequenza = self._ultima_sequenza()
+        if self._file is None:
+            f = open(self.percorso_giornale, "ab+")
+            if f.tell():
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.seek(0)
+                    f.truncate(f.read().rfind(b"\n") + 1)
+                    f.seek(0, os.SEEK_END)
+            self._file = f
+        return self._file
+
+    def estendi(self, records):
+        """Aggiunge i record al giornale con una sola scrittura (e al più un fsync)."""
+        records = list(records)
+        if not records:
+            return
+        with self._lock:
+            f = self._apri()
+            righe = []
+            for dati in records:
+                self._sequenza += 1
+                righe.append(json.dumps({"n": self._sequenza, "dati": dati}, ensure_ascii=False) + "\n")
+            f.write("".join(righe).encode("utf-8"))
+            f.flush()
+            adesso = time.monotonic()
+            if self.sincronizzazione == "sempre" or (
+                    self.sincronizzazione == "periodica" and adesso - self._ultimo_fsync >= self.intervallo):
+                os.fsync(f.fileno())
+                self._ultimo_fsync = adesso
+            da_compattare = f.tell() >= max(self.min_bytes_compattazione, self._dimensione_istantanea())
+        if da_compattare:
+            self.compatta()
+
+    def aggiungi(self, dati):
+        """Aggiunge un record al giornale."""
+        self.estendi([dati])
+
+    def sincronizza(self):
+        """fsync delle scritture ancora nella cache del sistema operativo."""
+        with self._lock:
+            if self._file is not None:
+                _fsync(self._file)
+                self._ultimo_fsync = time.monotonic()
+
+    def _dimensione_istantanea(self):
+        try:
+            return os.path.getsize(self.percorso)
+        except OSError:
+            return 0
+
+    # --- compattazione ---
+
+    def compatta(self, attendi=False):
+        """
+        Riscrive l'istantanea con i record del giornale, in un thread (o subito con
+        attendi=True). Le aggiunte durante la compattazione restano nel giornale.
+        """
+        with self._lock:
+            if self._compattazione is None or not self._compattazione.is_alive():
+                f = self._apri()
+                f.flush()
+                fine = f.seek(0, os.SEEK_END)
+                self._compattazione = threading.Thread(target=self._compatta, args=(fine, self._sequenza),
+                                                       daemon=True)
+                self._compattazione.start()
+            compattazione = self._compattazione
+        if attendi:
+            compattazione.join()
+
+    def _compatta(self, fine, sequenza):
+        # solo la compattazione scrive l'istantanea: si può leggere senza lock
+        n_istantanea, record = self._leggi_istantanea()
+        record.extend(dati for n, dati in self._leggi_giornale(fine) if n_istantanea < n <= sequenza)
+        scrivi_atomico(self.percorso, {"sequenza": sequenza, "record": record})
+        # un crash da qui in poi lascia nel giornale righe già nell'istantanea: vengono saltate
+        with self._lock:
+            self._file.seek(fine)
+            coda = self._file.read()
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.percorso)), suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(coda)
+                _fsync(f)
+            self._file.close()
+            os.replace(tmp, self.percorso_giornale)
+            self._file = open(self.percorso_giornale, "ab+")
+
+    def riscrivi(self, records):
+        """Sostituisce l'intero registro con 'records' (nuova istantanea, giornale vuoto)."""
+        if self._compattazione is not None:
+            self._compattazione.join()
+        with self._lock:
+            if self._sequenza is None:
+                self._sequenza = self._ultima_sequenza()
+            scrivi_atomico(self.percorso, {"sequenza": self._sequenza, "record": list(records)})
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if os.path.exists(self.percorso_giornale):
+                os.remove(self.percorso_giornale)
+
+    def chiudi(self):
+        if self._compattazione is not None:
+            self._compattazione.join()
+        with self._lock:
+            if self._file is not None:
+                _fsync(self._file)
+                self._file.close()
+                self._file = None
+
+
+_giornali = {}
+_lock_giornali = threading.Lock()
+
+
+def apri_giornale(percorso, **opzioni):
+    """Giornale di 'percorso', condiviso nel processo (le pagine Streamlit vengono rieseguite a ogni interazione)."""
+    chiave = os.path.abspath(percorso)
+    with _lock_giornali:
+        if chiave not in _giornali:
+            _giornali[chiave] = Giornale(percorso, **opzioni)
+        return _giornali[chiave]
@@ -0,0 +1,269 @@
+from bisect import bisect_left, bisect_right
+from heapq import merge
+
+import numpy as np
+import pandas as pd
+
+# Campi con indice hash (ricerca per valore); la data ha un indice ordinato per intervalli
+CAMPI_INDICIZZATI = ("categoria", "codice", "standard")
+# Valori nuovi di un campo tenuti fuori dall'indice dei valori prima di ricostruirlo
+MAX_VALORI_EXTRA = 1000
+
+
+def chiave_data(data) -> str:
+    """Data come "YYYY-MM-DD" (l'ordine alfabetico è quello cronologico); accetta anche date/datetime."""
+    if hasattr(data, "strftime"):
+        return data.strftime("%Y-%m-%d")
+    return str(data)[:10]
+
+
+class IndiceMovimenti:
+    """
+    Indici secondari di un registro di movimenti a oggetti, aggiornati a ogni
+    aggiunta/rimozione: un indice hash per ciascun campo di CAMPI_INDICIZZATI
+    (valore → movimenti) e un indice ordinato per data, interrogato con bisect
+    (le date aggiunte fuori ordine vi vengono fuse alla prima ricerca per data).
+    Ogni movimento ha un numero progressivo: i risultati sono nell'ordine di inserimento.
+    """
+
+    def __init__(self, campi=CAMPI_INDICIZZATI):
+        self.campi = tuple(campi)
+        self._hash = {campo: {} for campo in self.campi}   # campo → valore → {n: movimento}
+        self._date = []        # chiavi data ordinate
+        self._date_n = []      # numero progressivo del movimento di ogni chiave
+        self._date_nuove = []  # (chiave, n) arrivate fuori ordine, fuse alla prossima ricerca per data
+        self._movimenti = {}   # n → movimento
+        self._prossimo = 0
+
+    def __len__(self):
+        return len(self._movimenti)
+
+    def aggiungi(self, movimento):
+        n = self._prossimo
+        self._prossimo += 1
+        self._movimenti[n] = movimento
+        for campo in self.campi:
+            self._hash[campo].setdefault(getattr(movimento, campo), {})[n] = movimento
+        chiave = chiave_data(movimento.data)
+        if not self._date or chiave >= self._date[-1]:
+            # caso comune: movimenti registrati in ordine di data
+            self._date.append(chiave)
+            self._date_n.append(n)
+        else:
+            # un inserimento in mezzo alla lista costerebbe O(n) per movimento (O(n²) caricando
+            # un registro non ordinato): le date fuori ordine vengono fuse tutte insieme
+            self._date_nuove.append((chiave, n))
+
+    def _fondi_date(self):
+        """Fonde nell'indice ordinato le date arrivate fuori ordine: un ordinamento e una fusione lineare."""
+        if not self._date_nuove:
+            return
+        self._date_nuove.sort()
+        # a parità di data l'ordine è quello di inserimento (numeri progressivi crescenti)
+        fuse = list(merge(zip(self._date, self._date_n), self._date_nuove))
+        self._date = [chiave for chiave, _ in fuse]
+        self._date_n = [n for _, n in fuse]
+        self._date_nuove = []
+
+    def _rimuovi(self, n):
+        movimento = self._movimenti.pop(n)
+        for campo in self.campi:
+            voci = self._hash[campo][getattr(movimento, campo)]
+            del voci[n]
+            if not voci:
+                del self._hash[campo][getattr(movimento, campo)]
+
+    def rimuovi_per(self, campo, valore):
+        """Rimuove dagli indici i movimenti con campo == valore; ritorna quanti erano."""
+        numeri = list(self._hash[campo].get(valore, ()))
+        if not numeri:
+            return 0
+        for n in numeri:
+            self._rimuovi(n)
+        # l'indice per data viene riscritto una volta sola, senza cancellare le voci una a una
+        self._fondi_date()
+        tieni = [i for i, n in enumerate(self._date_n) if n in self._movimenti]
+        self._date = [self._date[i] for i in tieni]
+        self._date_n = [self._date_n[i] for i in tieni]
+        return len(numeri)
+
+    def cerca(self, dal=None, al=None, **criteri):
+        """
+        Movimenti con i campi uguali a 'criteri' (solo campi indicizzati) e data tra
+        'dal' e 'al' inclusi (None = senza limite). Si parte dall'insieme di candidati
+        più piccolo tra le liste degli indici e si verificano su quelli gli altri criteri.
+        """
+        liste = []
+        for campo, valore in criteri.items():
+            if campo not in self._hash:
+                raise KeyError(f"Campo non indicizzato: {campo}")
+            voci = self._hash[campo].get(valore)
+            if not voci:
+                return []
+            liste.append(voci)
+
+        per_data = dal is not None or al is not None
+        if per_data:
+            self._fondi_date()
+            inizio = 0 if dal is None else bisect_left(self._date, chiave_data(dal))
+            fine = len(self._date) if al is None else bisect_right(self._date, chiave_data(al))
+            if inizio >= fine:
+                return []
+
+        if per_data and (not liste or fine - inizio < min(len(v) for v in liste)):
+            numeri = sorted(n for n in self._date_n[inizio:fine] if all(n in v for v in liste))
+        elif liste:
+            liste.sort(key=len)
+            numeri = [n for n in liste[0] if all(n in v for v in liste[1:])]
+            if per_data:
+                d0 = self._date[inizio]
+                d1 = self._date[fine - 1]
+                numeri = [n for n in numeri if d0 <= chiave_data(self._movimenti[n].data) <= d1]
+        else:
+            return list(self._movimenti.values())
+        return [self._movimenti[n] for n in numeri]
+
+
+class _IndiceCampo:
+    """
+    Indice hash compresso di una colonna: ogni valore ha un codice e le posizioni
+    sono in un solo array, ordinate per codice, con i confini di ogni codice.
+    I valori nuovi finiscono in un piccolo dizionario finché sono pochi, così
+    l'indice dei valori (pd.Index) non viene ricostruito a ogni aggiunta.
+    """
+
+    def __init__(self):
+        self.valori = pd.Index([], dtype=object)
+        self.extra = {}
+        self.posizioni = np.empty(0, dtype=np.int64)
+        self.confini = np.zeros(1, dtype=np.int64)
+
+    def _codici(self, unici):
+        """Codici dei valori 'unici' (distinti); ai valori mai visti ne assegna di nuovi."""
+        if not len(self.valori):
+            codici = np.full(len(unici), -1, dtype=np.int64)
+        elif len(unici) <= MAX_VALORI_EXTRA:
+            # pochi valori (es. un movimento aggiunto): get_loc riusa la tabella hash dell'indice,
+            # get_indexer la ricostruirebbe
+            codici = np.array([self._codice(v) for v in unici], dtype=np.int64)
+        else:
+            codici = self.valori.get_indexer(unici)
+        mancanti = np.flatnonzero(codici < 0)
+        if len(mancanti) and self.extra:
+            # i valori extra hanno codici consecutivi dopo quelli di self.valori
+            in_extra = pd.Index(list(self.extra), dtype=object).get_indexer(unici[mancanti])
+            trovati = in_extra >= 0
+            codici[mancanti[trovati]] = len(self.valori) + in_extra[trovati]
+            mancanti = mancanti[~trovati]
+        prossimo = len(self.valori) + len(self.extra)
+        codici[mancanti] = prossimo + np.arange(len(mancanti))
+        nuovi = list(unici[mancanti])
+        if len(nuovi) + len(self.extra) > MAX_VALORI_EXTRA:
+            self.valori = self.valori.append(pd.Index(list(self.extra) + nuovi, dtype=object))
+            self.extra = {}
+        else:
+            self.extra.update((v, prossimo + i) for i, v in enumerate(nuovi))
+        return codici
+
+    def aggiungi(self, colonna, posizioni):
+        unici_inv, unici = pd.factorize(colonna, use_na_sentinel=False)
+        codici = self._codici(np.asarray(unici, dtype=object))[unici_inv]
+        n_codici = len(self.valori) + len(self.extra)
+        confini = np.pad(self.confini, (0, n_codici + 1 - len(self.confini)), mode="edge")
+        ordine = np.argsort(codici, kind="stable")
+        # le posizioni nuove seguono tutte quelle esistenti: vanno in fondo al tratto del loro codice
+        self.posizioni = np.insert(self.posizioni, confini[1:][codici[ordine]], posizioni[ordine])
+        conteggi = np.bincount(codici, minlength=n_codici)
+        self.confini = confini + np.concatenate([[0], np.cumsum(conteggi)])
+
+    def _codice(self, valore):
+        try:
+            return self.valori.get_loc(valore)
+        except (KeyError, TypeError):
+            return -1
+
+    def cerca(self, valore):
+        """Posizioni (crescenti) delle righe con 'valore', None se il valore non c'è."""
+        c = self.extra.get(valore)
+        if c is None:
+            c = self._codice(valore)
+            if c < 0:
+                return None
+        return self.posizioni[self.confini[c]:self.confini[c + 1]]
+
+
+class IndiceColonne:
+    """
+    Gli stessi indici per un registro a colonne (posizioni di riga in array numpy):
+    un _IndiceCampo per ogni campo e, per la data, le date ordinate con le relative
+    posizioni (np.searchsorted). Le righe aggiunte vengono fuse negli indici
+    esistenti senza riordinare tutto.
+    """
+
+    def __init__(self, campi=CAMPI_INDICIZZATI):
+        self.campi = tuple(campi)
+        self._campi = {campo: _IndiceCampo() for campo in self.campi}
+        self._date = np.empty(0, dtype="datetime64[us]")
+        self._date_pos = np.empty(0, dtype=np.int64)
+        self.righe = 0
+
+    def aggiungi(self, blocco: pd.DataFrame):
+        """Indicizza le righe di 'blocco', che seguono le 'righe' già indicizzate."""
+        posizioni = np.arange(self.righe, self.righe + len(blocco), dtype=np.int64)
+        for campo in self.campi:
+            self._campi[campo].aggiungi(blocco[campo], posizioni)
+
+        date = blocco["data"].to_numpy(dtype="datetime64[us]")
+        ordine = np.argsort(date, kind="stable")
+        dove = np.searchsorted(self._date, date[ordine], side="right")
+        self._date = np.insert(self._date, dove, date[ordine])
+        self._date_pos = np.insert(self._date_pos, dove, posizioni[ordine])
+        self.righe += len(blocco)
+
+    def cerca(self, colonne: pd.DataFrame, dal=None, al=None, **criteri):
+        """Posizioni (crescenti) delle righe di 'colonne' che soddisfano i criteri, come IndiceMovimenti.cerca."""
+        vuoto = np.empty(0, dtype=np.int64)
+        liste = []
+        for campo, valore in criteri.items():
+            if campo not in self._campi:
+                raise KeyError(f"Campo non indicizzato: {campo}")
+            pos = self._campi[campo].cerca(valore)
+            if pos is None or not len(pos):
+                return vuoto
+            liste.append((campo, valore, pos))
+
+        per_data = dal is not None or al is not None
+        if per_data:
+            d0 = np.datetime64(chiave_data(dal)) if dal is not None else None
+            d1 = np.datetime64(chiave_data(al)) + np.timedelta64(1, "D") if al is not None else None
+            inizio = 0 if d0 is None else np.searchsorted(self._date, d0, side="left")
+            fine = len(self._date) if d1 is None else np.searchsorted(self._date, d1, side="left")
+            if inizio >= fine:
+                return vuoto
+
+        liste.sort(key=lambda x: len(x[2]))
+        if per_data and (not liste or fine - inizio < len(liste[0][2])):
+            candidati = np.sort(self._date_pos[inizio:fine])
+        elif liste:
+            candidati = liste.pop(0)[2]
+            if per_data:
+                date = colonne["data"].iloc[candidati].to_numpy()
+                tieni = np.ones(len(candidati), dtype=bool)
+                if d0 is not None:
+                    tieni &= date >= d0
+                if d1 is not None:
+                    tieni &= date < d1
+                candidati = candidati[tieni]
+        else:
+            return np.arange(self.righe, dtype=np.int64)
+
+        for campo, valore, _ in liste:
+            colonna = colonne[campo]
+            if isinstance(colonna.dtype, pd.CategoricalDtype):
+                # confronto sui codici categoriali, senza leggere le stringhe
+                codice = colonna.cat.categories.get_loc(valore)
+                candidati = candidati[colonna.cat.codes.to_numpy()[candidati] == codice]
+            else:
+                # solo le righe candidate vengono lette dalla colonna
+                candidati = candidati[colonna.iloc[candidati].to_numpy() == valore]
+        return candidati
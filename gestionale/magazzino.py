@@ -2,6 +2,8 @@
 import json
 from dataclasses import dataclass, asdict
 
+from gestionale.archivio import RegistroSQLite, Tabella, condizioni
+
 @dataclass
 class VoceMagazzino:
     codice_articolo: str
@@ -42,3 +44,36 @@ class RegistroMagazzino:
             lista = json.load(f)
             for item in lista:
                 self.voci.append(VoceMagazzino(**item))
+
+
+TABELLA_MAGAZZINO = Tabella(
+    "magazzino",
+    {"codice_articolo": "TEXT", "descrizione": "TEXT", "quantita": "INTEGER", "prezzo_unitario": "REAL",
+     "categoria": "TEXT"},
+    indici=(("codice_articolo",), ("categoria",)),
+)
+
+
+class RegistroMagazzinoSQLite(RegistroSQLite):
+    """RegistroMagazzino sull'archivio SQLite condiviso: le giacenze sono aggiornate con una UPDATE."""
+    schema = TABELLA_MAGAZZINO
+    classe = VoceMagazzino
+
+    def aggiungi_voce(self, voce: VoceMagazzino):
+        self._aggiungi([voce])
+
+    def filtra_per_categoria(self, categoria):
+        return self._voci(*condizioni(categoria=categoria))
+
+    def aggiorna_giacenza(self, codice_articolo, variazione_qta):
+        # come RegistroMagazzino: solo la prima voce con il codice
+        return self.archivio.esegui(
+            "UPDATE magazzino SET quantita = quantita + ? WHERE id = "
+            "(SELECT id FROM magazzino WHERE codice_articolo = ? ORDER BY id LIMIT 1)",
+            (variazione_qta, codice_articolo)) > 0
+
+    def valore_per_categoria(self):
+        """Valore delle giacenze (quantità × prezzo unitario) per categoria, calcolato in SQL."""
+        righe = self.archivio.righe("SELECT categoria, SUM(quantita * prezzo_unitario) AS valore "
+                                    "FROM magazzino GROUP BY categoria")
+        return {r["categoria"]: float(r["valore"]) for r in righe}
@@ -1,7 +1,15 @@
-from dataclasses import dataclass, asdict
-import json
+from collections.abc import Sequence
+from dataclasses import dataclass, asdict, fields
+from datetime import datetime
 import csv
 
+import numpy as np
+import pandas as pd
+
+from gestionale.archivio import RegistroSQLite, Tabella, condizioni
+from gestionale.indici import CAMPI_INDICIZZATI, IndiceColonne, IndiceMovimenti
+from gestionale.riconciliazione import riconcilia
+
 @dataclass
 class MovimentoContabile:
     codice: str
@@ -17,41 +25,385 @@ class MovimentoContabile:
 
 class RegistroMovimenti:
     def __init__(self):
-        self.movimenti: list[MovimentoContabile] = []
+        self._movimenti: list[MovimentoContabile] = []
+        self._vista = None    # tupla di self._movimenti, ricreata solo dopo una modifica
+        self._indice = IndiceMovimenti()
+
+    @property
+    def movimenti(self) -> tuple:
+        """I movimenti in ordine di inserimento, in sola lettura: si aggiungono con aggiungi_movimento."""
+        if self._vista is None:
+            self._vista = tuple(self._movimenti)
+        return self._vista
+
+    def __len__(self):
+        return len(self._movimenti)
+
+    def __iter__(self):
+        return iter(self._movimenti)
 
     def aggiungi_movimento(self, movimento: MovimentoContabile):
         if isinstance(movimento, MovimentoContabile):
-            self.movimenti.append(movimento)
+            self._movimenti.append(movimento)
+            self._vista = None
+            self._indice.aggiungi(movimento)
 
     def filtra_per_categoria(self, categoria: str):
-        return [m for m in self.movimenti if m.categoria == categoria]
+        return self._indice.cerca(categoria=categoria)
+
+    def cerca(self, dal=None, al=None, **criteri):
+        """Movimenti per categoria/codice/standard e intervallo di date (inclusi), dagli indici."""
+        return self._indice.cerca(dal, al, **criteri)
 
     def totali_per_categoria(self):
         totali = {}
-        for m in self.movimenti:
+        for m in self._movimenti:
             totali[m.categoria] = totali.get(m.categoria, 0) + m.importo
         return totali
 
     def verifica_movimenti_sospetti(self, soglia=1_000_000):
-        return [m for m in self.movimenti if abs(m.importo) >= soglia]
+        return [m for m in self._movimenti if abs(m.importo) >= soglia]
 
-    def verifica_incoerenze_con_registro(self, registro_esterno: list[dict]):
-        differenze = []
-        registro_serializzato = {json.dumps(m, sort_keys=True) for m in registro_esterno}
-        for movimento in self.movimenti:
-            if json.dumps(movimento.to_dict(), sort_keys=True) not in registro_serializzato:
-                differenze.append(movimento)
-        return differenze
+    def riconcilia(self, registro_esterno: list[dict], **tolleranze):
+        """Riconciliazione con il registro esterno (vedi gestionale.riconciliazione.riconcilia)."""
+        return riconcilia([m.to_dict() for m in self._movimenti], registro_esterno, **tolleranze)
+
+    def verifica_incoerenze_con_registro(self, registro_esterno: list[dict], **tolleranze):
+        """
+        Movimenti senza corrispondente nel registro esterno, abbinati uno a uno;
+        senza tolleranze (giorni, centesimi, relativa, cambi) tutti i campi devono coincidere.
+        """
+        esito = self.riconcilia(registro_esterno, **tolleranze)
+        return [self._movimenti[i] for i in esito["interni"].index]
 
     def esporta_csv(self, filename="movimenti_export.csv"):
-        if not self.movimenti:
+        if not self._movimenti:
             return
         with open(filename, mode="w", newline="", encoding="utf-8") as f:
-            writer = csv.DictWriter(f, fieldnames=self.movimenti[0].to_dict().keys())
+            writer = csv.DictWriter(f, fieldnames=self._movimenti[0].to_dict().keys())
             writer.writeheader()
-            for m in self.movimenti:
+            for m in self._movimenti:
                 writer.writerow(m.to_dict())
 
     def carica_da_lista(self, lista_dizionari: list[dict]):
         for item in lista_dizionari:
-            self.movimenti.append(MovimentoContabile(**item))
+            self.aggiungi_movimento(MovimentoContabile(**item))
+
+
+COLONNE_MOVIMENTO = [f.name for f in fields(MovimentoContabile)]
+# Colonne con pochi valori distinti, salvate come codici categoriali
+COLONNE_CATEGORIALI = ["categoria", "valuta", "standard"]
+# Formati delle date accettati in scrittura: quello dei registri e quello dei vecchi file JSON
+FORMATI_DATA = ("%Y-%m-%d", "%d/%m/%Y")
+
+
+def normalizza_data(data) -> str:
+    """Data di un movimento come "YYYY-MM-DD" (da stringa in FORMATI_DATA o date/datetime); ValueError se non valida."""
+    if hasattr(data, "strftime"):
+        return data.strftime("%Y-%m-%d")
+    for formato in FORMATI_DATA:
+        try:
+            return datetime.strptime(str(data), formato).strftime("%Y-%m-%d")
+        except ValueError:
+            pass
+    raise ValueError(f"Data del movimento non valida: {data!r}")
+
+
+def _date(colonna: pd.Series, verifica: bool) -> pd.Series:
+    date = pd.to_datetime(colonna, format=FORMATI_DATA[0], errors="coerce")
+    for formato in FORMATI_DATA[1:]:
+        mancanti = date.isna() & colonna.notna()
+        if not mancanti.any():
+            break
+        date[mancanti] = pd.to_datetime(colonna[mancanti], format=formato, errors="coerce")
+    if verifica and date.isna().any():
+        raise ValueError(f"Data del movimento non valida: {colonna[date.isna()].iloc[0]!r}")
+    return date
+
+
+def tabella_movimenti(dati, verifica=False) -> pd.DataFrame:
+    """
+    DataFrame tipizzato dei movimenti ('dati': lista di dizionari o DataFrame):
+    categoria, valuta e standard categoriali, data datetime64, importo float.
+    Le date non valide diventano NaT, così una riga rovinata non blocca la lettura
+    del registro; con 'verifica' (in scrittura) sollevano ValueError.
+    """
+    df = pd.DataFrame(dati, columns=COLONNE_MOVIMENTO)
+    for col in COLONNE_CATEGORIALI:
+        df[col] = df[col].astype("category")
+    df["data"] = _date(df["data"], verifica)
+    df["importo"] = df["importo"].astype(float)
+    return df
+
+
+def _dizionari(righe: pd.DataFrame) -> list[dict]:
+    """Righe di una tabella dei movimenti come dizionari con i tipi di MovimentoContabile."""
+    righe = righe.astype({col: object for col in COLONNE_CATEGORIALI})
+    righe["data"] = righe["data"].dt.strftime("%Y-%m-%d")
+    return righe.to_dict("records")
+
+
+class SelezioneMovimenti(Sequence):
+    """
+    Risultato di un filtro del registro a colonne: si usa come la lista di
+    MovimentoContabile dei filtri di RegistroMovimenti, ma gli oggetti vengono
+    creati solo quando si leggono. tabella() dà le righe senza crearli.
+    """
+
+    def __init__(self, righe: pd.DataFrame):
+        self._righe = righe
+
+    def tabella(self) -> pd.DataFrame:
+        return self._righe
+
+    def __len__(self):
+        return len(self._righe)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return SelezioneMovimenti(self._righe.iloc[i])
+        return MovimentoContabile(**_dizionari(self._righe.iloc[[i]])[0])
+
+    def __iter__(self):
+        for inizio in range(0, len(self._righe), 10_000):
+            for r in _dizionari(self._righe.iloc[inizio:inizio + 10_000]):
+                yield MovimentoContabile(**r)
+
+    def __eq__(self, altro):
+        if isinstance(altro, (SelezioneMovimenti, list)):
+            return len(self) == len(altro) and list(self) == list(altro)
+        return NotImplemented
+
+    def __repr__(self):
+        return f"SelezioneMovimenti({len(self)} movimenti)"
+
+
+class RegistroMovimentiColonnare:
+    """
+    Registro con la stessa interfaccia di RegistroMovimenti, ma con i movimenti
+    in colonne (una per campo) invece che in una lista di oggetti: filtri e totali
+    sono maschere e groupby vettorizzati e i filtri restituiscono SelezioneMovimenti.
+    Pensato per registri con milioni di movimenti.
+    I movimenti aggiunti uno alla volta restano in un buffer, unito alle colonne
+    alla prima interrogazione.
+    """
+
+    def __init__(self):
+        self._colonne = tabella_movimenti([])
+        self._nuovi: list[dict] = []
+        self._indice = None   # IndiceColonne, creato alla prima ricerca
+
+    def _tabella(self) -> pd.DataFrame:
+        if self._nuovi:
+            self._unisci(tabella_movimenti(self._nuovi))
+            self._nuovi = []
+        return self._colonne
+
+    def _unisci(self, nuove: pd.DataFrame):
+        if self._indice is not None:
+            self._indice.aggiungi(nuove)
+        if not len(self._colonne):
+            self._colonne = nuove.reset_index(drop=True)
+            return
+        for col in COLONNE_CATEGORIALI:
+            # stesse categorie nei due blocchi, altrimenti pd.concat restituisce object
+            esistenti = self._colonne[col].cat.categories
+            aggiunte = nuove[col].cat.categories.difference(esistenti)
+            if len(aggiunte):
+                self._colonne[col] = self._colonne[col].cat.add_categories(aggiunte)
+            nuove[col] = nuove[col].cat.set_categories(self._colonne[col].cat.categories)
+        self._colonne = pd.concat([self._colonne, nuove], ignore_index=True)
+
+    def __len__(self):
+        return len(self._colonne) + len(self._nuovi)
+
+    @property
+    def movimenti(self) -> SelezioneMovimenti:
+        """Tutti i movimenti (sequenza di MovimentoContabile, come la lista di RegistroMovimenti)."""
+        return SelezioneMovimenti(self._tabella())
+
+    def tabella(self) -> pd.DataFrame:
+        """I movimenti come DataFrame tipizzato, senza copiarli in oggetti (es. per st.dataframe)."""
+        return self._tabella()
+
+    def aggiungi_movimento(self, movimento: MovimentoContabile):
+        if isinstance(movimento, MovimentoContabile):
+            # la data viene verificata qui: nel buffer una data non valida farebbe fallire ogni interrogazione
+            self._nuovi.append({**movimento.to_dict(), "data": normalizza_data(movimento.data)})
+
+    def aggiungi_tabella(self, dati):
+        """Aggiunge molti movimenti in una volta (lista di dizionari o DataFrame con le colonne dei movimenti)."""
+        nuove = tabella_movimenti(dati, verifica=True)
+        self._tabella()
+        self._unisci(nuove)
+
+    def filtra_per_categoria(self, categoria: str):
+        return self.cerca(categoria=categoria)
+
+    def cerca(self, dal=None, al=None, **criteri):
+        """Movimenti per categoria/codice/standard e intervallo di date (inclusi), dagli indici."""
+        df = self._tabella()
+        if self._indice is None:
+            self._indice = IndiceColonne()
+            self._indice.aggiungi(df)
+        return SelezioneMovimenti(df.iloc[self._indice.cerca(df, dal, al, **criteri)])
+
+    def totali_per_categoria(self):
+        df = self._tabella()
+        totali = df.groupby("categoria", observed=True, sort=False)["importo"].sum()
+        return {categoria: float(v) for categoria, v in totali.items()}
+
+    def verifica_movimenti_sospetti(self, soglia=1_000_000):
+        df = self._tabella()
+        return SelezioneMovimenti(df[np.abs(df["importo"].to_numpy()) >= soglia])
+
+    def riconcilia(self, registro_esterno: list[dict], **tolleranze):
+        """Riconciliazione con il registro esterno (vedi gestionale.riconciliazione.riconcilia)."""
+        return riconcilia(self._tabella(), registro_esterno, **tolleranze)
+
+    def verifica_incoerenze_con_registro(self, registro_esterno: list[dict], **tolleranze):
+        """Come RegistroMovimenti.verifica_incoerenze_con_registro, sulle colonne."""
+        df = self._tabella()
+        if not len(df):
+            return SelezioneMovimenti(df)
+        esito = self.riconcilia(registro_esterno, **tolleranze)
+        return SelezioneMovimenti(df.iloc[esito["interni"].index])
+
+    def esporta_csv(self, filename="movimenti_export.csv"):
+        df = self._tabella()
+        if not len(df):
+            return
+        # stesso formato di csv.DictWriter (righe terminate da \r\n)
+        df.to_csv(filename, index=False, encoding="utf-8", date_format="%Y-%m-%d", lineterminator="\r\n")
+
+    def carica_da_lista(self, lista_dizionari: list[dict]):
+        self.aggiungi_tabella(lista_dizionari)
+
+
+# Totali per categoria tenuti aggiornati da trigger: leggerli non richiede di scorrere i movimenti
+_AGGIUNGI_AI_TOTALI = ("INSERT INTO movimenti_totali VALUES ({categoria}, {importo}, {n}) ON CONFLICT (categoria) "
+                       "DO UPDATE SET totale = totale + excluded.totale, n = n + excluded.n")
+TRIGGER_TOTALI_INS = ("CREATE TRIGGER IF NOT EXISTS movimenti_totali_ins AFTER INSERT ON movimenti BEGIN "
+                      + _AGGIUNGI_AI_TOTALI.format(categoria="NEW.categoria", importo="NEW.importo", n=1) + "; END")
+_TOGLI_DAI_TOTALI = ("UPDATE movimenti_totali SET totale = totale - OLD.importo, n = n - 1 "
+                     "WHERE categoria = OLD.categoria; "
+                     "DELETE FROM movimenti_totali WHERE categoria = OLD.categoria AND n = 0")
+
+TABELLA_MOVIMENTI = Tabella(
+    "movimenti",
+    {"codice": "TEXT", "descrizione": "TEXT", "categoria": "TEXT", "data": "TEXT", "importo": "REAL",
+     "valuta": "TEXT", "standard": "TEXT"},
+    indici=(("categoria", "data"), ("codice", "data"), ("standard", "data"), ("data",), ("importo",)),
+    altre=(
+        "CREATE TABLE IF NOT EXISTS movimenti_totali "
+        "(categoria TEXT PRIMARY KEY, totale REAL NOT NULL, n INTEGER NOT NULL)",
+        # movimenti senza totali: la tabella dei totali è nuova, si calcolano una volta
+        "INSERT INTO movimenti_totali SELECT categoria, SUM(importo), COUNT(*) FROM movimenti "
+        "WHERE NOT EXISTS (SELECT 1 FROM movimenti_totali) GROUP BY categoria",
+        TRIGGER_TOTALI_INS,
+        f"CREATE TRIGGER IF NOT EXISTS movimenti_totali_del AFTER DELETE ON movimenti BEGIN {_TOGLI_DAI_TOTALI}; END",
+        "CREATE TRIGGER IF NOT EXISTS movimenti_totali_upd AFTER UPDATE OF categoria, importo ON movimenti BEGIN "
+        f"{_TOGLI_DAI_TOTALI}; "
+        + _AGGIUNGI_AI_TOTALI.format(categoria="NEW.categoria", importo="NEW.importo", n=1) + "; END",
+    ),
+)
+
+
+class RegistroMovimentiSQLite(RegistroSQLite):
+    """
+    Registro con l'interfaccia di RegistroMovimentiColonnare sull'archivio SQLite
+    condiviso: ogni movimento è scritto subito, filtri e totali sono query sugli
+    indici della tabella e leggono solo le righe del risultato.
+    """
+    schema = TABELLA_MOVIMENTI
+    classe = MovimentoContabile
+
+    def _riga(self, voce) -> dict:
+        # ogni scrittura (aggiunte, caricamenti e importazioni da file) passa da qui: una data
+        # non valida fa fallire il suo inserimento invece di bloccare le letture successive
+        return {**super()._riga(voce), "data": normalizza_data(voce.data)}
+
+    def _selezione(self, dove="", parametri=(), ordine="id", limite=None) -> SelezioneMovimenti:
+        df = self.archivio.tabella(self._select(dove, ordine, limite), parametri)
+        return SelezioneMovimenti(tabella_movimenti(df))
+
+    @property
+    def movimenti(self) -> SelezioneMovimenti:
+        return self._selezione()
+
+    def tabella(self) -> pd.DataFrame:
+        return self._selezione().tabella()
+
+    def ultimi(self, n) -> SelezioneMovimenti:
+        """Gli ultimi 'n' movimenti registrati, in ordine di inserimento."""
+        df = self._selezione(ordine="id DESC", limite=n).tabella()
+        return SelezioneMovimenti(df.iloc[::-1].reset_index(drop=True))
+
+    def aggiungi_movimento(self, movimento: MovimentoContabile):
+        if isinstance(movimento, MovimentoContabile):
+            self._aggiungi([movimento])
+
+    def aggiungi_tabella(self, dati):
+        """Aggiunge molti movimenti in una transazione (lista di dizionari o DataFrame)."""
+        df = tabella_movimenti(dati, verifica=True)
+        totali = df.groupby("categoria", observed=True, sort=False)["importo"].agg(["sum", "count"])
+        df = df.astype({col: object for col in COLONNE_CATEGORIALI})
+        df["data"] = df["data"].dt.strftime("%Y-%m-%d")
+        conn = self.archivio.connessione()
+        with conn:
+            # invece del trigger riga per riga, i totali si aggiornano una volta per categoria;
+            # il trigger viene tolto e ricreato nella stessa transazione, invisibile alle altre sessioni
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DROP TRIGGER IF EXISTS movimenti_totali_ins")
+            conn.executemany(self.archivio.sql_inserimento(self.schema),
+                             df[list(self.schema.colonne)].itertuples(index=False, name=None))
+            conn.executemany(_AGGIUNGI_AI_TOTALI.format(categoria="?", importo="?", n="?"),
+                             ((c, float(t), int(n)) for c, (t, n) in totali.iterrows()))
+            conn.execute(TRIGGER_TOTALI_INS)
+        return len(df)
+
+    def carica_da_lista(self, lista_dizionari: list[dict]):
+        self.aggiungi_tabella(lista_dizionari)
+
+    def filtra_per_categoria(self, categoria: str):
+        return self.cerca(categoria=categoria)
+
+    def cerca(self, dal=None, al=None, **criteri):
+        """Movimenti per categoria/codice/standard e intervallo di date (inclusi), dagli indici SQL."""
+        for campo in criteri:
+            if campo not in CAMPI_INDICIZZATI:
+                raise KeyError(f"Campo non indicizzato: {campo}")
+        return self._selezione(*condizioni(dal, al, **criteri))
+
+    def totali_per_categoria(self):
+        righe = self.archivio.righe("SELECT categoria, totale FROM movimenti_totali ORDER BY rowid")
+        return {r["categoria"]: float(r["totale"]) for r in righe}
+
+    def verifica_movimenti_sospetti(self, soglia=1_000_000):
+        # due intervalli sull'indice dell'importo invece di abs() su tutte le righe
+        # (con un OR la query scorrerebbe la tabella per restituire le righe in ordine di id)
+        return self._selezione(" WHERE id IN (SELECT id FROM movimenti WHERE importo >= ? "
+                               "UNION SELECT id FROM movimenti WHERE importo <= ?)", (soglia, -soglia))
+
+    def riconcilia(self, registro_esterno: list[dict], **tolleranze):
+        """Riconciliazione con il registro esterno (vedi gestionale.riconciliazione.riconcilia)."""
+        return riconcilia(self.tabella(), registro_esterno, **tolleranze)
+
+    def verifica_incoerenze_con_registro(self, registro_esterno: list[dict], **tolleranze):
+        """Come RegistroMovimenti.verifica_incoerenze_con_registro."""
+        df = self.tabella()
+        if not len(df):
+            return SelezioneMovimenti(df)
+        esito = riconcilia(df, registro_esterno, **tolleranze)
+        return SelezioneMovimenti(df.iloc[esito["interni"].index])
+
+    def esporta_csv(self, filename="movimenti_export.csv"):
+        if not self:
+            return
+        # righe lette a blocchi dal cursore, stesso formato di RegistroMovimenti.esporta_csv
+        cursore = self.archivio.connessione().execute(self._select())
+        with open(filename, mode="w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(COLONNE_MOVIMENTO)
+            while righe := cursore.fetchmany(10_000):
+                writer.writerows(tuple(r) for r in righe)
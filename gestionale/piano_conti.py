@@ -1,16 +1,20 @@
 # --- gestionale/piano_conti.py ---
 
+from gestionale.archivio import RegistroSQLite, Tabella, condizioni
+
 class VoceConto:
-    def __init__(self, codice, descrizione, tipo):
+    def __init__(self, codice, descrizione, tipo, categoria=""):
         self.codice = codice
         self.descrizione = descrizione
         self.tipo = tipo  # es: "Attivo", "Passivo", "Costo", "Ricavo"
+        self.categoria = categoria  # es: "Immobilizzazioni", "Disponibilità"
 
     def to_dict(self):
         return {
             "Codice": self.codice,
             "Descrizione": self.descrizione,
-            "Tipo": self.tipo
+            "Tipo": self.tipo,
+            "Categoria": self.categoria
         }
 
 class PianoDeiConti:
@@ -42,3 +46,34 @@ class PianoDeiConti:
 
     def to_list(self):
         return [v.to_dict() for v in self.voci]
+
+
+TABELLA_CONTI = Tabella(
+    "piano_conti",
+    {"codice": "TEXT", "descrizione": "TEXT", "tipo": "TEXT", "categoria": "TEXT"},
+    indici=(("codice",), ("tipo",)),
+)
+
+
+class PianoDeiContiSQLite(RegistroSQLite):
+    """PianoDeiConti sull'archivio SQLite condiviso."""
+    schema = TABELLA_CONTI
+    classe = VoceConto
+
+    def _da_dizionario(self, item):
+        # to_dict usa chiavi con l'iniziale maiuscola
+        return VoceConto(**{k.lower(): v for k, v in item.items()})
+
+    def aggiungi_voce(self, voce):
+        if isinstance(voce, VoceConto):
+            self._aggiungi([voce])
+
+    def rimuovi_voce(self, codice):
+        self.archivio.esegui("DELETE FROM piano_conti WHERE codice = ?", (codice,))
+
+    def trova_per_tipo(self, tipo):
+        return self._voci(*condizioni(tipo=tipo))
+
+    def cerca_voce(self, codice):
+        voci = self._voci(*condizioni(codice=codice), limite=1)
+        return voci[0] if voci else None
@@ -0,0 +1,274 @@
+# --- gestionale/riconciliazione.py ---
+# Riconciliazione tra il registro movimenti e un registro esterno, con tolleranze su date e importi.
+
+import numpy as np
+import pandas as pd
+
+COLONNE = ["codice", "descrizione", "categoria", "data", "importo", "valuta", "standard"]
+# Campi che devono coincidere perché due movimenti possano essere abbinati
+CAMPI_UGUALI = ("codice", "descrizione", "categoria", "standard")
+
+
+def normalizza(dati) -> pd.DataFrame:
+    """
+    Colonne tipizzate per la riconciliazione (lista di dizionari o DataFrame):
+    data datetime64, importo float, indice per posizione. Le righe con data o
+    importo non validi o con campi mancanti hanno valido=False.
+    """
+    df = pd.DataFrame(dati)
+    for col in COLONNE:
+        if col not in df:
+            df[col] = None
+    df = df[COLONNE].reset_index(drop=True)
+    if not pd.api.types.is_datetime64_any_dtype(df["data"]):
+        df["data"] = pd.to_datetime(df["data"], format="%Y-%m-%d", errors="coerce")
+    df["importo"] = pd.to_numeric(df["importo"], errors="coerce")
+    df["valido"] = df[COLONNE].notna().all(axis=1).to_numpy()
+    return df
+
+
+def _chiavi(interni, esterni, campi, cambi, giorni, centesimi, relativa):
+    """
+    Chiavi di blocco dei due lati: gruppo (campi uguali, valuta se non si convertono
+    i cambi, segno), giorno e fascia d'importo. Due movimenti compatibili hanno lo
+    stesso gruppo, giorni che distano al più 'giorni' e fasce adiacenti.
+    """
+    n = len(interni)
+    tutti = pd.concat([interni, esterni], ignore_index=True)
+    importo = tutti["importo"].to_numpy(dtype=float)
+    if cambi:
+        importo = importo * tutti["valuta"].map(cambi).astype(float).fillna(1.0).to_numpy()
+    cent = np.round(importo * 100)
+    chiavi = pd.DataFrame({c: tutti[c] for c in campi})
+    if not cambi:
+        chiavi["valuta"] = tutti["valuta"]
+    chiavi["segno"] = np.sign(cent)
+    gruppo = chiavi.groupby(list(chiavi.columns), sort=False, dropna=False).ngroup().to_numpy()
+    giorno = (tutti["data"].to_numpy(dtype="datetime64[D]").astype("int64")
+              if len(tutti) else np.empty(0, dtype=np.int64))
+
+    # fasce: larghe quanto la tolleranza assoluta, su scala logaritmica se c'è una tolleranza relativa
+    modulo = np.abs(cent)
+    if relativa > 0:
+        fascia = np.floor(np.log(modulo + max(centesimi, 1) / relativa) / (2 * np.log1p(relativa)))
+    else:
+        fascia = np.floor(modulo / max(centesimi, 1))
+    fascia = np.nan_to_num(fascia, nan=-1).astype(np.int64)
+    colonne = pd.DataFrame({"gruppo": gruppo, "giorno": giorno, "fascia": fascia, "cent": cent})
+    return colonne.iloc[:n].reset_index(drop=True), colonne.iloc[n:].reset_index(drop=True)
+
+
+def _uguali(chiavi_i, chiavi_e):
+    """
+    Sort-merge su chiavi intere già ordinate: coppie (posizione in chiavi_i, posizione
+    in chiavi_e) con la stessa chiave. Gli intervalli di chiavi uguali sono trovati
+    con np.searchsorted e le coppie espanse senza cicli Python.
+    """
+    inizio = np.searchsorted(chiavi_e, chiavi_i, side="left")
+    quanti = np.searchsorted(chiavi_e, chiavi_i, side="right") - inizio
+    i = np.repeat(np.arange(len(chiavi_i)), quanti)
+    # posizione di ogni coppia all'interno del proprio intervallo
+    scarto = np.arange(len(i)) - np.repeat(np.cumsum(quanti) - quanti, quanti)
+    return i, np.repeat(inizio, quanti) + scarto
+
+
+def _candidati(ci, ce, giorni, centesimi, relativa):
+    """
+    Coppie (i, j) compatibili: per ogni scostamento di giorno e di fascia, le coppie
+    con la stessa chiave di blocco (gruppo, giorno, fascia) in un solo intero.
+    """
+    vuoto = pd.DataFrame({"i": [], "j": [], "giorni": [], "differenza": []}, dtype=np.int64)
+    if not len(ci) or not len(ce):
+        return vuoto
+    g0 = min(ci["giorno"].min(), ce["giorno"].min()) - giorni
+    passo_g = int(max(ci["giorno"].max(), ce["giorno"].max()) - g0) + giorni + 1
+    n_gruppi = int(max(ci["gruppo"].max(), ce["gruppo"].max())) + 1
+    fasce = np.concatenate([ci["fascia"].to_numpy(), ce["fascia"].to_numpy()])
+    f0 = fasce.min() - 1
+    passo_f = int(fasce.max() - f0) + 2
+    if n_gruppi * passo_g * passo_f >= 2 ** 62:
+        # fasce molto sparse (importi esatti al centesimo): rinumerate tenendo
+        # adiacenti solo quelle consecutive, così la chiave sta in un int64
+        unici, fasce = np.unique(fasce, return_inverse=True)
+        unici = np.cumsum(np.where(np.diff(unici, prepend=unici[0]) == 1, 1, 2))
+        fasce, f0 = unici[fasce], 0
+        passo_f = int(unici[-1]) + 2
+    fascia_i, fascia_e = fasce[:len(ci)], fasce[len(ci):]
+
+    def chiave(c, fascia):
+        return (c["gruppo"].to_numpy() * passo_g + (c["giorno"].to_numpy() - g0)) * passo_f + (fascia - f0)
+
+    # i due lati vengono ordinati una volta: spostare le chiavi di una costante non cambia l'ordine
+    chiavi_i, chiavi_e = chiave(ci, fascia_i), chiave(ce, fascia_e)
+    ordine_i, ordine_e = np.argsort(chiavi_i), np.argsort(chiavi_e)
+    chiavi_i, chiavi_e = chiavi_i[ordine_i], chiavi_e[ordine_e]
+    coppie = []
+    for dg in range(-giorni, giorni + 1):
+        for df in (-1, 0, 1):
+            i, j = _uguali(chiavi_i + dg * passo_f + df, chiavi_e)
+            if len(i):
+                coppie.append((ordine_i[i], ordine_e[j], np.full(len(i), dg)))
+    if not coppie:
+        return vuoto
+    i, j, dg = (np.concatenate(x) for x in zip(*coppie))
+    cent_i, cent_e = ci["cent"].to_numpy()[i], ce["cent"].to_numpy()[j]
+    differenza = cent_e - cent_i
+    limite = centesimi + relativa * np.maximum(np.abs(cent_i), np.abs(cent_e))
+    tieni = np.abs(differenza) <= limite + 1e-9
+    return pd.DataFrame({"i": ci.index.to_numpy()[i[tieni]], "j": ce.index.to_numpy()[j[tieni]],
+                         "giorni": dg[tieni], "differenza": differenza[tieni]})
+
+
+def _assegna(candidati, classe_i, classe_e, validi_i, validi_e):
+    """
+    Abbinamento uno a uno: a ogni giro ogni movimento interno sceglie il candidato
+    più vicino (prima per giorni, poi per importo); se più interni scelgono lo
+    stesso esterno vince il più vicino. Gli abbinati escono dai candidati.
+    I movimenti validi della stessa classe ('classe_i', 'classe_e': stessi gruppo, giorno
+    e importo) sono intercambiabili e 'candidati' ne contiene uno per classe: a ogni giro
+    una coppia di classi abbina insieme tanti movimenti quanti ne restano liberi nella più
+    piccola delle due, per posizione (il k-esimo interno libero con il k-esimo esterno).
+    """
+    if not len(candidati):
+        return candidati.iloc[:0]
+
+    def membri(classe, validi):
+        # posizioni valide raggruppate per classe, crescenti in ogni classe, con inizio e numero di ciascuna
+        posizioni = np.flatnonzero(validi)
+        classi = classe[posizioni]
+        conteggi = np.bincount(classi, minlength=classe.max() + 1)
+        return posizioni[np.lexsort((posizioni, classi))], np.cumsum(conteggi) - conteggi, conteggi
+
+    membri_i, inizio_i, totale_i = membri(classe_i, validi_i)
+    membri_e, inizio_e, totale_e = membri(classe_e, validi_e)
+    usati_i, usati_e = np.zeros_like(totale_i), np.zeros_like(totale_e)
+
+    c = pd.DataFrame({"ki": classe_i[candidati["i"].to_numpy(dtype=np.int64)],
+                      "kj": classe_e[candidati["j"].to_numpy(dtype=np.int64)],
+                      "giorni": candidati["giorni"].to_numpy(),
+                      "differenza": candidati["differenza"].to_numpy()})
+    c["_punteggio"] = np.abs(c["giorni"]) * 1e12 + np.abs(c["differenza"])
+    abbinati = []
+    while len(c):
+        # a parità di punteggio decide il primo movimento ancora libero di ogni classe
+        ki, kj = c["ki"].to_numpy(), c["kj"].to_numpy()
+        c = c.assign(_i=membri_i[inizio_i[ki] + usati_i[ki]], _j=membri_e[inizio_e[kj] + usati_e[kj]])
+        c = c.sort_values(["_punteggio", "_i", "_j"], kind="stable")
+        scelti = c.drop_duplicates("ki").drop_duplicates("kj")
+        ki, kj = scelti["ki"].to_numpy(), scelti["kj"].to_numpy()
+        quanti = np.minimum(totale_i[ki] - usati_i[ki], totale_e[kj] - usati_e[kj])
+        riga = np.repeat(np.arange(len(scelti)), quanti)
+        k = np.arange(len(riga)) - np.repeat(np.cumsum(quanti) - quanti, quanti)
+        abbinati.append(pd.DataFrame({
+            "i": membri_i[(inizio_i[ki] + usati_i[ki])[riga] + k],
+            "j": membri_e[(inizio_e[kj] + usati_e[kj])[riga] + k],
+            "giorni": scelti["giorni"].to_numpy()[riga],
+            "differenza": scelti["differenza"].to_numpy()[riga]}))
+        usati_i[ki] += quanti
+        usati_e[kj] += quanti
+        ki, kj = c["ki"].to_numpy(), c["kj"].to_numpy()
+        c = c[(usati_i[ki] < totale_i[ki]) & (usati_e[kj] < totale_e[kj])]
+    return pd.concat(abbinati, ignore_index=True).astype(candidati.dtypes.to_dict())
+
+
+def _primi(classe, validi):
+    """Maschera della prima riga valida di ogni classe."""
+    posizioni = np.flatnonzero(validi)
+    primi = np.zeros(len(classe), dtype=bool)
+    primi[posizioni[np.unique(classe[posizioni], return_index=True)[1]]] = True
+    return primi
+
+
+def _esistono(chiavi, altre):
+    """Per ogni riga di 'chiavi' (array di interi), se compare tra 'altre'."""
+    return np.isin(chiavi, altre)
+
+
+def _motivi(ci, ce, contesi, giorni):
+    """Motivo per cui ogni riga di 'ci' non è stata abbinata alle righe di 'ce'."""
+    motivi = np.full(len(ci), "assente", dtype=object)
+    if not len(ci):
+        return motivi
+    gruppo, giorno, fascia = (ci[c].to_numpy() for c in ("gruppo", "giorno", "fascia"))
+    passo_g = int(max(giorno.max(initial=0), ce["giorno"].max() if len(ce) else 0)) + giorni + 2
+    passo_f = int(max(fascia.max(initial=0), ce["fascia"].max() if len(ce) else 0)) + 3
+    # stesso gruppo e data vicina, importo troppo diverso
+    altre = ce["gruppo"].to_numpy() * passo_g + ce["giorno"].to_numpy()
+    data_ok = np.zeros(len(ci), dtype=bool)
+    for dg in range(-giorni, giorni + 1):
+        data_ok |= _esistono(gruppo * passo_g + giorno + dg, altre)
+    motivi[data_ok] = "importo_diverso"
+    # stesso gruppo e importo compatibile, data fuori finestra
+    altre = ce["gruppo"].to_numpy() * passo_f + ce["fascia"].to_numpy() + 1
+    importo_ok = np.zeros(len(ci), dtype=bool)
+    for df in (-1, 0, 1):
+        importo_ok |= _esistono(gruppo * passo_f + fascia + 1 + df, altre)
+    motivi[importo_ok & ~data_ok] = "data_diversa"
+    motivi[contesi] = "già_abbinato"
+    return motivi
+
+
+def riconcilia(interni, esterni, giorni=0, centesimi=0, relativa=0.0, cambi=None, campi=CAMPI_UGUALI):
+    """
+    Abbina uno a uno i movimenti 'interni' a quelli 'esterni' (liste di dizionari o DataFrame).
+    Due movimenti sono compatibili se 'campi' coincidono, le date distano al più
+    'giorni' e gli importi al più 'centesimi' + 'relativa' × importo (in centesimi).
+    Con 'cambi' ({valuta: cambio in EUR}) gli importi vengono confrontati in euro e la
+    valuta può differire; altrimenti deve coincidere. Le righe in una valuta senza
+    cambio (diversa da EUR) non vengono abbinate.
+    I candidati si ottengono per blocchi (gruppo, giorno, fascia d'importo) con un
+    sort-merge vettorizzato, poi vengono abbinati a partire dai più vicini.
+    Ritorna {"abbinati": DataFrame (i, j, giorni, differenza, motivo) con le posizioni
+    nei due registri, "interni": e "esterni": DataFrame delle righe non abbinate con 'motivo'}.
+    Motivi degli abbinati: "esatto" oppure "data", "arrotondamento", "importo"
+    (oltre i centesimi) e "cambio" (valute diverse) uniti da "+"; dei non abbinati: "non_valido",
+    "cambio_mancante", "già_abbinato", "data_diversa", "importo_diverso", "assente".
+    """
+    interni, esterni = normalizza(interni), normalizza(esterni)
+    senza_cambio = {}
+    if cambi:
+        # la valuta di riferimento vale 1; le righe in valute senza cambio non vengono abbinate
+        cambi = {"EUR": 1.0, **cambi}
+        for nome, righe in (("interni", interni), ("esterni", esterni)):
+            senza_cambio[nome] = (righe["valido"] & ~righe["valuta"].isin(list(cambi))).to_numpy()
+            righe.loc[senza_cambio[nome], "valido"] = False
+    ci, ce = _chiavi(interni, esterni, list(campi), cambi, giorni, centesimi, relativa)
+    vi, ve = interni["valido"].to_numpy(), esterni["valido"].to_numpy()
+    # movimenti con stessi gruppo, giorno e importo hanno gli stessi candidati: si cercano
+    # per il primo movimento valido di ogni classe, così k righe uguali non danno k² coppie
+    classe_i, classe_e = (c.groupby(["gruppo", "giorno", "cent"], sort=False, dropna=False).ngroup().to_numpy()
+                          for c in (ci, ce))
+    primi_i, primi_e = _primi(classe_i, vi), _primi(classe_e, ve)
+    candidati = _candidati(ci[primi_i], ce[primi_e], giorni, centesimi, relativa)
+    abbinati = _assegna(candidati, classe_i, classe_e, vi, ve).sort_values("i").reset_index(drop=True)
+
+    i, j = abbinati["i"].to_numpy(dtype=np.int64), abbinati["j"].to_numpy(dtype=np.int64)
+    g = abbinati["giorni"].to_numpy() != 0
+    d = np.abs(abbinati["differenza"].to_numpy())
+    cambio = interni["valuta"].to_numpy()[i] != esterni["valuta"].to_numpy()[j]
+    motivo = np.full(len(abbinati), "", dtype=object)
+    for maschera, nome in ((g, "data"), ((d > 0) & (d <= centesimi), "arrotondamento"),
+                           (d > centesimi, "importo"), (cambio, "cambio")):
+        motivo[maschera] = np.where(motivo[maschera] == "", "", motivo[maschera] + "+") + nome
+    motivo[motivo == ""] = "esatto"
+    abbinati["motivo"] = motivo
+
+    risultato = {"abbinati": abbinati}
+    for nome, righe, chiavi, altre, lato, altro_lato, valide in (
+            ("interni", interni, ci, ce, "i", "j", vi), ("esterni", esterni, ce, ci, "j", "i", ve)):
+        presi = np.zeros(len(righe), dtype=bool)
+        presi[abbinati[lato].to_numpy(dtype=np.int64)] = True
+        liberi_altri = np.ones(len(altre), dtype=bool)
+        liberi_altri[abbinati[altro_lato].to_numpy(dtype=np.int64)] = False
+        liberi_altri &= ve if lato == "i" else vi
+        resto = ~presi & valide
+        classe = classe_i if lato == "i" else classe_e
+        contesi = np.isin(classe[resto], classe[candidati[lato].to_numpy(dtype=np.int64)])
+        motivi = np.full(len(righe), "non_valido", dtype=object)
+        if nome in senza_cambio:
+            motivi[senza_cambio[nome]] = "cambio_mancante"
+        motivi[resto] = _motivi(chiavi[resto], altre[liberi_altri], contesi, giorni)
+        non_abbinati = righe.drop(columns="valido")[~presi].copy()
+        non_abbinati["motivo"] = motivi[~presi]
+        risultato[nome] = non_abbinati
+    return risultato
@@ -2,6 +2,8 @@ from datetime import datetime
 import json
 from typing import List
 
+from gestionale.indici import IndiceMovimenti
+
 class MovimentoContabile:
     def __init__(self, codice: str, descrizione: str, categoria: str, data: str, importo: float, valuta: str = "EUR", standard: str = "OIC"):
         self.codice = codice
@@ -25,20 +27,44 @@ class MovimentoContabile:
 
 class RegistroMovimenti:
     def __init__(self):
-        self.movimenti: List[MovimentoContabile] = []
+        self._movimenti: List[MovimentoContabile] = []
+        self._vista = None    # tupla di self._movimenti, ricreata solo dopo una modifica
+        self._indice = IndiceMovimenti()
+
+    @property
+    def movimenti(self) -> tuple:
+        """I movimenti in ordine di inserimento, in sola lettura: si modificano con aggiungi/rimuovi_movimento."""
+        if self._vista is None:
+            self._vista = tuple(self._movimenti)
+        return self._vista
+
+    def __len__(self):
+        return len(self._movimenti)
+
+    def __iter__(self):
+        return iter(self._movimenti)
 
     def aggiungi_movimento(self, movimento: MovimentoContabile):
-        self.movimenti.append(movimento)
+        self._movimenti.append(movimento)
+        self._vista = None
+        self._indice.aggiungi(movimento)
 
     def rimuovi_movimento(self, codice: str):
-        self.movimenti = [m for m in self.movimenti if m.codice != codice]
+        # l'indice dice se il codice esiste: la lista viene riscritta solo in quel caso
+        if self._indice.rimuovi_per("codice", codice):
+            self._movimenti = [m for m in self._movimenti if m.codice != codice]
+            self._vista = None
 
     def filtra_per_categoria(self, categoria: str) -> List[MovimentoContabile]:
-        return [m for m in self.movimenti if m.categoria == categoria]
+        return self._indice.cerca(categoria=categoria)
+
+    def cerca(self, dal=None, al=None, **criteri) -> List[MovimentoContabile]:
+        """Movimenti per categoria/codice/standard e intervallo di date (inclusi), dagli indici."""
+        return self._indice.cerca(dal, al, **criteri)
 
     def export_json(self, filename: str):
         with open(filename, 'w') as f:
-            json.dump([m.to_dict() for m in self.movimenti], f, indent=2)
+            json.dump([m.to_dict() for m in self._movimenti], f, indent=2)
 
     def carica_da_json(self, filename: str):
         with open(filename, 'r') as f:
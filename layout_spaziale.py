@@ -0,0 +1,211 @@
+# --- layout_spaziale.py ---
+# Abbinamento etichetta/valore sui prospetti usando le coordinate delle parole (PyMuPDF).
+
+import re
+from collections import defaultdict
+
+NUMERO_PAROLA = re.compile(r"^\(?[-+]?\d[\d.,]*\)?$")
+ANNO_PAROLA = re.compile(r"^(?:\d{1,2}[./]\d{1,2}[./])?((?:19|20)\d{2})$")
+
+# Dimensioni delle celle della griglia, in punti PDF
+CELLA_X = 72.0
+CELLA_Y = 12.0
+# Valori nella stessa riga dell'etichetta: centro verticale entro questa frazione dell'altezza
+TOLLERANZA_RIGA = 0.5
+# Punteggio massimo di un candidato (somma dei bonus di candidati_layout)
+PUNTEGGIO_MAX = 14
+
+
+class GrigliaParole:
+    """
+    Indice spaziale a griglia uniforme delle parole di una pagina.
+    Ogni parola è registrata nelle celle che il suo rettangolo copre;
+    una query su un rettangolo visita solo le celle che lo intersecano.
+    """
+
+    def __init__(self, parole, cella_x=CELLA_X, cella_y=CELLA_Y):
+        self.parole = parole
+        self.cella_x = cella_x
+        self.cella_y = cella_y
+        self._celle = defaultdict(list)
+        for i, w in enumerate(parole):
+            for cx in range(int(w[0] // cella_x), int(w[2] // cella_x) + 1):
+                for cy in range(int(w[1] // cella_y), int(w[3] // cella_y) + 1):
+                    self._celle[(cx, cy)].append(i)
+
+    def interroga(self, x0, y0, x1, y1):
+        """Indici (ordinati) delle parole che intersecano il rettangolo."""
+        trovate = set()
+        for cx in range(int(x0 // self.cella_x), int(x1 // self.cella_x) + 1):
+            for cy in range(int(y0 // self.cella_y), int(y1 // self.cella_y) + 1):
+                for i in self._celle.get((cx, cy), ()):
+                    w = self.parole[i]
+                    if w[0] <= x1 and w[2] >= x0 and w[1] <= y1 and w[3] >= y0:
+                        trovate.add(i)
+        return sorted(trovate)
+
+
+def valore_parola(testo):
+    """
+    Converte un numero in formato italiano (1.234,56) o inglese (1,234.56), con le
+    parentesi come segno negativo. Con entrambi i separatori il decimale è l'ultimo;
+    con uno solo è delle migliaia se ripetuto o seguito da esattamente tre cifre
+    (tranne dopo lo zero: 0,125).
+    """
+    negativo = testo.startswith("(") and testo.endswith(")")
+    testo = testo.strip("()")
+    virgola, punto = testo.rfind(","), testo.rfind(".")
+    if virgola >= 0 and punto >= 0:
+        decimale = "," if virgola > punto else "."
+    elif virgola >= 0 or punto >= 0:
+        decimale = "," if virgola >= 0 else "."
+        parti = testo.split(decimale)
+        if len(parti) > 2 or (len(parti[-1]) == 3 and parti[0].lstrip("+-") not in ("", "0")):
+            decimale = None
+    else:
+        decimale = None
+    if decimale is None:
+        testo = testo.replace(",", "").replace(".", "")
+    else:
+        testo = testo.replace("." if decimale == "," else ",", "").replace(decimale, ".")
+    try:
+        val = float(testo)
+    except ValueError:
+        return None
+    return -val if negativo else val
+
+
+def _righe_pdf(parole):
+    """Parole raggruppate per riga di PyMuPDF (blocco, riga), in ordine di lettura."""
+    righe = defaultdict(list)
+    for i, w in enumerate(parole):
+        righe[(w[5], w[6])].append(i)
+    return [sorted(idx, key=lambda i: parole[i][7]) for idx in righe.values()]
+
+
+def _colonne_anni(parole):
+    """Intestazioni di colonna con un anno: lista di (anno, x centro, y centro)."""
+    intestazioni = []
+    for w in parole:
+        m = ANNO_PAROLA.match(w[4])
+        if m:
+            intestazioni.append((int(m.group(1)), (w[0] + w[2]) / 2, (w[1] + w[3]) / 2))
+    return intestazioni
+
+
+def _colonna_corrente(intestazioni, y_etichetta):
+    """
+    X della colonna dell'esercizio corrente per un'etichetta: nella riga di
+    intestazione più vicina sopra l'etichetta, la colonna con l'anno più recente.
+    """
+    sopra = [h for h in intestazioni if h[2] < y_etichetta] or intestazioni
+    if not sopra:
+        return None
+    y_riga = max(h[2] for h in sopra)
+    riga = [h for h in sopra if abs(h[2] - y_riga) < CELLA_Y]
+    return max(riga)[1]
+
+
+def _riga_originale(righe, etichetta, num):
+    """
+    Riga del testo della pagina (celle separate da tabulazione, come nel testo
+    analizzato) con l'etichetta e il valore: è il testo salvato quando l'utente
+    conferma il valore, quindi deve ricomparire identico nel documento.
+    """
+    ll = etichetta.lower()
+    con_valore = [celle for celle in righe if num in " ".join(celle).split()]
+    for celle in con_valore:
+        if ll in " ".join(celle).lower():
+            return "\t".join(celle)
+    return "\t".join(con_valore[0]) if con_valore else None
+
+
+def candidati_layout(parole, automa, chiavi, pagina=1, righe=None):
+    """
+    Cerca le etichette delle voci nelle righe della pagina e per ognuna
+    il valore nella stessa riga e nella colonna dell'esercizio corrente.
+    'automa' e 'chiavi' sono quelli preparati per lo scanner per righe
+    (automa di tutti i termini e lista di (keyword, keyword minuscola, termini)).
+    'righe' sono le righe di celle della pagina (raggruppa_righe): se date, "riga"
+    è la riga del testo della pagina che contiene etichetta e valore.
+    Ritorna keyword → lista di candidati {"term", "valore", "score", "riga", "pagina"}.
+    """
+    if not parole:
+        return {}
+    # l'etichetta sono le parole non numeriche; gli importi possono stare nella stessa riga PDF
+    testuali = [not NUMERO_PAROLA.match(w[4]) for w in parole]
+    # termini presenti nella pagina: le parole sono in ordine di lettura, quindi ogni etichetta
+    # è una sottostringa del testo delle parole non numeriche. I confronti di sottostringa sul
+    # testo intero sono più rapidi dell'automa riga per riga, e le pagine narrative finiscono qui
+    testo = " ".join(w[4] for w, t in zip(parole, testuali) if t).lower()
+    nella_pagina = [t for t in automa.termini if t in testo]
+    if not nella_pagina:
+        return {}
+    etichette = []
+    for riga_pdf in _righe_pdf(parole):
+        idx = [i for i in riga_pdf if testuali[i]]
+        if idx:
+            etichette.append((idx, " ".join(parole[i][4] for i in idx).lower()))
+    # griglia e intestazioni servono solo se nella pagina compare almeno un'etichetta
+    griglia = None
+    risultati = defaultdict(list)
+
+    for idx, ll in etichette:
+        presenti = {t for t in nella_pagina if t in ll}
+        if not presenti:
+            continue
+        etichetta = " ".join(parole[i][4] for i in idx)
+
+        if griglia is None:
+            griglia = GrigliaParole(parole)
+            intestazioni = _colonne_anni(parole)
+            larghezza = max(w[2] for w in parole)
+
+        x1 = max(parole[i][2] for i in idx)
+        y0 = min(parole[i][1] for i in idx)
+        y1 = max(parole[i][3] for i in idx)
+        yc, h = (y0 + y1) / 2, y1 - y0
+
+        # Valori alla destra dell'etichetta, nella stessa riga
+        valori = []
+        for j in griglia.interroga(x1, yc - h * TOLLERANZA_RIGA, larghezza, yc + h * TOLLERANZA_RIGA):
+            w = parole[j]
+            if j in idx or not NUMERO_PAROLA.match(w[4]) or ANNO_PAROLA.match(w[4]):
+                continue
+            if abs((w[1] + w[3]) / 2 - yc) > h * TOLLERANZA_RIGA:
+                continue
+            val = valore_parola(w[4])
+            if val is not None:
+                valori.append(((w[0] + w[2]) / 2, val, w[4]))
+        if not valori:
+            continue
+
+        x_corrente = _colonna_corrente(intestazioni, yc)
+        if x_corrente is not None:
+            xc, val, num = min(valori, key=lambda v: abs(v[0] - x_corrente))
+        else:
+            # senza intestazioni l'esercizio corrente è la prima colonna di importi
+            importi = [v for v in valori if abs(v[1]) >= 1_000] or valori
+            xc, val, num = min(importi)
+
+        riga = (_riga_originale(righe, etichetta, num) if righe else None) or f"{etichetta}\t{num}"
+        for keyword, kw, all_terms in chiavi:
+            term_found = next((t for t in all_terms if t in presenti), None)
+            if not term_found:
+                continue
+            score = 2  # valore nella riga e nella colonna dell'etichetta
+            if kw in ll:
+                score += 4
+            if term_found != kw:
+                score += 2
+            if "totale" in ll or "total" in ll:
+                score += 2
+            if 1_000 <= abs(val) <= 100_000_000_000:
+                score += 2
+            if x_corrente is not None:
+                score += 2
+            if "note" in ll or "%" in ll:
+                score -= 2
+            risultati[keyword].append({"term": term_found, "valore": val, "score": score,
+                                       "riga": riga, "pagina": pagina})
+    return risultati
@@ -1,18 +1,47 @@
+from cache_llm import cache_risposte
+from client_llm import client_llm
 
-import requests
+# Versione del modello di prompt delle domande libere (da incrementare se cambia)
+VERSIONE_PROMPT_DOMANDA = 1
+# Passaggi del documento inviati con una domanda su un bilancio
+PASSAGGI_DOMANDA = 5
+
+def _chiave_domanda(prompt):
+    return cache_risposte.chiave(client_llm().modello, "domanda", VERSIONE_PROMPT_DOMANDA, dati=prompt)
 
 # ✅ Funzione che invia un prompt a AuditLLM (modello Mistral via Ollama)
-def chiedi_auditllm(prompt):
+def chiedi_auditllm(prompt, rigenera=False):
     try:
-        response = requests.post(
-            "http://localhost:11434/api/generate",
-            json={
-                "model": "mistral",
-                "prompt": prompt,
-                "stream": False
-            }
-        )
-        risposta = response.json()["response"]
-        return risposta.strip()
+        return cache_risposte.risposta(_chiave_domanda(prompt),
+                                       lambda: client_llm().genera(prompt), rigenera)
     except Exception as e:
         return f"⚠️ Errore nella richiesta a AuditLLM: {str(e)}"
+
+# ✅ Come chiedi_auditllm, ma restituisce la risposta un frammento alla volta
+def chiedi_auditllm_stream(prompt, rigenera=False):
+    try:
+        yield from cache_risposte.risposta_stream(_chiave_domanda(prompt),
+                                                  lambda: client_llm().genera_stream(prompt), rigenera)
+    except Exception as e:
+        yield f"⚠️ Errore nella richiesta a AuditLLM: {str(e)}"
+
+# ✅ Prompt per una domanda su un bilancio: valori estratti e solo i passaggi più pertinenti
+def prompt_documento(domanda, dati, passaggi):
+    testo = "Valori estratti dal bilancio:\n"
+    for k, v in dati.items():
+        testo += f"- {k}: {v}\n"
+    if passaggi:
+        testo += "\nPassaggi del documento pertinenti alla domanda:\n"
+        for _, pagina, blocco in passaggi:
+            testo += f"[pagina {pagina}] {blocco}\n"
+    return (
+        "Sei un revisore esperto. Rispondi alla domanda usando solo le informazioni seguenti; "
+        "se non bastano, dillo.\n\n" + testo + f"\nDomanda: {domanda}"
+    )
+
+# ✅ Carica il modello in Ollama in anticipo (errori ignorati: AuditLLM potrebbe non essere attivo)
+def precarica_auditllm():
+    try:
+        client_llm().precarica()
+    except Exception:
+        pass
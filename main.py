@@ -11,6 +11,7 @@ from utils import (
     generate_pdf_report,
     genera_commento_ai
 )
+from cache_llm import cache_risposte
 
 # Impostazioni pagina
 st.set_page_config(page_title="Audit Flow+", layout="wide")
@@ -60,18 +61,21 @@ if uploaded_file is not None:
 
         # 7) Generazione commento AI (opzionale)
         if st.checkbox("🤖 Genera commento AI con AuditLLM (GPT)"):
-            commento = genera_commento_ai(data)
+            rigenera = st.button("🔄 Rigenera commento")
+            commento = genera_commento_ai(data, rigenera=rigenera)
             st.subheader("📝 Commento generato")
             st.text_area("", commento, height=200)
+            statistiche = cache_risposte.statistiche()
+            st.caption(f"Cache commenti AI: {statistiche['colpi']} riusati, {statistiche['mancati']} generati")
 
         # 8) Scarica report PDF
         if st.button("📥 Scarica report PDF"):
             # Se non hai creato 'commento' perché non hai cliccato la checkbox,
             # lo valorizziamo a stringa vuota:
             report_comment = commento if 'commento' in locals() else ""
-            generate_pdf_report(data, df_kpis, report_comment)
-            with open("report_auditflow.pdf", "rb") as f:
-                st.download_button("📄 Download Report", f, file_name="report_auditflow.pdf")
+            pdf = generate_pdf_report(data, df_kpis, report_comment)
+            st.download_button("📄 Download Report", pdf, file_name="report_auditflow.pdf",
+                               mime="application/pdf")
 
     except Exception as e:
         st.error(f"Errore durante l'elaborazione del file: {e}")
@@ -4,23 +4,35 @@ import streamlit as st
 import os
 import sys
 import tempfile
+import numpy as np
+import pandas as pd
 
 sys.path.append("..")
 
 from utils import (
     extract_financial_data,
     calculate_kpis,
+    calcola_kpi,
+    kpi_dipendenti,
+    sensibilita_kpi,
     plot_kpis,
+    aggiorna_figure_kpi,
+    INPUT_KPI,
     salva_valore_confermato,
     generate_pdf_report,
     genera_commento_ai
 )
+from cache_llm import cache_risposte
+from commenti_batch import commenti_stream
+from stress_kpi import N_SCENARI, Normale, Triangolare, stress_test, variazioni_storiche
 
 st.title("📊 Analisi Bilanci Avanzata")
 
-uploaded_file = st.file_uploader("Carica bilancio PDF, Excel, TXT o CSV", type=["pdf", "xlsx", "xls", "txt", "csv"])
+uploaded_file = st.file_uploader("Carica bilancio PDF, Excel, XBRL, TXT o CSV",
+                                 type=["pdf", "xlsx", "xls", "xbrl", "xml", "xhtml", "txt", "csv"])
 use_debug = st.checkbox("📌 Mostra debug")
 use_llm = st.checkbox("🤖 Usa AuditLLM (se attivo)")
+use_layout = st.checkbox("📐 Abbina voci e colonne dal layout del PDF")
 debug = {}
 
 if uploaded_file:
@@ -29,25 +41,25 @@ if uploaded_file:
         tmp_file.write(uploaded_file.read())
         file_path = tmp_file.name
 
-    data, debug = extract_financial_data(file_path, return_debug=True)
+    data, debug = extract_financial_data(file_path, return_debug=True,
+                                         modalita="layout" if use_layout else "righe")
 
     st.subheader("📄 Dati suggeriti e righe candidate")
-    updated_data = {}
-    for key, righe in debug.items():
-        if isinstance(righe, list) and all(isinstance(r, dict) and "valore" in r and "riga" in r for r in righe):
-            st.markdown(f"#### 🔹 {key}")
-            opzioni = [f"{r['valore']:,.2f} — {r['riga']}" for r in righe]
-            scelta = st.radio(f"Seleziona il valore corretto per {key}:", opzioni, key=key)
-            if scelta:
-                valore_scelto = float(scelta.split("—")[0].replace(".", "").replace(",", "."))
-                testo = scelta.split("—")[1].strip()
-                salva_valore_confermato(key, testo, valore_scelto)
-                updated_data[key] = valore_scelto
-        else:
-            updated_data[key] = debug.get(key, 0)
+    updated_data = dict(data)
+    for key, righe in debug.get("righe_candidate", {}).items():
+        if not righe:
+            continue
+        st.markdown(f"#### 🔹 {key}")
+        # nessuna scelta predefinita: si salva solo una conferma esplicita dell'utente
+        scelta = st.radio(f"Seleziona il valore corretto per {key}:", range(len(righe)), index=None,
+                          format_func=lambda i, righe=righe: f"{righe[i]['valore']:,.2f} — {righe[i]['riga']}",
+                          key=key)
+        if scelta is not None:
+            salva_valore_confermato(key, righe[scelta]["riga"], righe[scelta]["valore"])
+            updated_data[key] = righe[scelta]["valore"]
 
     st.subheader("✏️ Correggi manualmente i valori:")
-    for k, v in data.items():
+    for k, v in list(updated_data.items()):
         new_val = st.text_input(f"{k}:", value=str(v))
         try:
             updated_data[k] = float(new_val)
@@ -67,49 +79,137 @@ if uploaded_file:
 
     commento = ""
     if use_llm:
+        rigenera = st.button("🔄 Rigenera commento")
         with st.spinner("Generazione commento AI in corso..."):
-            commento = genera_commento_ai(updated_data)
+            commento = genera_commento_ai(updated_data, rigenera=rigenera)
             st.subheader("🧠 Commento AuditLLM")
             st.write(commento)
+        statistiche = cache_risposte.statistiche()
+        st.caption(f"Cache commenti AI: {statistiche['colpi']} riusati, {statistiche['mancati']} generati")
 
     if st.button("📤 Scarica report PDF"):
-        generate_pdf_report(updated_data, df_kpis, commento)
-        with open("report_auditflow.pdf", "rb") as f:
-            st.download_button("⬇️ Clicca per scaricare il PDF", f, file_name="report_auditflow.pdf")
+        pdf = generate_pdf_report(updated_data, df_kpis, commento)
+        st.download_button("⬇️ Clicca per scaricare il PDF", pdf, file_name="report_auditflow.pdf",
+                           mime="application/pdf")
 
     if st.checkbox("🧪 Simula 'What if...'"):
         st.subheader("🔧 Simulazione KPI con valori ipotetici")
         dati_sim = {}
         for k, v in updated_data.items():
-            simulato = st.number_input(f"{k} simulato:", value=v)
+            simulato = st.number_input(f"{k} simulato:", value=float(v))
             dati_sim[k] = simulato
-        df_sim = calculate_kpis(dati_sim)
-        st.dataframe(df_sim)
-        fig_percentuali_sim, fig_assoluti_sim = plot_kpis(df_sim)
-        st.plotly_chart(fig_percentuali_sim, use_container_width=True)
-        st.plotly_chart(fig_assoluti_sim, use_container_width=True)
+
+        # ricalcolo incrementale: solo i KPI che dipendono dalle voci modificate
+        sim = st.session_state.get("what_if")
+        if sim is None or sim["dati"].keys() != dati_sim.keys():
+            kpi_sim = calcola_kpi(pd.DataFrame([dati_sim])).iloc[0]
+            sim = {"dati": dict(dati_sim), "kpi": kpi_sim,
+                   "figure": plot_kpis(kpi_sim.rename_axis("KPI").reset_index(name="Valore"))}
+        else:
+            cambiate = [k for k in dati_sim if dati_sim[k] != sim["dati"][k]]
+            if cambiate:
+                aggiornati = calcola_kpi(pd.DataFrame([dati_sim]), kpi_dipendenti(cambiate)).iloc[0]
+                sim["kpi"].update(aggiornati)
+                aggiorna_figure_kpi(sim["figure"], aggiornati.to_dict())
+                sim["dati"] = dict(dati_sim)
+        st.session_state["what_if"] = sim
+
+        st.dataframe(sim["kpi"].rename_axis("KPI").reset_index(name="Valore"))
+        # figure invariate → stesso contenuto, il grafico non viene ridisegnato
+        st.plotly_chart(sim["figure"][0], use_container_width=True, key="what_if_pct")
+        st.plotly_chart(sim["figure"][1], use_container_width=True, key="what_if_abs")
+
+        st.markdown("#### 📉 Sensibilità dei KPI a una voce")
+        voce = st.selectbox("Voce da variare:", list(dati_sim))
+        ampiezza = st.slider("Variazione massima (%)", 5, 50, 20)
+        sweep = sensibilita_kpi(dati_sim, voce, np.linspace(-ampiezza, ampiezza, 21) / 100)
+        if sweep.shape[1]:
+            sweep.index = (sweep.index * 100).rename("variazione (%)")
+            st.line_chart(sweep)
+        else:
+            st.info(f"Nessun KPI dipende da {voce}.")
+
+    if st.checkbox("🎲 Stress test Monte Carlo"):
+        st.subheader("🎲 Stress test dei KPI")
+        periodi = debug.get("periodi") or {}
+        storiche = (variazioni_storiche(pd.DataFrame.from_dict(periodi, orient="index"))
+                    if len(periodi) >= 2 else {})
+        tipi = ["Normale", "Triangolare"] + (["Storica"] if storiche else [])
+        voci_stress = st.multiselect("Voci da stressare:", [k for k in INPUT_KPI if k in updated_data],
+                                     default=[k for k in ("Ricavi", "Costi") if k in updated_data])
+        distribuzioni = {}
+        for voce in voci_stress:
+            c1, c2 = st.columns(2)
+            tipo = c1.selectbox(f"Distribuzione {voce}:", tipi, key=f"dist_{voce}")
+            if tipo == "Normale":
+                dev = c2.slider(f"Deviazione standard {voce} (%)", 1, 50, 10, key=f"dev_{voce}")
+                distribuzioni[voce] = Normale(dev / 100)
+            elif tipo == "Triangolare":
+                minimo, massimo = c2.slider(f"Variazione {voce} (%)", -80, 80, (-20, 10), key=f"tri_{voce}")
+                if minimo < massimo:
+                    moda = min(max(0, minimo), massimo)
+                    distribuzioni[voce] = Triangolare(minimo / 100, moda / 100, massimo / 100)
+            elif voce in storiche:
+                distribuzioni[voce] = storiche[voce]
+            else:
+                c2.caption(f"Nessuno storico per {voce}.")
+        n_scenari = st.number_input("Numero di scenari:", 1_000, 1_000_000, N_SCENARI, step=10_000)
+        if distribuzioni:
+            esito = stress_test(updated_data, distribuzioni, int(n_scenari), seed=0)
+            st.markdown("#### Bande percentili")
+            st.dataframe(esito["bande"])
+            st.markdown("#### Probabilità di violazione delle soglie")
+            st.dataframe(esito["violazioni"].rename("Probabilità")
+                         .map(lambda p: "n.d." if np.isnan(p) else f"{p:.1%}"))
+            st.bar_chart(esito["violazioni"].dropna())
+            esclusi = esito["esclusi"][esito["esclusi"] > 0]
+            if len(esclusi):
+                st.caption("Scenari esclusi perché il KPI non è definito (denominatore 0): "
+                           + ", ".join(f"{nome} {n:,} su {int(n_scenari):,}" for nome, n in esclusi.items()))
 
     if st.checkbox("📂 Confronta più bilanci"):
-        uploaded_files = st.file_uploader("Carica più bilanci", type=["pdf", "xlsx"], accept_multiple_files=True)
+        uploaded_files = st.file_uploader("Carica più bilanci", type=["pdf", "xlsx", "xbrl", "xml", "xhtml"], accept_multiple_files=True)
         dati_annuali = {}
         for f in uploaded_files:
             nome = f.name.split(".")[0]
             with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(f.name)[1]) as tmp:
                 tmp.write(f.read())
                 temp_path = tmp.name
-            dati, _ = extract_financial_data(temp_path, return_debug=False)
-            dati_annuali[nome] = dati
+            dati_annuali[nome] = extract_financial_data(temp_path, return_debug=False)
 
         if dati_annuali:
             st.subheader("📊 Confronto KPI tra anni / aziende")
-            for nome, valori in dati_annuali.items():
+            # tutti i bilanci in un'unica tabella: una riga per file, KPI calcolati per colonne
+            kpi_confronto = calcola_kpi(pd.DataFrame.from_dict(dati_annuali, orient="index"))
+            st.dataframe(kpi_confronto.T)
+            for nome, riga in kpi_confronto.iterrows():
                 st.markdown(f"#### 🔸 {nome}")
-                df_confronto = calculate_kpis(valori)
-                st.dataframe(df_confronto)
+                df_confronto = riga.rename_axis("KPI").reset_index(name="Valore")
                 fig_perc, fig_ass = plot_kpis(df_confronto)
                 st.plotly_chart(fig_perc, use_container_width=True)
                 st.plotly_chart(fig_ass, use_container_width=True)
 
+            # 🧠 Commenti di tutti i bilanci in parallelo, mostrati man mano che arrivano
+            st.subheader("🧠 Commenti AI del confronto")
+            motore = st.selectbox("Modello", ["auditllm", "openai"],
+                                  format_func={"auditllm": "AuditLLM (locale)", "openai": "OpenAI GPT"}.get)
+            col_genera, col_rigenera = st.columns(2)
+            genera = col_genera.button("🧠 Genera commenti")
+            rigenera = col_rigenera.button("🔄 Rigenera commenti")
+            if genera or rigenera:
+                riquadri = {}
+                for nome in dati_annuali:
+                    st.markdown(f"**{nome}**")
+                    riquadri[nome] = st.empty()
+                    riquadri[nome].info("⏳ In attesa del commento...")
+                for nome, commento, errore in commenti_stream(dati_annuali, motore, rigenera=rigenera):
+                    if errore:
+                        riquadri[nome].warning(f"⚠️ {errore}")
+                    else:
+                        riquadri[nome].markdown(commento)
+                statistiche = cache_risposte.statistiche()
+                st.caption(f"Cache commenti AI: {statistiche['colpi']} riusati, {statistiche['mancati']} generati")
+
     if use_debug:
         st.subheader("🔍 Debug - Testo grezzo estratto")
         st.json(debug)
@@ -6,23 +6,23 @@ import sys
 
 # Collegamento al modulo gestionale
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from gestionale.movimenti import MovimentoContabile, RegistroMovimenti
+from gestionale.movimenti import MovimentoContabile, RegistroMovimentiSQLite
 
 st.title("📂 Movimenti Gestionali")
 
-# File locale per salvataggio persistente
+# File dei movimenti salvati prima dell'archivio SQLite
 DATA_FILE = "movimenti.json"
 CONTROPARTI_FILE = "controparti.json"
-registro = RegistroMovimenti()
+# Movimenti mostrati nella tabella dei movimenti attuali
+MAX_RIGHE_VISTA = 1000
+# registro sull'archivio SQLite condiviso: all'apertura si leggono solo le righe mostrate
+registro = RegistroMovimentiSQLite()
 
-# Caricamento dati precedenti
-if os.path.exists(DATA_FILE):
-    with open(DATA_FILE, encoding="utf-8") as f:
-        try:
-            lista = json.load(f)
-            registro.carica_da_lista(lista)
-        except Exception as e:
-            st.error(f"Errore caricamento dati esistenti: {e}")
+# Importazione una tantum dei movimenti salvati nel file JSON
+try:
+    registro.importa_da_file(DATA_FILE)
+except Exception as e:
+    st.error(f"Errore caricamento dati esistenti: {e}")
 
 # Caricamento controparti
 controparti = {}
@@ -80,9 +80,6 @@ with st.form("aggiungi_movimento"):
         )
         registro.aggiungi_movimento(movimento)
 
-        with open(DATA_FILE, "w", encoding="utf-8") as f:
-            json.dump([m.to_dict() for m in registro.movimenti], f, indent=2)
-
         if controparte:
             controparti[data.strftime("%Y-%m-%d") + ":" + descrizione] = controparte
             with open(CONTROPARTI_FILE, "w", encoding="utf-8") as f:
@@ -91,11 +88,26 @@ with st.form("aggiungi_movimento"):
         st.success("✅ Movimento aggiunto correttamente!")
 
 st.markdown("### 📋 Movimenti attuali")
-if registro.movimenti:
-    st.dataframe([m.to_dict() for m in registro.movimenti], use_container_width=True)
+if registro:
+    ultimi = registro.ultimi(MAX_RIGHE_VISTA)
+    if len(ultimi) == MAX_RIGHE_VISTA:
+        st.caption(f"Ultimi {MAX_RIGHE_VISTA} movimenti registrati")
+    st.dataframe(ultimi.tabella(), use_container_width=True)
 else:
     st.info("Nessun movimento ancora registrato.")
 
+st.markdown("### 🔎 Cerca movimenti")
+col_cat, col_dal, col_al = st.columns(3)
+categoria_cercata = col_cat.selectbox("Categoria", ["Tutte", "Vendite", "Acquisti", "Finanziamenti", "Cassa", "Banca"])
+dal = col_dal.date_input("Dal", value=None)
+al = col_al.date_input("Al", value=None)
+if categoria_cercata != "Tutte" or dal or al:
+    # ricerca sugli indici (categoria e date ordinate), senza scorrere tutto il registro
+    criteri = {} if categoria_cercata == "Tutte" else {"categoria": categoria_cercata}
+    trovati = registro.cerca(dal=dal, al=al, **criteri)
+    st.caption(f"{len(trovati)} movimenti trovati")
+    st.dataframe(trovati.tabella(), use_container_width=True)
+
 st.markdown("### Totali per categoria")
 st.json(registro.totali_per_categoria())
 
@@ -111,20 +123,31 @@ soglia = st.number_input("Soglia importo (default: 1.000.000)", value=1_000_000)
 sospetti = registro.verifica_movimenti_sospetti(soglia)
 if sospetti:
     st.warning("⚠️ Movimenti sospetti trovati:")
-    st.dataframe([m.to_dict() for m in sospetti])
+    st.dataframe(sospetti.tabella())
 else:
     st.success("✅ Nessun movimento sospetto oltre la soglia.")
 
 st.markdown("### 🔁 Verifica coerenza con registro esterno")
 file_esterno = st.file_uploader("Carica file JSON (es. clienti, fornitori, banche)", type="json")
+col_giorni, col_cent = st.columns(2)
+tolleranza_giorni = col_giorni.number_input("Tolleranza date (giorni)", min_value=0, max_value=30, value=0)
+tolleranza_centesimi = col_cent.number_input("Tolleranza importi (centesimi)", min_value=0, value=0)
 if file_esterno:
     try:
         registro_esterno = json.load(file_esterno)
-        differenze = registro.verifica_incoerenze_con_registro(registro_esterno)
-        if differenze:
+        esito = registro.riconcilia(registro_esterno, giorni=int(tolleranza_giorni),
+                                    centesimi=int(tolleranza_centesimi))
+        abbinati = esito["abbinati"]
+        st.caption(f"{len(abbinati)} movimenti abbinati, di cui {(abbinati['motivo'] != 'esatto').sum()} "
+                   f"entro le tolleranze")
+        differenze = esito["interni"]
+        if len(differenze):
             st.error("❌ Movimenti non trovati nel registro esterno:")
-            st.dataframe([m.to_dict() for m in differenze])
+            st.dataframe(differenze, use_container_width=True)
         else:
             st.success("✅ Tutti i movimenti sono coerenti con il registro esterno.")
+        if len(esito["esterni"]):
+            st.warning(f"⚠️ {len(esito['esterni'])} record del registro esterno senza movimento corrispondente:")
+            st.dataframe(esito["esterni"], use_container_width=True)
     except Exception as e:
         st.error(f"Errore nella lettura del file JSON: {e}")
@@ -8,15 +8,14 @@ import io
 import pandas as pd
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from gestionale.anagrafica import AnagraficaVoce, RegistroAnagrafica
+from gestionale.anagrafica import AnagraficaVoce, RegistroAnagraficaSQLite
 
 st.title("📇 Anagrafica Clienti e Fornitori")
 
+# File dell'anagrafica salvata prima dell'archivio SQLite, importato una volta
 DATA_FILE = "anagrafica.json"
-registro = RegistroAnagrafica()
-
-if os.path.exists(DATA_FILE):
-    registro.carica_da_file(DATA_FILE)
+registro = RegistroAnagraficaSQLite()
+registro.importa_da_file(DATA_FILE)
 
 st.subheader("➕ Aggiungi Cliente o Fornitore")
 
@@ -39,7 +38,6 @@ with st.form("aggiungi_voce"):
             email=email
         )
         registro.aggiungi_voce(nuova_voce)
-        registro.salva_su_file(DATA_FILE)
         st.success("✅ Voce aggiunta correttamente!")
 
 st.subheader("🔍 Ricerca e Filtro")
@@ -47,12 +45,7 @@ st.subheader("🔍 Ricerca e Filtro")
 search_query = st.text_input("Cerca (nome, codice, P.IVA, email, ecc.)")
 tipo_filtro = st.selectbox("Filtra per tipo", ["Tutti", "Cliente", "Fornitore"])
 
-voci_visualizzate = [v for v in registro.voci if
-                     ((tipo_filtro == "Tutti") or (v.tipo == tipo_filtro)) and
-                     (search_query.lower() in v.codice.lower() or
-                      search_query.lower() in v.ragione_sociale.lower() or
-                      search_query.lower() in v.partita_iva.lower() or
-                      search_query.lower() in v.email.lower())]
+voci_visualizzate = registro.cerca(search_query, None if tipo_filtro == "Tutti" else tipo_filtro)
 
 st.subheader("📋 Voci registrate")
 
@@ -76,13 +69,14 @@ if voci_visualizzate:
                     conferma = st.form_submit_button("💾 Salva modifiche")
 
                     if conferma:
+                        codice_precedente = voce.codice
                         voce.codice = nuovo_codice
                         voce.ragione_sociale = nuova_ragione
                         voce.tipo = nuovo_tipo
                         voce.indirizzo = nuovo_indirizzo
                         voce.partita_iva = nuova_piva
                         voce.email = nuova_email
-                        registro.salva_su_file(DATA_FILE)
+                        registro.aggiorna_voce(codice_precedente, voce)
                         st.success("✅ Modifiche salvate!")
 
             if elimina:
@@ -91,8 +85,7 @@ if voci_visualizzate:
     if voci_da_eliminare:
         if st.button("🗑️ Elimina voci selezionate"):
             for voce in voci_da_eliminare:
-                registro.voci.remove(voce)
-            registro.salva_su_file(DATA_FILE)
+                registro.rimuovi_voce(voce.codice)
             st.success(f"{len(voci_da_eliminare)} voce/i eliminata/e correttamente!")
             st.experimental_rerun()
 
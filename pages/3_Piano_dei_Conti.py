@@ -6,13 +6,14 @@ import sys
 
 # Import modulo gestionale
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from gestionale.piano_conti import PianoDeiConti, VoceConto
+from gestionale.piano_conti import PianoDeiContiSQLite, VoceConto
 
 st.title("📘 Piano dei Conti")
 
+# File del piano salvato prima dell'archivio SQLite, importato una volta
 DATA_FILE = "piano_conti.json"
-piano = PianoDeiConti()
-piano.carica_da_file(DATA_FILE)
+piano = PianoDeiContiSQLite()
+piano.importa_da_file(DATA_FILE)
 
 # Aggiungi nuova voce
 st.subheader("➕ Aggiungi una nuova voce")
@@ -30,12 +31,11 @@ with st.form("aggiungi_voce"):
         else:
             voce = VoceConto(codice, descrizione, tipo, categoria)
             piano.aggiungi_voce(voce)
-            piano.salva_su_file(DATA_FILE)
             st.success("✅ Voce aggiunta correttamente!")
 
 # Visualizza piano dei conti
 st.subheader("📋 Piano dei conti attuale")
-if piano.voci:
+if piano:
     st.dataframe(piano.to_list(), use_container_width=True)
 else:
     st.info("Nessuna voce ancora inserita.")
@@ -47,7 +47,6 @@ if st.button("Elimina"):
     voce = piano.cerca_voce(codice_da_rimuovere)
     if voce:
         piano.rimuovi_voce(codice_da_rimuovere)
-        piano.salva_su_file(DATA_FILE)
         st.success(f"✅ Voce {codice_da_rimuovere} rimossa.")
     else:
         st.error("❌ Codice non trovato nel piano.")
@@ -1,19 +1,26 @@
 import streamlit as st
+import os
+import tempfile
 from utils import extract_financial_data, calculate_kpis, plot_kpis
-from analisi_llm import genera_commento_llm
+from analisi_llm import genera_commento_llm_stream
+from cache_llm import cache_risposte
 
 st.set_page_config(page_title="📈 Report & KPI", layout="wide")
 st.title("📈 Report & KPI")
 
-uploaded_file = st.file_uploader("📁 Carica un bilancio (PDF o Excel)", type=["pdf", "xlsx", "xls"])
-use_gpt = st.checkbox("Fallback GPT (solo se attivo)", value=False)
+uploaded_file = st.file_uploader("📁 Carica un bilancio (PDF, Excel o XBRL)",
+                                 type=["pdf", "xlsx", "xls", "xbrl", "xml", "xhtml"])
 
 if uploaded_file:
-    with open("temp_report_file", "wb") as f:
-        f.write(uploaded_file.read())
+    # Il file temporaneo mantiene l'estensione: serve a scegliere il parser.
+    # I rerun successivi sullo stesso file vengono serviti dalla cache di estrazione.
+    file_ext = os.path.splitext(uploaded_file.name)[1]
+    with tempfile.NamedTemporaryFile(delete=False, suffix=file_ext) as tmp_file:
+        tmp_file.write(uploaded_file.read())
+        file_path = tmp_file.name
 
     with st.spinner("Estrazione e analisi in corso..."):
-        data, _ = extract_financial_data("temp_report_file", return_debug=True, use_gpt=use_gpt)
+        data, _ = extract_financial_data(file_path, return_debug=True)
         kpi_df = calculate_kpis(data)
 
     st.subheader("📄 Dati Estratti")
@@ -24,8 +31,10 @@ if uploaded_file:
     st.plotly_chart(plot_kpis(kpi_df), use_container_width=True)
 
     st.subheader("🧠 Analisi AI - AuditLLM")
-    if st.button("🔍 Genera Commento AI"):
-        with st.spinner("AuditLLM sta analizzando..."):
-            commento = genera_commento_llm(data, kpi_df)
+    genera = st.button("🔍 Genera Commento AI")
+    rigenera = st.button("🔄 Rigenera commento")
+    if genera or rigenera:
         st.markdown("### 💬 Commento AuditLLM")
-        st.write(commento)
+        commento = st.write_stream(genera_commento_llm_stream(data, kpi_df, rigenera=rigenera))
+        statistiche = cache_risposte.statistiche()
+        st.caption(f"Cache commenti AI: {statistiche['colpi']} riusati, {statistiche['mancati']} generati")
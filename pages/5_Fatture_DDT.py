@@ -4,20 +4,19 @@ import datetime
 import os
 import sys
 import io
-import pandas as pd
 
 # Collegamento al modulo gestionale
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from gestionale.fatture import Documento, RegistroDocumenti
+from gestionale.fatture import Documento, RegistroDocumentiSQLite
 
 st.title("📄 Fatture e Documenti di Trasporto")
 
+# File dei documenti salvati prima dell'archivio SQLite
 DOCUMENTI_FILE = "documenti.json"
-registro = RegistroDocumenti()
+registro = RegistroDocumentiSQLite()
 
-# Caricamento documenti esistenti
-if os.path.exists(DOCUMENTI_FILE):
-    registro.carica_da_file(DOCUMENTI_FILE)
+# Importazione una tantum dei documenti salvati nel file JSON
+registro.importa_da_file(DOCUMENTI_FILE)
 
 # Aggiunta documento
 st.subheader("➕ Aggiungi documento")
@@ -41,7 +40,6 @@ with st.form("form_doc"):
             descrizione=descrizione
         )
         registro.aggiungi_documento(doc)
-        registro.salva_su_file(DOCUMENTI_FILE)
         st.success("✅ Documento salvato correttamente!")
 
 # 📅 Filtro per periodo
@@ -50,11 +48,6 @@ st.subheader("📆 Filtro per Periodo")
 data_inizio = st.date_input("Data inizio", value=datetime.date.today().replace(day=1))
 data_fine = st.date_input("Data fine", value=datetime.date.today())
 
-docs_filtrati = [
-    d for d in registro.documenti
-    if data_inizio <= datetime.datetime.strptime(d.data, "%Y-%m-%d").date() <= data_fine
-]
-
 # 🔍 Ricerca
 st.subheader("🔍 Ricerca Fattura o DDT")
 
@@ -70,17 +63,13 @@ criteri = {
 criterio = st.selectbox("Cerca per", list(criteri.keys()))
 valore = st.text_input("Inserisci il valore da cercare")
 
-if valore:
-    docs_filtrati = [
-        d for d in docs_filtrati
-        if valore.lower() in str(getattr(d, criteri[criterio])).lower()
-    ]
+# filtri eseguiti dall'archivio: si leggono solo i documenti del periodo che contengono il valore
+df_docs = registro.tabella(dal=data_inizio, al=data_fine, campo=criteri[criterio], testo=valore)
 
 # 📊 Dashboard riepilogativa
 st.subheader("📊 Riepilogo Statistico")
 
-if docs_filtrati:
-    df_docs = pd.DataFrame([vars(d) for d in docs_filtrati])
+if len(df_docs):
     fatturato_totale = df_docs["importo"].sum()
     media_per_tipo = df_docs.groupby("tipo")["importo"].mean().round(2)
 
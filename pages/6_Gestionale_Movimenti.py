@@ -1,21 +1,22 @@
 import streamlit as st
 import os
+import sys
 import json
 import pandas as pd
 from datetime import datetime
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from gestionale.giornale import apri_giornale
+
 MOVIMENTI_FILE = "gestionale/movimenti_estesi.json"
 CLIENTI_FORNITORI_FILE = "gestionale/clienti_fornitori.json"
 FATTURE_FILE = "gestionale/fatture_ddt.json"
 
 st.title("📘 Registro Movimenti Contabili Estesi")
 
-# Caricamento dati esistenti
-if os.path.exists(MOVIMENTI_FILE):
-    with open(MOVIMENTI_FILE, "r") as f:
-        movimenti = json.load(f)
-else:
-    movimenti = []
+# Caricamento dati esistenti: istantanea più giornale dei movimenti aggiunti dopo
+giornale = apri_giornale(MOVIMENTI_FILE)
+movimenti = giornale.carica()
 
 # Carica clienti/fornitori
 if os.path.exists(CLIENTI_FORNITORI_FILE):
@@ -58,8 +59,7 @@ if st.button("💾 Salva movimento"):
         "descrizione": descrizione
     }
     movimenti.append(nuovo)
-    with open(MOVIMENTI_FILE, "w") as f:
-        json.dump(movimenti, f, indent=2)
+    giornale.aggiungi(nuovo)
     st.success("✅ Movimento salvato!")
 
 # Visualizza
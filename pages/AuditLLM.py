@@ -1,16 +1,56 @@
 
+import os
+import tempfile
+import threading
+
 import streamlit as st
-from llm_utils import chiedi_auditllm
+from cache_llm import cache_risposte
+from llm_utils import PASSAGGI_DOMANDA, chiedi_auditllm_stream, precarica_auditllm, prompt_documento
+from ricerca_documento import indice_documento
+from utils import dati_e_pagine
 
 st.set_page_config(page_title="AuditLLM Assistant", layout="centered")
 st.title("🧠 AuditLLM - La tua AI offline")
 
 st.markdown("Fai una domanda alla tua AI autonoma basata su Mistral 7B.")
 
+# il modello viene caricato in background mentre si scrive il prompt
+if "auditllm_precaricato" not in st.session_state:
+    st.session_state["auditllm_precaricato"] = True
+    threading.Thread(target=precarica_auditllm, daemon=True).start()
+
+# 📎 Bilancio di riferimento: nel prompt vanno i valori estratti e solo i passaggi pertinenti
+documento = st.file_uploader("📎 Bilancio su cui fare domande (opzionale)",
+                             type=["pdf", "txt", "md", "csv", "xlsx", "xls", "xbrl", "xml", "xhtml"])
+indice = None
+if documento:
+    with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(documento.name)[1]) as tmp:
+        tmp.write(documento.read())
+        file_path = tmp.name
+    with st.spinner("Estrazione e indicizzazione del documento..."):
+        dati, _, pagine = dati_e_pagine(file_path)
+        indice = indice_documento(file_path, pagine)
+    st.caption(f"{len(pagine)} pagine, {len(indice.blocchi)} passaggi indicizzati")
+
 prompt = st.text_area("📥 Inserisci il tuo prompt", height=200)
+k = st.slider("Passaggi del documento da inviare", 1, 15, PASSAGGI_DOMANDA) if documento else 0
 
-if st.button("🤖 Rispondi con AuditLLM") and prompt.strip():
-    with st.spinner("AuditLLM sta pensando..."):
-        risposta = chiedi_auditllm(prompt)
+col1, col2 = st.columns(2)
+rispondi = col1.button("🤖 Rispondi con AuditLLM")
+rigenera = col2.button("🔄 Rigenera risposta")
+if (rispondi or rigenera) and prompt.strip():
+    domanda = prompt
+    if indice is not None:
+        passaggi = indice.cerca(prompt, k)
+        domanda = prompt_documento(prompt, dati, passaggi)
+        parole_documento = sum(len(p.split()) for p in pagine)
+        st.caption(f"Prompt di {len(domanda.split())} parole invece delle {parole_documento} del documento")
+        with st.expander("📑 Passaggi inviati"):
+            for punteggio, pagina, testo in passaggi:
+                st.markdown(f"**Pagina {pagina}** (BM25 {punteggio:.2f})")
+                st.text(testo)
     st.subheader("📤 Risposta di AuditLLM:")
-    st.write(risposta)
+    # i token vengono mostrati man mano che il modello li genera
+    st.write_stream(chiedi_auditllm_stream(domanda, rigenera=rigenera))
+    statistiche = cache_risposte.statistiche()
+    st.caption(f"Cache risposte: {statistiche['colpi']} riusate, {statistiche['mancati']} generate")
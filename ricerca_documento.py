@@ -0,0 +1,170 @@
+# --- ricerca_documento.py ---
+# Ricerca BM25 nei testi di un bilancio: solo i passaggi pertinenti alla domanda finiscono nel prompt di AuditLLM.
+
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+
+import numpy as np
+
+from cache_estrazione import CacheEstrazione, hash_file
+
+CACHE_INDICI_DIR = os.path.join(".auditflow_cache", "indici")
+# Incrementare se cambiano tokenizzazione o suddivisione in blocchi
+VERSIONE_INDICE = 2
+PAROLE_PER_BLOCCO = 120
+SOVRAPPOSIZIONE = 30
+K1 = 1.5
+B = 0.75
+# Indici tenuti in memoria dal processo
+MAX_INDICI_MEMORIA = 8
+
+PAROLA = re.compile(r"[a-zà-ÿ0-9]+")
+STOPWORD = frozenset("""
+    il lo la i gli le un uno una di del dello della dei degli delle a al allo alla ai agli alle
+    da dal dallo dalla dai dagli dalle in nel nello nella nei negli nelle su sul sullo sulla sui
+    sugli sulle per con tra fra e ed o od che chi cui non più come anche se ma è sono era essere
+    ha hanno questo questa questi queste quello quella quelli quelle suo sua suoi sue loro
+    the of and to in for on at by is are was
+""".split())
+
+
+def termini(testo):
+    """
+    Termini di ricerca di un testo: parole minuscole senza stopword, con la vocale
+    finale tolta dalle parole lunghe (ricavi/ricavo → ricav, debiti/debito → debit).
+    """
+    risultato = []
+    for parola in PAROLA.findall(testo.lower()):
+        if parola in STOPWORD or len(parola) < 2:
+            continue
+        if len(parola) > 4 and parola[-1] in "aeiouàèéìòù":
+            parola = parola[:-1]
+        risultato.append(parola)
+    return risultato
+
+
+def blocchi_pagine(pagine, parole_per_blocco=PAROLE_PER_BLOCCO, sovrapposizione=SOVRAPPOSIZIONE):
+    """Divide ogni pagina in blocchi di 'parole_per_blocco' parole, sovrapposti: [(n. pagina, testo)]."""
+    passo = max(1, parole_per_blocco - sovrapposizione)
+    blocchi = []
+    for n, testo in enumerate(pagine, 1):
+        parole = testo.split()
+        for inizio in range(0, max(1, len(parole) - sovrapposizione), passo):
+            parte = parole[inizio:inizio + parole_per_blocco]
+            if parte:
+                blocchi.append((n, " ".join(parte)))
+    return blocchi
+
+
+class IndiceBM25:
+    """
+    Indice invertito BM25 dei blocchi di un documento, in array numpy:
+    per il termine t, doc[inizio[t]:inizio[t + 1]] sono i blocchi che lo contengono
+    e tf le sue occorrenze. Il punteggio di una domanda è calcolato per tutti
+    i blocchi insieme, sommando i contributi dei suoi termini con np.bincount.
+    """
+
+    def __init__(self, blocchi, vocabolario, inizio, doc, tf, lunghezze, k1=K1, b=B):
+        self.blocchi = blocchi
+        self.vocabolario = vocabolario
+        self.inizio = inizio
+        self.doc = doc
+        self.tf = tf
+        self.lunghezze = lunghezze
+        self.k1 = k1
+        self.b = b
+        n = len(blocchi)
+        df = np.diff(inizio)
+        self.idf = np.log(1 + (n - df + 0.5) / (df + 0.5))
+        media = lunghezze.mean() if n else 1.0
+        # parte del denominatore BM25 che dipende solo dalla lunghezza del blocco
+        self._norma = k1 * (1 - b + b * lunghezze / (media or 1.0))
+
+    @classmethod
+    def costruisci(cls, blocchi, **parametri):
+        """Indice dei blocchi [(n. pagina, testo)]."""
+        vocabolario = {}
+        righe, colonne, conteggi = [], [], []
+        lunghezze = np.zeros(len(blocchi))
+        for i, (_, testo) in enumerate(blocchi):
+            tokens = termini(testo)
+            lunghezze[i] = len(tokens)
+            for termine, c in Counter(tokens).items():
+                righe.append(vocabolario.setdefault(termine, len(vocabolario)))
+                colonne.append(i)
+                conteggi.append(c)
+        righe = np.asarray(righe, dtype=np.int64)
+        ordine = np.argsort(righe, kind="stable")
+        inizio = np.zeros(len(vocabolario) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(righe, minlength=len(vocabolario)), out=inizio[1:])
+        return cls(blocchi, vocabolario, inizio,
+                   np.asarray(colonne, dtype=np.int64)[ordine],
+                   np.asarray(conteggi, dtype=np.float64)[ordine], lunghezze, **parametri)
+
+    def punteggi(self, domanda):
+        """Punteggio BM25 di ogni blocco per 'domanda' (array lungo quanto i blocchi)."""
+        ids = [self.vocabolario[t] for t in dict.fromkeys(termini(domanda)) if t in self.vocabolario]
+        if not ids:
+            return np.zeros(len(self.blocchi))
+        posizioni = np.concatenate([np.arange(self.inizio[t], self.inizio[t + 1]) for t in ids])
+        pesi = np.repeat(self.idf[ids], np.diff(self.inizio)[ids])
+        doc, tf = self.doc[posizioni], self.tf[posizioni]
+        contributi = pesi * tf * (self.k1 + 1) / (tf + self._norma[doc])
+        return np.bincount(doc, weights=contributi, minlength=len(self.blocchi))
+
+    def cerca(self, domanda, k=5):
+        """I 'k' blocchi più pertinenti: [(punteggio, n. pagina, testo)], senza blocchi a punteggio 0."""
+        punteggi = self.punteggi(domanda)
+        k = min(k, len(punteggi))
+        if k == 0:
+            return []
+        migliori = np.argpartition(-punteggi, k - 1)[:k]
+        migliori = migliori[np.argsort(-punteggi[migliori], kind="stable")]
+        return [(float(punteggi[i]), *self.blocchi[i]) for i in migliori if punteggi[i] > 0]
+
+    def a_dict(self):
+        termini_ordinati = sorted(self.vocabolario, key=self.vocabolario.get)
+        return {"blocchi": self.blocchi, "termini": termini_ordinati, "inizio": self.inizio.tolist(),
+                "doc": self.doc.tolist(), "tf": self.tf.tolist(), "lunghezze": self.lunghezze.tolist()}
+
+    @classmethod
+    def da_dict(cls, d, **parametri):
+        return cls([tuple(b) for b in d["blocchi"]], {t: i for i, t in enumerate(d["termini"])},
+                   np.asarray(d["inizio"], dtype=np.int64), np.asarray(d["doc"], dtype=np.int64),
+                   np.asarray(d["tf"], dtype=np.float64), np.asarray(d["lunghezze"], dtype=np.float64),
+                   **parametri)
+
+
+_cache_indici = CacheEstrazione(CACHE_INDICI_DIR)
+_in_memoria = OrderedDict()
+_lock = threading.Lock()
+
+
+def indice_documento(file_path, pagine):
+    """
+    Indice BM25 delle 'pagine' del documento, riusato per documenti con lo stesso
+    contenuto: prima dalla memoria del processo, poi dalla cache su disco (per hash del file).
+    """
+    chiave = f"{hash_file(file_path)}-v{VERSIONE_INDICE}-{PAROLE_PER_BLOCCO}-{SOVRAPPOSIZIONE}"
+    with _lock:
+        if chiave in _in_memoria:
+            _in_memoria.move_to_end(chiave)
+            return _in_memoria[chiave]
+
+    salvato = _cache_indici.leggi(chiave)
+    if salvato is not None:
+        indice = IndiceBM25.da_dict(salvato)
+    else:
+        indice = IndiceBM25.costruisci(blocchi_pagine(pagine))
+        try:
+            _cache_indici.scrivi(chiave, indice.a_dict())
+        except OSError:
+            pass
+
+    with _lock:
+        _in_memoria[chiave] = indice
+        while len(_in_memoria) > MAX_INDICI_MEMORIA:
+            _in_memoria.popitem(last=False)
+    return indice
@@ -0,0 +1,188 @@
+# --- ricerca_termini.py ---
+# Strutture di ricerca testuale usate dall'estrazione dei valori di bilancio.
+
+from collections import deque
+
+
+class AhoCorasick:
+    """
+    Automa Aho-Corasick su un insieme di termini (già normalizzati).
+    Una sola scansione del testo restituisce tutti i termini presenti,
+    comprese le occorrenze sovrapposte (es. "ebit" dentro "ebitda").
+    Con dfa=True (default) le transizioni vengono completate in un DFA, più veloce
+    in scansione; per vocabolari grandi dfa=False segue i link di fallimento
+    e occupa molta meno memoria.
+    """
+
+    def __init__(self, termini, dfa=True):
+        self.termini = list(dict.fromkeys(termini))
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [()]
+
+        for idx, termine in enumerate(self.termini):
+            stato = 0
+            for ch in termine:
+                nxt = self._goto[stato].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[stato][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(())
+                stato = nxt
+            self._output[stato] = self._output[stato] + (idx,)
+
+        # Costruzione dei link di fallimento in ampiezza
+        ordine = []
+        coda = deque(self._goto[0].values())
+        while coda:
+            stato = coda.popleft()
+            ordine.append(stato)
+            for ch, nxt in self._goto[stato].items():
+                coda.append(nxt)
+                f = self._fail[stato]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                cand = self._goto[f].get(ch, 0)
+                self._fail[nxt] = cand if cand != nxt else 0
+                self._output[nxt] = self._output[nxt] + self._output[self._fail[nxt]]
+
+        # Transizioni complete (DFA): in scansione non si seguono più i link di fallimento
+        self._delta = None
+        if not dfa:
+            return
+        self._delta = [dict(self._goto[0])] + [None] * (len(self._goto) - 1)
+        for stato in ordine:
+            delta = dict(self._delta[self._fail[stato]])
+            delta.update(self._goto[stato])
+            self._delta[stato] = delta
+
+    def trova(self, testo):
+        """Restituisce l'insieme degli indici dei termini presenti in 'testo'."""
+        if self._delta is None:
+            return self._trova_nfa(testo)
+        delta, output = self._delta, self._output
+        trovati = set()
+        stato = 0
+        for ch in testo:
+            stato = delta[stato].get(ch, 0)
+            if output[stato]:
+                trovati.update(output[stato])
+        return trovati
+
+    def _trova_nfa(self, testo):
+        goto, fail, output = self._goto, self._fail, self._output
+        trovati = set()
+        stato = 0
+        for ch in testo:
+            while stato and ch not in goto[stato]:
+                stato = fail[stato]
+            stato = goto[stato].get(ch, 0)
+            if output[stato]:
+                trovati.update(output[stato])
+        return trovati
+
+    def termini_presenti(self, testo):
+        """Come trova(), ma restituisce i termini invece degli indici."""
+        return {self.termini[i] for i in self.trova(testo)}
+
+
+def trigrammi(testo):
+    """Multinsieme (dict trigramma→occorrenze) dei trigrammi di 'testo'."""
+    conteggi = {}
+    for i in range(len(testo) - 2):
+        g = testo[i:i + 3]
+        conteggi[g] = conteggi.get(g, 0) + 1
+    return conteggi
+
+
+def distanza_limitata(a, b, limite):
+    """
+    Distanza di Levenshtein tra 'a' e 'b' calcolata solo nella banda di larghezza 'limite'.
+    Si interrompe appena la distanza supera il limite e in quel caso restituisce limite + 1.
+    """
+    if len(a) > len(b):
+        a, b = b, a
+    la, lb = len(a), len(b)
+    if lb - la > limite:
+        return limite + 1
+    if la == 0:
+        return lb
+
+    oltre = limite + 1
+    prec = [j if j <= limite else oltre for j in range(lb + 1)]
+    for i in range(1, la + 1):
+        ca = a[i - 1]
+        inizio = max(1, i - limite)
+        fine = min(lb, i + limite)
+        corr = [oltre] * (lb + 1)
+        corr[0] = i if i <= limite else oltre
+        minimo = corr[0] if inizio == 1 else oltre
+        for j in range(inizio, fine + 1):
+            costo = 0 if ca == b[j - 1] else 1
+            v = min(prec[j] + 1, corr[j - 1] + 1, prec[j - 1] + costo)
+            if v > oltre:
+                v = oltre
+            corr[j] = v
+            if v < minimo:
+                minimo = v
+        if minimo > limite:
+            return oltre
+        prec = corr
+    return prec[lb] if prec[lb] <= limite else oltre
+
+
+class IndiceTrigrammi:
+    """
+    Indice a trigrammi di un vocabolario di termini per il confronto approssimato.
+    Un termine corrisponde a un testo se la similarità 1 - distanza / lunghezza massima
+    è almeno 'soglia'. I candidati vengono filtrati per lunghezza e per numero di
+    trigrammi in comune (q-gram lemma, senza falsi negativi) e solo questi vengono
+    verificati con la distanza di edit limitata.
+    """
+
+    def __init__(self, termini, soglia=0.85):
+        self.termini = list(dict.fromkeys(termini))
+        self.soglia = soglia
+        self._lunghezze = [len(t) for t in self.termini]
+        self._max_len = max(self._lunghezze, default=0)
+        self._postings = {}
+        for idx, termine in enumerate(self.termini):
+            for g, n in trigrammi(termine).items():
+                self._postings.setdefault(g, []).append((idx, n))
+
+    def _limite(self, la, lb):
+        return int((1 - self.soglia) * max(la, lb) + 1e-9)
+
+    def candidati(self, testo):
+        """Indici dei termini che superano i filtri di lunghezza e di trigrammi."""
+        lt = len(testo)
+        # Righe troppo lunghe non possono corrispondere a nessun termine
+        if lt * self.soglia > self._max_len:
+            return []
+
+        comuni = {}
+        for g, n in trigrammi(testo).items():
+            for idx, nt in self._postings.get(g, ()):
+                comuni[idx] = comuni.get(idx, 0) + min(n, nt)
+
+        risultato = []
+        for idx, lunghezza in enumerate(self._lunghezze):
+            limite = self._limite(lunghezza, lt)
+            if abs(lunghezza - lt) > limite:
+                continue
+            if comuni.get(idx, 0) >= max(lunghezza, lt) - 2 - 3 * limite:
+                risultato.append(idx)
+        return risultato
+
+    def corrispondenze(self, testo):
+        """Insieme dei termini simili a 'testo' oltre la soglia."""
+        trovati = set()
+        lt = len(testo)
+        for idx in self.candidati(testo):
+            termine = self.termini[idx]
+            limite = self._limite(len(termine), lt)
+            if distanza_limitata(termine, testo, limite) <= limite:
+                trovati.add(termine)
+        return trovati
@@ -0,0 +1,142 @@
+# --- stress_kpi.py ---
+# Stress test Monte Carlo dei KPI: variazioni casuali sulle voci, scenari calcolati per colonne.
+
+import operator
+
+import numpy as np
+import pandas as pd
+
+from utils import INPUT_KPI, calcola_kpi, kpi_indefiniti
+
+# Soglie di allerta per la continuità aziendale: (KPI, confronto, valore)
+SOGLIE_CONTINUITA = [
+    ("Current Ratio", "<", 1),
+    ("Cash Ratio", "<", 0.2),
+    ("Debt to Equity", ">", 3),
+    ("Copertura Interessi", "<", 1.5),
+    ("Return on Equity (ROE)", "<", 0),
+    ("Indice di solidità patrimoniale", "<", 0.1),
+]
+PERCENTILI = (5, 25, 50, 75, 95)
+N_SCENARI = 100_000
+
+_CONFRONTI = {"<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge}
+
+
+class Normale:
+    """Variazione relativa normale (es. dev_std=0.1: ±10% a una deviazione standard)."""
+
+    def __init__(self, dev_std, media=0.0):
+        self.dev_std = dev_std
+        self.media = media
+
+    def campiona(self, rng, n, estratti=None):
+        return rng.normal(self.media, self.dev_std, n)
+
+
+class Triangolare:
+    """Variazione relativa triangolare tra 'minimo' e 'massimo' con moda 'moda'."""
+
+    def __init__(self, minimo, moda, massimo):
+        self.minimo = minimo
+        self.moda = moda
+        self.massimo = massimo
+
+    def campiona(self, rng, n, estratti=None):
+        return rng.triangular(self.minimo, self.moda, self.massimo, n)
+
+
+class Empirica:
+    """
+    Variazioni relative osservate negli esercizi passati. Le voci create insieme da
+    variazioni_storiche() condividono l'anno estratto in ogni scenario, così i
+    movimenti congiunti (es. ricavi e costi) restano quelli storici.
+    """
+
+    def __init__(self, variazioni, storico=None):
+        self.variazioni = np.asarray(variazioni, dtype=float)
+        self.storico = storico if storico is not None else self.variazioni
+
+    def campiona(self, rng, n, estratti=None):
+        if estratti is None:
+            estratti = {}
+        chiave = id(self.storico)
+        if chiave not in estratti:
+            estratti[chiave] = rng.integers(0, len(self.variazioni), n)
+        return self.variazioni[estratti[chiave]]
+
+
+def variazioni_storiche(periodi):
+    """
+    Distribuzioni empiriche delle voci da un DataFrame periodi × voci, con il periodo
+    più recente per primo (come debug_info["periodi"] dei bilanci Excel).
+    Usa le variazioni tra esercizi consecutivi; servono almeno due periodi.
+    """
+    cronologico = periodi.iloc[::-1].astype(float)
+    variazioni = (cronologico / cronologico.shift(1) - 1).iloc[1:]
+    variazioni = variazioni.replace([np.inf, -np.inf], np.nan)
+    matrice = variazioni.to_numpy()
+    return {voce: Empirica(np.nan_to_num(variazioni[voce].to_numpy()), storico=matrice)
+            for voce in variazioni.columns if variazioni[voce].notna().any()}
+
+
+def simula_scenari(base, distribuzioni, n=N_SCENARI, seed=None):
+    """
+    Scenari congiunti delle voci: ogni voce in 'distribuzioni' vale
+    base × (1 + variazione estratta), le altre restano al valore di 'base'.
+    Ritorna un DataFrame n × voci.
+    """
+    rng = np.random.default_rng(seed)
+    estratti = {}
+    scenari = {}
+    for voce in dict.fromkeys(list(INPUT_KPI) + list(base)):
+        valore = float(base.get(voce, INPUT_KPI.get(voce, 0)) or 0)
+        if voce in distribuzioni:
+            scenari[voce] = valore * (1 + distribuzioni[voce].campiona(rng, n, estratti))
+        elif voce in base:
+            scenari[voce] = np.full(n, valore)
+    return pd.DataFrame(scenari)
+
+
+def bande_percentili(kpi, percentili=PERCENTILI):
+    """Percentili di ogni KPI sugli scenari in cui è definito (NaN esclusi): DataFrame KPI × percentile."""
+    valori = np.full((len(percentili), kpi.shape[1]), np.nan)
+    matrice = kpi.to_numpy()
+    definiti = ~np.isnan(matrice).all(axis=0)
+    if definiti.any():
+        valori[:, definiti] = np.nanpercentile(matrice[:, definiti], percentili, axis=0)
+    return pd.DataFrame(valori.T, index=kpi.columns, columns=[f"P{p}" for p in percentili])
+
+
+def probabilita_violazione(kpi, soglie=SOGLIE_CONTINUITA):
+    """
+    Frazione degli scenari in cui ogni soglia è violata: Series 'KPI op valore' → probabilità.
+    Gli scenari in cui il KPI non è definito (NaN) sono esclusi dal conteggio;
+    se non ne resta nessuno la probabilità è NaN.
+    """
+    risultato = {}
+    for nome, confronto, valore in soglie:
+        if nome in kpi:
+            valori = kpi[nome].to_numpy()
+            valori = valori[~np.isnan(valori)]
+            risultato[f"{nome} {confronto} {valore}"] = (float(_CONFRONTI[confronto](valori, valore).mean())
+                                                         if len(valori) else np.nan)
+    return pd.Series(risultato, dtype=float)
+
+
+def stress_test(base, distribuzioni, n=N_SCENARI, seed=None, soglie=SOGLIE_CONTINUITA,
+                percentili=PERCENTILI):
+    """
+    Stress test dei KPI: 'n' scenari congiunti delle voci, tutti i KPI calcolati in un
+    solo passaggio per colonne. Negli scenari con denominatore 0 il KPI non è definito:
+    vale NaN ed è escluso da bande e violazioni.
+    Ritorna {"bande", "violazioni", "esclusi", "kpi"}: "esclusi" è il numero di scenari
+    esclusi per KPI, "kpi" i KPI di ogni scenario.
+    """
+    scenari = simula_scenari(base, distribuzioni, n, seed)
+    indefiniti = kpi_indefiniti(scenari)
+    kpi = calcola_kpi(scenari).mask(indefiniti)
+    return {"bande": bande_percentili(kpi, percentili),
+            "violazioni": probabilita_violazione(kpi, soglie),
+            "esclusi": indefiniti.sum(),
+            "kpi": kpi}
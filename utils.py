@@ -3,289 +3,775 @@ import os
 import io
 import json
 import re
-import difflib
-import fitz                      # PyMuPDF per lettura PDF
+import heapq
+import time
+import functools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfgen import canvas
 
-# Supporto OCR
-OCR_AVAILABLE = False
-try:
-    import pytesseract
-    from PIL import Image
-    OCR_AVAILABLE = True
-except ImportError:
-    pass
+from ricerca_termini import AhoCorasick, IndiceTrigrammi
+from cache_estrazione import CacheEstrazione
+from estrazione_pdf import (
+    OCR_AVAILABLE, OCR_DPI, OCR_DPI_ANTEPRIMA, OCR_LANG, ocr_pagine, parole_pagine
+)
+from estrazione_finanaziaria import estrai_valori_tabelle, raggruppa_righe, testo_da_righe
+from layout_spaziale import PUNTEGGIO_MAX as PUNTEGGIO_MAX_LAYOUT, candidati_layout
+from estrazione_xbrl import estrai_valori_xbrl
+from valori_confermati import ArchivioConferme
+from estrazione_excel import leggi_excel
+from cache_llm import cache_risposte
 
 # Database valori confermati (apprendimento progressivo)
 CONFIRMATION_DB = "confermati.json"
 
+# Archivio in memoria condiviso dal processo, ricaricato solo quando i file cambiano
+_conferme = ArchivioConferme(CONFIRMATION_DB)
+
 def salva_valore_confermato(chiave, testo, valore):
     """Salva in modo persistente le correzioni manuali dell'utente."""
-    if not os.path.exists(CONFIRMATION_DB):
-        with open(CONFIRMATION_DB, "w") as f:
-            json.dump({}, f)
-    with open(CONFIRMATION_DB, "r") as f:
-        db = json.load(f)
-    if chiave not in db:
-        db[chiave] = []
-    db[chiave].append({"testo": testo, "valore": valore})
-    with open(CONFIRMATION_DB, "w") as f:
-        json.dump(db, f, indent=2)
+    _conferme.salva(chiave, testo, valore)
 
 def check_valori_confermati(text, chiave):
     """Controlla se nel testo è già stata confermata una coppia (chiave, testo)."""
-    if not os.path.exists(CONFIRMATION_DB):
-        return None
-    with open(CONFIRMATION_DB, "r") as f:
-        db = json.load(f)
-    for entry in db.get(chiave, []):
-        if entry["testo"] in text:
-            return entry["valore"]
-    return None
-
-def smart_extract_value(keyword, synonyms, text, return_debug=False):
+    return _conferme.cerca([text]).get(chiave)
+
+# Voci di bilancio cercate nel testo, con i relativi sinonimi
+keywords_map = {
+    "Ricavi": ["Totale ricavi", "Vendite", "Ricavi netti", "Revenue"],
+    "Costi": ["Costi totali", "Spese", "Oneri", "Total expenses"],
+    "Utile Netto": ["Risultato netto", "Net income", "Profit"],
+    "EBITDA": ["EBITDA", "Margine operativo lordo"],
+    "EBIT": ["EBIT", "Risultato operativo", "Operating income"],
+    "Cash Flow Operativo": ["Flusso di cassa operativo", "Operating cash flow"],
+
+    "Totale Attivo": ["Totale attivo", "Total assets"],
+    "Attivo Corrente": ["Attivo corrente", "Current assets"],
+    "Patrimonio Netto": ["Capitale proprio", "Net equity"],
+    "Debiti a Breve": ["Debiti a breve", "Current liabilities"],
+    "Debiti a Lungo": ["Debiti a lungo", "Long-term debt"],
+    "Cash Equivalents": ["Disponibilità liquide", "Cash and cash equivalents"]
+}
+
+# Numero massimo di righe candidate conservate per ogni chiave
+MAX_CANDIDATI = 10
+
+NUM_REGEX = re.compile(r"[-+]?\d[\d.,]+")
+
+# Similarità minima (1 - distanza di edit / lunghezza) per il confronto approssimato riga/termine
+FUZZY_CUTOFF = 0.85
+
+@functools.lru_cache(maxsize=16)
+def _compila_keywords(voci, soglia=FUZZY_CUTOFF):
     """
-    Estrae il valore numerico più probabile associato a 'keyword',
-    usando una serie di punteggi basati su sinonimi, prossimità e formattazione.
+    Prepara l'automa Aho-Corasick e l'indice a trigrammi su tutte le keyword e i sinonimi.
+    'voci' è una tupla di (keyword, (sinonimi...)) per poter essere messa in cache.
     """
-    candidates = []
-    lines = text.split("\n")
-    all_terms = [keyword.lower()] + [s.lower() for s in synonyms]
+    chiavi = []
+    for keyword, synonyms in voci:
+        kw = keyword.lower()
+        all_terms = [kw] + [s.lower() for s in synonyms]
+        chiavi.append((keyword, kw, all_terms))
+    termini = [t for _, _, terms in chiavi for t in terms]
+    return AhoCorasick(termini), IndiceTrigrammi(termini, soglia), chiavi
+
+# Punteggio massimo di un candidato dello scanner per righe: bonus di _punteggio_riga (9),
+# del termine (4 + 2 + 1), del numero (1 + 2 + 1) e della vicinanza termine/numero (2)
+PUNTEGGIO_MAX_RIGHE = 22
+
+def _punteggio_riga(line, ll, estremo):
+    """Parte del punteggio che dipende solo dalla riga (uguale per ogni keyword e numero)."""
+    score = 0
+    if estremo:
+        score += 1
+    if ":" in line or "\t" in line:
+        score += 1
+    if "totale" in ll:
+        score += 2
+    if any(x in ll for x in ["2023", "2022", "2024"]):
+        score -= 3
+    if "consolidated" in ll:
+        score += 2
+    if any(x in ll for x in ["statement", "income", "balance"]):
+        score += 2
+    if "note" in ll:
+        score -= 2
+    if "cash flow" in ll:
+        score += 1
+    if "%" in line or "percent" in ll:
+        score -= 1
+    return score
+
+def _numeri_riga(line, ll):
+    """Numeri trovati nella riga con la parte di punteggio che dipende solo dal numero."""
+    # Gestione milioni / miliardi
+    if "billion" in ll or "miliardi" in ll:
+        molt = 1_000_000_000
+    elif "million" in ll or "milioni" in ll:
+        molt = 1_000_000
+    else:
+        molt = 1
+    euro = "€" in line
+    negativo_ok = any(x in ll for x in ["perdita", "costo"])
 
-    for i, line in enumerate(lines):
-        ll = line.lower()
-        # Trovo se uno dei termini compare esattamente o quasi
-        term_found = next((t for t in all_terms if t in ll), None)
-        if not term_found:
-            # tentativo fuzzy match
-            for t in all_terms:
-                if difflib.get_close_matches(t, [ll], cutoff=0.85):
-                    term_found = t
-                    break
-        if not term_found:
+    numeri = []
+    for m in NUM_REGEX.finditer(line):
+        num = m.group()
+        try:
+            val = float(num.replace(".", "").replace(",", "."))
+        except ValueError:
             continue
+        val *= molt
+
+        score = 0
+        if euro or ".00" in num or ",00" in num:
+            score += 1
+        if 1_000 <= val <= 100_000_000_000:
+            score += 2
+        if val < 0 and negativo_ok:
+            score += 1
+        numeri.append((val, ll.find(num), score))
+    return numeri
+
+# Le righe entro questa distanza dall'inizio o dalla fine del documento ricevono un bonus
+RIGHE_ESTREMI = 10
+
+def righe_testo(text, pagina=1):
+    """
+    Generatore di record (pagina, n_riga, riga) con le stesse righe di
+    text.split("\n"), senza creare la lista di tutte le righe.
+    """
+    inizio = 0
+    n_riga = 1
+    while True:
+        fine = text.find("\n", inizio)
+        if fine < 0:
+            yield pagina, n_riga, text[inizio:]
+            return
+        yield pagina, n_riga, text[inizio:fine]
+        inizio = fine + 1
+        n_riga += 1
+
+def righe_documento(pagine, numeri_pagina=None):
+    """
+    Record (pagina, n_riga, riga) di tutte le pagine in sequenza.
+    'numeri_pagina' indica il numero di ciascuna pagina (default 1, 2, ...).
+    """
+    if numeri_pagina is None:
+        numeri_pagina = range(1, len(pagine) + 1)
+    for n, testo in zip(numeri_pagina, pagine):
+        yield from righe_testo(testo, n)
 
-        # Cerco numeri nella riga
-        nums = re.findall(r"[-+]?\d[\d.,]+", line)
-        for num in nums:
-            try:
-                val = float(num.replace(".", "").replace(",", "."))
-            except:
+def scansiona_righe(righe, keywords, top_k=MAX_CANDIDATI, soglia_fuzzy=FUZZY_CUTOFF):
+    """
+    Scansione unica di un flusso di record (pagina, n_riga, riga) per tutte le keyword:
+    ogni riga viene abbassata, confrontata con l'automa di tutti i termini e analizzata
+    per i numeri una sola volta, poi scartata; in memoria restano solo i candidati.
+    Se nessun termine compare esattamente, la riga intera viene confrontata con
+    l'indice a trigrammi dei termini ('soglia_fuzzy' = similarità minima).
+    Per ogni keyword si conservano i migliori 'top_k' candidati (None = tutti),
+    ordinati per punteggio decrescente e, a parità, per ordine di comparsa.
+    """
+    voci = tuple((k, tuple(s)) for k, s in keywords.items())
+    automa, indice, chiavi = _compila_keywords(voci, soglia_fuzzy)
+    heaps = {keyword: [] for keyword, _, _ in chiavi}
+    seq = 0
+
+    def analizza(i, record, estremo):
+        nonlocal seq
+        pagina, _, line = record
+        ll = line.lower()
+        presenti = automa.termini_presenti(ll)
+        fuzzy = None
+        numeri = None
+
+        for keyword, kw, all_terms in chiavi:
+            # Trovo se uno dei termini compare esattamente o quasi
+            term_found = next((t for t in all_terms if t in presenti), None)
+            if not term_found:
+                # tentativo fuzzy match
+                if fuzzy is None:
+                    fuzzy = indice.corrispondenze(ll.strip())
+                term_found = next((t for t in all_terms if t in fuzzy), None)
+            if not term_found:
                 continue
 
-            # Gestione milioni / miliardi
-            if "billion" in ll or "miliardi" in ll:
-                val *= 1_000_000_000
-            elif "million" in ll or "milioni" in ll:
-                val *= 1_000_000
+            if numeri is None:
+                numeri = _numeri_riga(line, ll)
+                if not numeri:
+                    return
+                base = _punteggio_riga(line, ll, estremo or i < RIGHE_ESTREMI)
+                riga = line.strip()
 
             # Scoring lineare
-            score = 0
-            if keyword.lower() in ll:
-                score += 4
-            if term_found != keyword.lower():
-                score += 2
+            score_term = base
+            if kw in ll:
+                score_term += 4
+            if term_found != kw:
+                score_term += 2
             if ll.count(term_found) == 1:
-                score += 1
-            if abs(ll.find(term_found) - ll.find(num)) < 25:
-                score += 2
-            if "€" in line or ".00" in num or ",00" in num:
-                score += 1
-            if 1_000 <= val <= 100_000_000_000:
-                score += 2
-            if i < 10 or i > len(lines) - 10:
-                score += 1
-            if ":" in line or "\t" in line:
-                score += 1
-            if "totale" in ll:
-                score += 2
-            if val < 0 and any(x in ll for x in ["perdita", "costo"]):
-                score += 1
-            if any(x in ll for x in ["2023", "2022", "2024"]):
-                score -= 3
-            if "consolidated" in ll:
-                score += 2
-            if any(x in ll for x in ["statement", "income", "balance"]):
-                score += 2
-            if "note" in ll:
-                score -= 2
-            if "cash flow" in ll:
-                score += 1
-            if "%" in line or "percent" in ll:
-                score -= 1
-
-            candidates.append({
-                "term": term_found,
-                "valore": val,
-                "score": score,
-                "riga": line.strip()
-            })
-
-    best = sorted(candidates, key=lambda x: x["score"], reverse=True)
+                score_term += 1
+            pos_term = ll.find(term_found)
+
+            heap = heaps[keyword]
+            for val, pos_num, score_num in numeri:
+                score = score_term + score_num
+                if abs(pos_term - pos_num) < 25:
+                    score += 2
+                seq += 1
+                cand = (score, -seq, {"term": term_found, "valore": val, "score": score,
+                                      "riga": riga, "pagina": pagina})
+                if top_k is None or len(heap) < top_k:
+                    heapq.heappush(heap, cand)
+                elif cand[:2] > heap[0][:2]:
+                    heapq.heapreplace(heap, cand)
+
+    # Il bonus di fine documento richiede di sapere quali sono le ultime righe:
+    # si tiene in attesa solo una finestra di RIGHE_ESTREMI - 1 righe.
+    in_attesa = deque()
+    for i, record in enumerate(righe):
+        in_attesa.append((i, record))
+        if len(in_attesa) >= RIGHE_ESTREMI:
+            analizza(*in_attesa.popleft(), False)
+    for i, record in in_attesa:
+        analizza(i, record, True)
+
+    return {keyword: [c for _, _, c in sorted(heap, key=lambda x: x[:2], reverse=True)]
+            for keyword, heap in heaps.items()}
+
+def scansiona_keywords(text, keywords, top_k=MAX_CANDIDATI, soglia_fuzzy=FUZZY_CUTOFF):
+    """Come scansiona_righe(), su un testo unico."""
+    return scansiona_righe(righe_testo(text), keywords, top_k, soglia_fuzzy)
+
+def smart_extract_value(keyword, synonyms, text, return_debug=False):
+    """
+    Estrae il valore numerico più probabile associato a 'keyword',
+    usando una serie di punteggi basati su sinonimi, prossimità e formattazione.
+    """
+    best = scansiona_keywords(text, {keyword: synonyms},
+                              top_k=None if return_debug else 1)[keyword]
     if return_debug:
         return best
     return best[0] if best else {"valore": 0.0, "score": 0, "riga": ""}
 
-def extract_all_values_smart(text, return_debug=False):
+def estrai_valori_righe(righe, top_k=MAX_CANDIDATI, keywords=None):
     """
-    Applica smart_extract_value a un insieme di keyword di bilancio.
-    Restituisce un dizionario chiave→valore e, in modalità debug, anche le righe candidate.
+    Estrae le voci di 'keywords' (default: tutte quelle di 'keywords_map') da un flusso
+    di record (pagina, n_riga, riga), senza applicare i valori confermati.
+    Ritorna (chiave→valore, chiave→candidati).
     """
-    keywords_map = {
-        "Ricavi": ["Totale ricavi", "Vendite", "Ricavi netti", "Revenue"],
-        "Costi": ["Costi totali", "Spese", "Oneri", "Total expenses"],
-        "Utile Netto": ["Risultato netto", "Net income", "Profit"],
-        "EBITDA": ["EBITDA", "Margine operativo lordo"],
-        "EBIT": ["EBIT", "Risultato operativo", "Operating income"],
-        "Cash Flow Operativo": ["Flusso di cassa operativo", "Operating cash flow"],
-
-        "Totale Attivo": ["Totale attivo", "Total assets"],
-        "Attivo Corrente": ["Attivo corrente", "Current assets"],
-        "Patrimonio Netto": ["Capitale proprio", "Net equity"],
-        "Debiti a Breve": ["Debiti a breve", "Current liabilities"],
-        "Debiti a Lungo": ["Debiti a lungo", "Long-term debt"],
-        "Cash Equivalents": ["Disponibilità liquide", "Cash and cash equivalents"]
-    }
+    estratti = scansiona_righe(righe, keywords_map if keywords is None else keywords, top_k=top_k)
+    risultati = {key: (estr[0]["valore"] if estr else 0.0) for key, estr in estratti.items()}
+    return risultati, estratti
 
+def extract_all_values_smart(text, return_debug=False, top_k=MAX_CANDIDATI, usa_confermati=True):
+    """
+    Estrae in una sola scansione del testo tutte le voci di 'keywords_map'.
+    Restituisce un dizionario chiave→valore e, in modalità debug, anche le righe candidate
+    (al massimo 'top_k' per chiave). Con usa_confermati=False ignora i valori confermati.
+    """
     risultati = {}
     debug_righe = {}
+    da_cercare = {}
 
+    # una sola scansione del testo risolve i valori confermati di tutte le chiavi
+    confermati = _conferme.cerca([text]) if usa_confermati else {}
     for key, syn in keywords_map.items():
         # se già confermato manualmente, lo usiamo
-        confermato = check_valori_confermati(text, key)
+        confermato = confermati.get(key)
         if confermato is not None:
             risultati[key] = confermato
             if return_debug:
                 debug_righe[key] = []
         else:
-            estr = smart_extract_value(key, syn, text, return_debug)
-            if return_debug:
-                debug_righe[key] = estr             # lista di candidati
-                risultati[key] = estr[0]["valore"] if estr else 0.0
-            else:
-                risultati[key] = estr["valore"]
+            da_cercare[key] = syn
+
+    estratti = scansiona_keywords(text, da_cercare, top_k=top_k if return_debug else 1)
+    for key in keywords_map:
+        if key not in estratti:
+            continue
+        estr = estratti[key]
+        risultati[key] = estr[0]["valore"] if estr else 0.0
+        if return_debug:
+            debug_righe[key] = estr             # lista di candidati
 
     if return_debug:
         return risultati, debug_righe
     return risultati
 
-def extract_financial_data(file_path, return_debug=False):
+def applica_valori_confermati(pagine, data, debug_righe=None):
     """
-    Estrae testo dal file (PDF/Excel/txt/docx), poi chiama extract_all_values_smart.
-    Se return_debug=True, ritorna (data, debug_info).
+    Sovrascrive i valori estratti con quelli confermati manualmente per questo documento.
+    I testi confermati sono righe singole, quindi basta cercarli pagina per pagina.
+    """
+    for key, confermato in _conferme.cerca(pagine).items():
+        if key in keywords_map:
+            data[key] = confermato
+            if debug_righe is not None:
+                debug_righe[key] = []
+    return data
+
+# Intestazioni tipiche dei prospetti (stato patrimoniale, conto economico, rendiconto finanziario)
+INTESTAZIONI_PROSPETTI = [
+    "stato patrimoniale", "conto economico", "rendiconto finanziario",
+    "situazione patrimoniale-finanziaria", "prospetto della situazione patrimoniale",
+    "balance sheet", "statement of financial position", "income statement",
+    "statement of profit or loss", "statement of comprehensive income",
+    "cash flow statement", "statement of cash flows",
+]
+
+# Numero di pagine analizzate quando il documento è più lungo (None = tutte)
+PAGINE_PROSPETTI = 15
+
+def punteggio_pagina(testo):
+    """
+    Punteggio di una pagina come candidato prospetto di bilancio: intestazioni
+    presenti, più voci di 'keywords_map' distinte pesate per la densità di
+    numeri per riga (le pagine narrative hanno poche cifre).
+    """
+    ll = testo.lower()
+    n_righe = sum(1 for r in ll.split("\n") if r.strip())
+    if not n_righe:
+        return 0.0
+    # confronti di sottostringa: su pagine intere sono più rapidi dell'automa
+    intestazioni = sum(1 for t in INTESTAZIONI_PROSPETTI if t in ll)
+    voci = sum(1 for t in _termini_keywords() if t in ll)
+    densita = min(len(NUM_REGEX.findall(testo)) / n_righe, 2)
+    return 10 * intestazioni + 3 * voci * densita
+
+@functools.lru_cache(maxsize=1)
+def _termini_keywords():
+    return tuple(dict.fromkeys(t.lower() for k, syn in keywords_map.items() for t in [k] + syn))
+
+def localizza_pagine_prospetti(testi, top_n=PAGINE_PROSPETTI):
+    """
+    Ordina le pagine per punteggio_pagina() e restituisce gli indici (in ordine
+    di pagina) delle 'top_n' migliori con punteggio positivo.
+    Se nessuna pagina ha punteggio positivo restituisce tutte le pagine.
+    """
+    punteggi = [(punteggio_pagina(t), n) for n, t in enumerate(testi)]
+    migliori = sorted((p for p in punteggi if p[0] > 0), key=lambda p: (-p[0], p[1]))[:top_n]
+    if not migliori:
+        return list(range(len(testi)))
+    return sorted(n for _, n in migliori)
+
+def _leggi_pdf(file_path, debug_info, workers=None, ocr_dpi=OCR_DPI, ocr_lang=OCR_LANG,
+               pagine_prospetti=PAGINE_PROSPETTI):
+    """
+    Legge le pagine del PDF e sceglie quelle da analizzare.
+    Con documenti più lunghi di 'pagine_prospetti' una pre-analisi veloce
+    (text layer e, per le pagine scansionate, OCR a bassa risoluzione) individua
+    le pagine dei prospetti: solo queste passano all'OCR completo e allo scoring.
+    Le pagine vengono lette una alla volta: di ognuna resta il testo, mentre parole
+    con coordinate e righe di celle (per le tabelle e l'abbinamento spaziale) restano
+    solo per le prime 'pagine_prospetti' pagine; quelle delle altre pagine selezionate
+    vengono rilette dopo la localizzazione.
+    Ritorna (testi di tutte le pagine, indici delle pagine selezionate, e per le
+    pagine selezionate con text layer la coppia (parole, righe di celle)).
+    """
+    t0 = time.perf_counter()
+    testi = []
+    tenute = {}
+    for n, parole in enumerate(parole_pagine(file_path)):
+        righe = raggruppa_righe(parole)
+        testi.append(testo_da_righe(righe))
+        if parole and (not pagine_prospetti or n < pagine_prospetti):
+            tenute[n] = (parole, righe)
+    con_testo = {n for n, t in enumerate(testi) if t}
+    scansionate = [n for n in range(len(testi)) if n not in con_testo] if OCR_AVAILABLE else []
+
+    anteprime = []
+    if not pagine_prospetti or len(testi) <= pagine_prospetti:
+        selezionate = list(range(len(testi)))
+    else:
+        if scansionate:
+            for n, testo in zip(scansionate, ocr_pagine(file_path, scansionate, workers, OCR_DPI_ANTEPRIMA, ocr_lang)):
+                testi[n] = testo
+            anteprime = scansionate
+        selezionate = localizza_pagine_prospetti(testi, pagine_prospetti)
+    t_prepass = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    gia_lette = set(anteprime) if OCR_DPI_ANTEPRIMA >= ocr_dpi else set()
+    da_ocr = sorted(set(scansionate) & set(selezionate) - gia_lette)
+    if da_ocr:
+        for n, testo in zip(da_ocr, ocr_pagine(file_path, da_ocr, workers, ocr_dpi, ocr_lang)):
+            testi[n] = testo
+    t_ocr = time.perf_counter() - t0
+
+    layout = {}
+    rilette = [n for n in selezionate if n in con_testo and n not in tenute]
+    for n, parole in zip(rilette, parole_pagine(file_path, rilette)):
+        tenute[n] = (parole, raggruppa_righe(parole))
+    for n in selezionate:
+        if n in tenute:
+            layout[n] = tenute[n]
+
+    saltate = len(testi) - len(selezionate)
+    if saltate:
+        # con le anteprime già alla risoluzione dell'OCR completo nessuna pagina lo evita
+        ocr_saltate = 0 if gia_lette else len(scansionate) - len(da_ocr)
+        debug_info["localizzazione"] = {
+            "pagine_totali": len(testi),
+            "pagine_analizzate": [n + 1 for n in selezionate],
+            "pagine_saltate": saltate,
+            "pagine_ocr_saltate": ocr_saltate,
+            "tempo_preanalisi_s": round(t_prepass, 3),
+            # stima: tempo medio di OCR completo misurato per le pagine selezionate
+            "tempo_risparmiato_stimato_s": round(ocr_saltate * t_ocr / len(da_ocr), 3) if da_ocr else 0.0,
+        }
+    return testi, selezionate, layout
+
+# Versione dell'estrattore: va incrementata quando cambia il risultato dell'estrazione,
+# così le voci in cache prodotte dalla versione precedente non vengono più usate.
+VERSIONE_ESTRATTORE = 10
+
+# Modalità di abbinamento voce/valore per i PDF con text layer:
+# "righe" = scoring sulle righe di testo, "layout" = abbinamento spaziale sulle coordinate
+MODALITA_ESTRAZIONE = ("righe", "layout")
+
+_cache_estrazioni = CacheEstrazione()
+
+def _estrai_documento(file_path, workers=None, ocr_dpi=OCR_DPI, ocr_lang=OCR_LANG,
+                      pagine_prospetti=PAGINE_PROSPETTI, modalita="righe"):
+    """
+    Estrae testo dal file (PDF/Excel/txt), poi chiama extract_all_values_smart
+    senza applicare i valori confermati. Ritorna un dizionario con
+    'pagine' (testi delle pagine, None per Excel), 'data' e 'debug'.
     """
     debug_info = {}
     data = {}
+    pagine = None
+    selezionate = None
+    layout = {}
 
     # PDF
     if file_path.lower().endswith(".pdf"):
-        text = ""
         try:
-            doc = fitz.open(file_path)
-            for page in doc:
-                pagetext = page.get_text()
-                if not pagetext and OCR_AVAILABLE:
-                    pix = page.get_pixmap()
-                    img = Image.open(io.BytesIO(pix.tobytes()))
-                    pagetext = pytesseract.image_to_string(img, lang="ita")
-                text += pagetext + "\n"
-            doc.close()
+            pagine, selezionate, layout = _leggi_pdf(file_path, debug_info, workers, ocr_dpi,
+                                                     ocr_lang, pagine_prospetti)
         except Exception as e:
             debug_info["errore"] = f"Errore apertura PDF: {e}"
-            return (data, debug_info) if return_debug else data
-
-        debug_info["estratto"] = text[:2000]
-        data, debug_righe = extract_all_values_smart(text, return_debug=True)
-        debug_info["righe_candidate"] = debug_righe
+            return {"pagine": None, "data": data, "debug": debug_info}
 
     # Excel (.xlsx, .xls)
     elif file_path.lower().endswith((".xlsx", ".xls")):
         try:
-            df = pd.read_excel(file_path)
-            # prendo la prima riga e i nomi di colonna corrispondenti
-            row = df.iloc[0]
-            data = {
-                "Ricavi": row.get("Ricavi", 0),
-                "Costi": row.get("Costi", 0),
-                "Utile Netto": row.get("Utile Netto", 0),
-                "Totale Attivo": row.get("Totale Attivo", 0),
-                "Patrimonio Netto": row.get("Patrimonio Netto", 0)
-            }
+            # tutti i periodi trovati; i dati sono quelli del periodo più recente
+            periodi, debug_info["excel"] = leggi_excel(file_path, keywords_map)
+            data = {key: 0.0 for key in keywords_map}
+            if len(periodi):
+                data.update(periodi.iloc[0].dropna().to_dict())
+            debug_info["periodi"] = {p: r.dropna().to_dict() for p, r in periodi.iterrows()}
         except Exception as e:
             debug_info["errore"] = f"Errore lettura Excel: {e}"
 
+    # XBRL / iXBRL: i valori sono fatti con concetto di tassonomia, nessuno scoring
+    elif file_path.lower().endswith((".xbrl", ".xml", ".xhtml")):
+        try:
+            data, debug_info["xbrl"] = estrai_valori_xbrl(file_path)
+        except Exception as e:
+            debug_info["errore"] = f"Errore lettura XBRL: {e}"
+
     # Testo semplice (.txt, .md, .csv)
     elif file_path.lower().endswith((".txt", ".md", ".csv")):
         try:
             with open(file_path, "r", encoding="utf-8") as f:
-                text = f.read()
-            debug_info["estratto"] = text[:2000]
-            data, debug_righe = extract_all_values_smart(text, return_debug=True)
-            debug_info["righe_candidate"] = debug_righe
+                pagine = [f.read()]
         except Exception as e:
             debug_info["errore"] = f"Errore apertura testo: {e}"
 
     else:
         debug_info["errore"] = f"Formato non supportato: {file_path}"
 
+    if pagine is not None:
+        if selezionate is None:
+            selezionate = range(len(pagine))
+        analizzate = [pagine[n] for n in selezionate]
+        debug_info["estratto"] = _estratto(analizzate)
+        t0 = time.perf_counter()
+        if modalita == "layout" and layout:
+            data, debug_righe = _estrai_valori_layout(pagine, selezionate, layout)
+        else:
+            righe = righe_documento(analizzate, [n + 1 for n in selezionate])
+            data, debug_righe = estrai_valori_righe(righe)
+        debug_info["righe_candidate"] = debug_righe
+
+        # Valori dalle righe di tabella delle pagine dei prospetti (stesso layout del testo):
+        # completano le voci che lo scoring per righe non ha trovato
+        if layout:
+            voci = {k: [k] + syn for k, syn in keywords_map.items()}
+            righe_tab = [r for _, r in layout.values()]
+            tabelle = estrai_valori_tabelle(righe_tab, voci, [n + 1 for n in layout])
+            debug_info["tabelle"] = tabelle
+            for key, trovato in tabelle.items():
+                if not data.get(key):
+                    data[key] = float(trovato["valore"])
+
+        loc = debug_info.get("localizzazione")
+        if loc:
+            # stima del tempo di scoring evitato, in proporzione alle righe saltate
+            t_scoring = time.perf_counter() - t0
+            righe_analizzate = sum(p.count("\n") + 1 for p in analizzate)
+            righe_saltate = sum(p.count("\n") + 1 for p in pagine) - righe_analizzate
+            loc["tempo_risparmiato_stimato_s"] = round(
+                loc["tempo_risparmiato_stimato_s"] + t_scoring * righe_saltate / righe_analizzate, 3)
+
+    return {"pagine": pagine, "data": data, "debug": debug_info}
+
+def _estrai_valori_layout(pagine, selezionate, layout, top_k=MAX_CANDIDATI):
+    """
+    Modalità layout: per le pagine con text layer ogni etichetta viene abbinata
+    con query spaziali al valore nella sua riga e nella colonna dell'esercizio corrente.
+    Lo scanner per righe resta per le pagine da OCR e per le voci non trovate.
+    I punteggi dei due metodi hanno scale diverse: i candidati vengono confrontati
+    sul punteggio diviso per il massimo del proprio metodo ("score_norm").
+    'layout' associa alle pagine con text layer la coppia (parole, righe di celle).
+    """
+    automa, _, chiavi = _compila_keywords(tuple((k, tuple(s)) for k, s in keywords_map.items()))
+    candidati = {key: [] for key in keywords_map}
+    for n, (parole, righe) in layout.items():
+        for key, trovati in candidati_layout(parole, automa, chiavi, n + 1, righe).items():
+            for c in trovati:
+                c["score_norm"] = round(c["score"] / PUNTEGGIO_MAX_LAYOUT, 3)
+            candidati[key].extend(trovati)
+
+    mancanti = {key: syn for key, syn in keywords_map.items() if not candidati[key]}
+    da_ocr = [n for n in selezionate if n not in layout]
+    con_testo = [n for n in selezionate if n in layout]
+    for indici, voci in [(da_ocr, keywords_map), (con_testo, mancanti)]:
+        if indici and voci:
+            righe = righe_documento([pagine[n] for n in indici], [n + 1 for n in indici])
+            for key, estr in estrai_valori_righe(righe, top_k, voci)[1].items():
+                for c in estr:
+                    c["score_norm"] = round(c["score"] / PUNTEGGIO_MAX_RIGHE, 3)
+                candidati[key].extend(estr)
+
+    debug_righe = {}
+    for key, cand in candidati.items():
+        # a parità di punteggio conta l'ordine: prima i valori abbinati sul layout
+        debug_righe[key] = sorted(cand, key=lambda c: c["score_norm"], reverse=True)[:top_k]
+    data = {key: (c[0]["valore"] if c else 0.0) for key, c in debug_righe.items()}
+    return data, debug_righe
+
+def _estratto(pagine, lunghezza=2000):
+    """Inizio del testo del documento per il debug, senza concatenare tutte le pagine."""
+    parti = []
+    totale = 0
+    for p in pagine:
+        parti.append(p)
+        totale += len(p) + 1
+        if totale >= lunghezza:
+            break
+    return "\n".join(parti)[:lunghezza]
+
+def extract_financial_data(file_path, return_debug=False, use_cache=True,
+                           workers=None, ocr_dpi=OCR_DPI, ocr_lang=OCR_LANG,
+                           pagine_prospetti=PAGINE_PROSPETTI, modalita="righe"):
+    """
+    Estrae testo dal file (PDF/Excel/txt), poi chiama extract_all_values_smart.
+    I file XBRL/iXBRL (.xbrl, .xml, .xhtml) vengono letti come fatti etichettati
+    dalla tassonomia, senza OCR né scoring.
+    Con modalita="layout" le voci dei PDF con text layer vengono abbinate ai valori
+    per posizione (riga e colonna dell'esercizio corrente) invece che per riga di testo.
+    Le pagine PDF vengono elaborate in parallelo da 'workers' processi;
+    'ocr_dpi' e 'ocr_lang' configurano l'OCR delle pagine senza testo.
+    Dei PDF lunghi si analizzano solo le 'pagine_prospetti' pagine che
+    sembrano prospetti di bilancio (None = tutte le pagine).
+    Il risultato viene salvato nella cache su disco, indicizzata per hash del contenuto
+    del file e versione dell'estrattore; i valori confermati vengono applicati dopo,
+    così restano aggiornati anche per i documenti già in cache.
+    Se return_debug=True, ritorna (data, debug_info).
+    """
+    data, debug_info, _ = dati_e_pagine(file_path, use_cache, workers, ocr_dpi, ocr_lang,
+                                        pagine_prospetti, modalita)
     return (data, debug_info) if return_debug else data
 
+def dati_e_pagine(file_path, use_cache=True, workers=None, ocr_dpi=OCR_DPI, ocr_lang=OCR_LANG,
+                  pagine_prospetti=PAGINE_PROSPETTI, modalita="righe"):
+    """
+    Come extract_financial_data(return_debug=True), ma ritorna anche i testi di tutte
+    le pagine (lista vuota per Excel e XBRL): (data, debug_info, pagine).
+    """
+    voce = None
+    chiave = None
+    if use_cache:
+        try:
+            chiave = _cache_estrazioni.chiave(file_path, f"{VERSIONE_ESTRATTORE}-{ocr_dpi}{ocr_lang}-{pagine_prospetti}-{modalita}")
+            voce = _cache_estrazioni.leggi(chiave)
+        except OSError:
+            chiave = None
+
+    if voce is None:
+        voce = _estrai_documento(file_path, workers, ocr_dpi, ocr_lang, pagine_prospetti, modalita)
+        if chiave and "errore" not in voce["debug"]:
+            try:
+                _cache_estrazioni.scrivi(chiave, voce)
+            except OSError:
+                pass
+
+    data, debug_info = voce["data"], voce["debug"]
+    if voce["pagine"] is not None:
+        applica_valori_confermati(voce["pagine"], data, debug_info.get("righe_candidate"))
+
+    return data, debug_info, voce["pagine"] or []
+
+# Voci usate dai KPI e valore assunto quando mancano
+INPUT_KPI = {
+    "Ricavi": 0, "Costi": 0, "Utile Netto": 0, "Totale Attivo": 1, "Patrimonio Netto": 1,
+    "Debiti a Breve": 0, "Debiti a Lungo": 0, "Attivo Corrente": 0, "Cash Flow Operativo": 0,
+    "Cash Equivalents": 0, "EBITDA": 0, "EBIT": 0, "Oneri Finanziari": 1,
+}
+
+def _arrotonda(x, cifre=2):
+    """
+    Come round(v, cifre) su ogni elemento: np.round scala per 10**cifre e arrotonda il
+    prodotto, che vicino a un mezzo centesimo può cadere dall'altra parte del valore
+    esatto; quegli elementi vengono ricalcolati con round().
+    """
+    x = np.asarray(x, dtype=float)
+    y = x * 10.0 ** cifre
+    r = np.round(y) / 10.0 ** cifre
+    dubbi = np.flatnonzero(np.abs(np.abs(y - np.floor(y)) - 0.5) <= 4 * np.spacing(np.abs(y)))
+    if len(dubbi):
+        r[dubbi] = [round(v, cifre) for v in x[dubbi].tolist()]
+    return r
+
+def _rapporto(num, den, scala=1):
+    """num/den*scala arrotondato a 2 decimali, 0 dove il denominatore è 0."""
+    q = np.divide(num, den, out=np.zeros(len(num)), where=den != 0)
+    return _arrotonda(q * scala)
+
+# KPI come grafo di dipendenze: nome → (voci di input, formula sulle colonne di quelle voci)
+DEFINIZIONI_KPI = {
+    # Redditività
+    "Margine Operativo (%)": (("Ricavi", "Costi"),
+                              lambda ricavi, costi: _rapporto(ricavi - costi, ricavi, 100)),
+    "EBITDA Margin (%)":     (("EBITDA", "Ricavi"),
+                              lambda ebitda, ricavi: _rapporto(ebitda, ricavi, 100)),
+    "EBIT Margin (%)":       (("EBIT", "Ricavi"),
+                              lambda ebit, ricavi: _rapporto(ebit, ricavi, 100)),
+    "Return on Equity (ROE)":(("Utile Netto", "Patrimonio Netto"),
+                              lambda utile, pn: _rapporto(utile, pn, 100)),
+    "Return on Assets (ROA)":(("Utile Netto", "Totale Attivo"),
+                              lambda utile, attivo: _rapporto(utile, attivo, 100)),
+
+    # Liquidità
+    "Current Ratio":         (("Attivo Corrente", "Debiti a Breve"),
+                              lambda att_corr, deb_brevi: _rapporto(att_corr, deb_brevi)),
+    "Cash Ratio":            (("Cash Equivalents", "Debiti a Breve"),
+                              lambda cash_eq, deb_brevi: _rapporto(cash_eq, deb_brevi)),
+
+    # Leva finanziaria
+    "Debt to Equity":        (("Debiti a Breve", "Debiti a Lungo", "Patrimonio Netto"),
+                              lambda deb_brevi, deb_lunghi, pn: _rapporto(deb_brevi + deb_lunghi, pn)),
+    "Debt to Assets":        (("Debiti a Breve", "Debiti a Lungo", "Totale Attivo"),
+                              lambda deb_brevi, deb_lunghi, attivo: _rapporto(deb_brevi + deb_lunghi, attivo)),
+
+    # Efficienza
+    "Indice di Efficienza (%)": (("Utile Netto", "Costi"),
+                                 lambda utile, costi: _rapporto(utile, costi, 100)),
+    "Ricavi / Totale Attivo":    (("Ricavi", "Totale Attivo"),
+                                  lambda ricavi, attivo: _rapporto(ricavi, attivo)),
+    "Copertura Interessi":       (("EBIT", "Oneri Finanziari"),
+                                  lambda ebit, oneri_fin: _rapporto(ebit, oneri_fin)),
+
+    # Cash Flow
+    "Cash Flow su Utile Netto":  (("Cash Flow Operativo", "Utile Netto"),
+                                  lambda cf_operativo, utile: _rapporto(cf_operativo, utile)),
+    "Cash Flow su Ricavi":       (("Cash Flow Operativo", "Ricavi"),
+                                  lambda cf_operativo, ricavi: _rapporto(cf_operativo, ricavi)),
+    "Cash Flow Margin (%)":      (("Cash Flow Operativo", "Ricavi"),
+                                  lambda cf_operativo, ricavi: _rapporto(cf_operativo, ricavi, 100)),
+
+    # Indicatori personalizzati
+    "Capacità di autofinanziamento": (("Utile Netto", "Cash Flow Operativo", "Ricavi"),
+                                      lambda utile, cf_operativo, ricavi: _rapporto(utile + cf_operativo, ricavi, 100)),
+    "Indice di solidità patrimoniale": (("Patrimonio Netto", "Totale Attivo"),
+                                        lambda pn, attivo: _rapporto(pn, attivo)),
+    "Margine di struttura": (("Patrimonio Netto", "Debiti a Lungo"),
+                             lambda pn, deb_lunghi: _arrotonda(pn - deb_lunghi)),
+}
+
+# Voce al denominatore dei KPI che sono rapporti: dove vale 0 il KPI non è definito
+DENOMINATORI_KPI = {
+    "Margine Operativo (%)": "Ricavi", "EBITDA Margin (%)": "Ricavi", "EBIT Margin (%)": "Ricavi",
+    "Return on Equity (ROE)": "Patrimonio Netto", "Return on Assets (ROA)": "Totale Attivo",
+    "Current Ratio": "Debiti a Breve", "Cash Ratio": "Debiti a Breve",
+    "Debt to Equity": "Patrimonio Netto", "Debt to Assets": "Totale Attivo",
+    "Indice di Efficienza (%)": "Costi", "Ricavi / Totale Attivo": "Totale Attivo",
+    "Copertura Interessi": "Oneri Finanziari", "Cash Flow su Utile Netto": "Utile Netto",
+    "Cash Flow su Ricavi": "Ricavi", "Cash Flow Margin (%)": "Ricavi",
+    "Capacità di autofinanziamento": "Ricavi", "Indice di solidità patrimoniale": "Totale Attivo",
+}
+
+# Archi inversi del grafo: voce di input → KPI che ne dipendono
+DIPENDENZE_KPI = {voce: [nome for nome, (voci, _) in DEFINIZIONI_KPI.items() if voce in voci]
+                  for voce in INPUT_KPI}
+
+def kpi_dipendenti(voci):
+    """KPI (nell'ordine di DEFINIZIONI_KPI) che dipendono da almeno una delle 'voci'."""
+    toccati = {nome for voce in voci for nome in DIPENDENZE_KPI.get(voce, ())}
+    return [nome for nome in DEFINIZIONI_KPI if nome in toccati]
+
+def calcola_kpi(df, kpi=None):
+    """
+    KPI di redditività, liquidità, leva, efficienza e cash flow per ogni riga di 'df'
+    (entità o periodi × voci di INPUT_KPI), calcolati per colonne.
+    Con 'kpi' si calcolano solo quei KPI, leggendo solo le voci da cui dipendono.
+    Le voci assenti o NaN valgono il default di INPUT_KPI; un KPI con denominatore 0 vale 0.
+    Ritorna un DataFrame con lo stesso indice di 'df' e una colonna per KPI.
+    """
+    nomi = [nome for nome in DEFINIZIONI_KPI if kpi is None or nome in kpi]
+    v = {}
+    for nome in nomi:
+        for col in DEFINIZIONI_KPI[nome][0]:
+            if col not in v:
+                v[col] = _voce_kpi(df, col)
+    return pd.DataFrame({nome: DEFINIZIONI_KPI[nome][1](*(v[col] for col in DEFINIZIONI_KPI[nome][0]))
+                         for nome in nomi}, index=df.index)
+
+def _voce_kpi(df, col):
+    """Colonna 'col' di 'df' come array, con il default di INPUT_KPI dove manca o è NaN."""
+    default = INPUT_KPI[col]
+    return (df[col].fillna(default).to_numpy(dtype=float) if col in df
+            else np.full(len(df), float(default)))
+
+def kpi_indefiniti(df, kpi=None):
+    """
+    Dove i KPI di calcola_kpi(df, kpi) non sono definiti (denominatore 0, KPI posto a 0):
+    DataFrame di booleani con gli stessi indice e colonne.
+    """
+    nomi = [nome for nome in DEFINIZIONI_KPI if kpi is None or nome in kpi]
+    return pd.DataFrame({nome: (_voce_kpi(df, DENOMINATORI_KPI[nome]) == 0 if nome in DENOMINATORI_KPI
+                                else np.zeros(len(df), dtype=bool))
+                         for nome in nomi}, index=df.index)
+
+def sensibilita_kpi(data, voce, variazioni=np.linspace(-0.2, 0.2, 9), kpi=None):
+    """
+    Analisi di sensibilità: KPI al variare di 'voce' di ogni frazione in 'variazioni'
+    (es. -0.2 = -20%), a parità delle altre voci di 'data', in un solo calcolo per colonne.
+    Di default si calcolano solo i KPI che dipendono da 'voce'.
+    Ritorna un DataFrame indicizzato per variazione.
+    """
+    variazioni = np.asarray(variazioni, dtype=float)
+    df = pd.DataFrame([data] * len(variazioni), index=pd.Index(variazioni, name="variazione"))
+    df[voce] = float(data.get(voce, INPUT_KPI.get(voce, 0))) * (1 + variazioni)
+    return calcola_kpi(df, kpi_dipendenti([voce]) if kpi is None else kpi)
+
 def calculate_kpis(data):
     """
     Calcola un set completo di KPI redditività, liquidità, leva, efficienza, cash flow.
     Ritorna un DataFrame con colonne ['KPI','Valore'].
     """
-    ricavi      = data.get("Ricavi", 0)
-    costi       = data.get("Costi", 0)
-    utile       = data.get("Utile Netto", 0)
-    attivo      = data.get("Totale Attivo", 1)
-    pn          = data.get("Patrimonio Netto", 1)
-    deb_brevi   = data.get("Debiti a Breve", 0)
-    deb_lunghi  = data.get("Debiti a Lungo", 0)
-    att_corr    = data.get("Attivo Corrente", 0)
-    cf_operativo= data.get("Cash Flow Operativo", 0)
-    cash_eq     = data.get("Cash Equivalents", 0)
-    ebitda      = data.get("EBITDA", 0)
-    ebit        = data.get("EBIT", 0)
-    oneri_fin   = data.get("Oneri Finanziari", 1)
-
-    kpis = {
-        # Redditività
-        "Margine Operativo (%)": round((ricavi - costi)/ricavi*100, 2) if ricavi else 0,
-        "EBITDA Margin (%)":     round(ebitda/ricavi*100, 2)    if ricavi else 0,
-        "EBIT Margin (%)":       round(ebit/ricavi*100, 2)      if ricavi else 0,
-        "Return on Equity (ROE)":round(utile/pn*100, 2)         if pn     else 0,
-        "Return on Assets (ROA)":round(utile/attivo*100, 2)     if attivo else 0,
-
-        # Liquidità
-        "Current Ratio":         round(att_corr/deb_brevi, 2)    if deb_brevi else 0,
-        "Cash Ratio":            round(cash_eq/deb_brevi, 2)     if deb_brevi else 0,
-
-        # Leva finanziaria
-        "Debt to Equity":        round((deb_brevi+deb_lunghi)/pn, 2) if pn else 0,
-        "Debt to Assets":        round((deb_brevi+deb_lunghi)/attivo, 2) if attivo else 0,
-
-        # Efficienza
-        "Indice di Efficienza (%)": round(utile/costi*100, 2)    if costi else 0,
-        "Ricavi / Totale Attivo":    round(ricavi/attivo, 2)     if attivo else 0,
-        "Copertura Interessi":       round(ebit/oneri_fin, 2)    if oneri_fin else 0,
-
-        # Cash Flow
-        "Cash Flow su Utile Netto":  round(cf_operativo/utile, 2) if utile else 0,
-        "Cash Flow su Ricavi":       round(cf_operativo/ricavi,2) if ricavi else 0,
-        "Cash Flow Margin (%)":      round(cf_operativo/ricavi*100, 2) if ricavi else 0,
-
-        # Indicatori personalizzati
-        "Capacità di autofinanziamento": round((utile+cf_operativo)/ricavi*100, 2) if ricavi else 0,
-        "Indice di solidità patrimoniale": round(pn/attivo, 2) if attivo else 0,
-        "Margine di struttura": round(pn - deb_lunghi, 2)
-    }
-
-    return pd.DataFrame(list(kpis.items()), columns=["KPI", "Valore"])
+    riga = calcola_kpi(pd.DataFrame([data])).iloc[0]
+    return riga.rename_axis("KPI").reset_index(name="Valore")
 
 def plot_kpis(df_kpis):
     """
@@ -326,11 +812,37 @@ def plot_kpis(df_kpis):
 
     return fig_pct, fig_abs
 
-def generate_pdf_report(data, df_kpis, commento="", filename="report_auditflow.pdf"):
+def aggiorna_figure_kpi(figure, valori):
+    """
+    Aggiorna sul posto le barre dei KPI in 'valori' (KPI → valore) nelle figure di plot_kpis,
+    senza ricostruirle. Ritorna gli indici delle figure modificate.
+    """
+    modificate = []
+    for i, fig in enumerate(figure):
+        for trace in fig.data:
+            if trace.x is None:
+                continue
+            x = list(trace.x)
+            y, text = list(trace.y), list(trace.text if trace.text is not None else trace.y)
+            toccata = False
+            for nome, valore in valori.items():
+                if nome in x:
+                    j = x.index(nome)
+                    y[j] = text[j] = valore
+                    toccata = True
+            if toccata:
+                trace.y, trace.text = y, text
+                modificate.append(i)
+    return modificate
+
+def generate_pdf_report(data, df_kpis, commento="", filename=None):
     """
     Genera un PDF con i dati estratti, i KPI e il commento AI.
+    Il PDF viene prodotto in memoria e restituito come bytes, così richieste
+    contemporanee non condividono nessun file; con 'filename' viene anche salvato su disco.
     """
-    c = canvas.Canvas(filename, pagesize=A4)
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4)
     w, h = A4
 
     # Titolo
@@ -377,19 +889,87 @@ def generate_pdf_report(data, df_kpis, commento="", filename="report_auditflow.p
                 y = h - 50
 
     c.save()
-
-def genera_commento_ai(data):
+    pdf = buffer.getvalue()
+    if filename:
+        with open(filename, "wb") as f:
+            f.write(pdf)
+    return pdf
+
+def _inizializza_worker_report():
+    """Eseguita una volta per processo: carica le metriche dei font usati dai report."""
+    for font in ("Helvetica", "Helvetica-Bold"):
+        pdfmetrics.getFont(font)
+
+def _report_worker(voce):
+    nome, data, df_kpis, commento = voce
+    return nome, generate_pdf_report(data, df_kpis, commento)
+
+def _file_report(nome, usati):
     """
-    Genera un breve commento AI utilizzando OpenAI GPT.
+    Nome del file del report di 'nome' dentro la cartella di output: solo l'ultima parte
+    del nome, con i caratteri diversi da lettere, cifre, '.', '-' e '_' sostituiti da '_'.
+    Nomi che diventano uguali ricevono un suffisso numerico.
     """
+    base = re.sub(r"[^\w.-]", "_", os.path.basename(str(nome).replace("\\", "/"))).strip(".") or "senza_nome"
+    file, n = f"report_{base}.pdf", 1
+    while file in usati:
+        n += 1
+        file = f"report_{base}_{n}.pdf"
+    usati.add(file)
+    return file
+
+def genera_report_batch(voci, workers=None, cartella=None):
+    """
+    Report PDF di molte entità su 'workers' processi (default: numero di CPU).
+    'voci' è un dizionario nome → data oppure nome → (data, commento); i KPI di tutte
+    le entità sono calcolati insieme con calcola_kpi. Ritorna nome → bytes del PDF,
+    oppure, con 'cartella', nome → percorso del file scritto.
+    """
+    voci = {nome: (v if isinstance(v, tuple) else (v, "")) for nome, v in voci.items()}
+    if not voci:
+        return {}
+    kpi = calcola_kpi(pd.DataFrame.from_dict({n: d for n, (d, _) in voci.items()}, orient="index"))
+    lavori = [(nome, data, kpi.loc[nome].rename_axis("KPI").reset_index(name="Valore"), commento)
+              for nome, (data, commento) in voci.items()]
+
+    workers = min(workers or os.cpu_count() or 1, len(lavori))
+    if workers <= 1:
+        _inizializza_worker_report()
+        risultati = map(_report_worker, lavori)
+    else:
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_inizializza_worker_report)
+        risultati = pool.map(_report_worker, lavori, chunksize=max(1, len(lavori) // (workers * 4)))
+
+    report = {}
+    file_usati = set()
     try:
-        import openai
-        openai.api_key = os.getenv("OPENAI_API_KEY", "")
-    except:
-        return "⚠️ Libreria openai non trovata."
+        for nome, pdf in risultati:
+            if cartella:
+                os.makedirs(cartella, exist_ok=True)
+                percorso = os.path.join(cartella, _file_report(nome, file_usati))
+                with open(percorso, "wb") as f:
+                    f.write(pdf)
+                report[nome] = percorso
+            else:
+                report[nome] = pdf
+    finally:
+        if workers > 1:
+            pool.shutdown()
+    return report
+
+# Versione del prompt di genera_commento_ai: incrementandola i commenti in cache vengono rigenerati
+VERSIONE_PROMPT_COMMENTO_AI = 1
 
+def commento_ai(data, rigenera=False):
+    """
+    Commento OpenAI GPT sui dati, riusato dalla cache finché dati (arrotondati), modello
+    e prompt non cambiano; rigenera=True ne forza uno nuovo. A differenza di
+    genera_commento_ai gli errori vengono sollevati (usata dai commenti in batch).
+    """
+    import openai
+    openai.api_key = os.getenv("OPENAI_API_KEY", "")
     if not openai.api_key:
-        return "⚠️ Nessuna API key impostata per OpenAI."
+        raise RuntimeError("Nessuna API key impostata per OpenAI.")
 
     prompt = (
         "Sei un revisore contabile esperto. Analizza i seguenti dati estratti da un bilancio:\n"
@@ -401,16 +981,39 @@ def genera_commento_ai(data):
         "- Segnali di allerta"
     )
 
-    try:
+    opzioni = {"temperature": 0.3, "max_tokens": 350}
+    chiave = cache_risposte.chiave("gpt-3.5-turbo", "commento_ai", VERSIONE_PROMPT_COMMENTO_AI,
+                                   dati=data, opzioni=opzioni)
+
+    def _genera():
         res = openai.ChatCompletion.create(
             model="gpt-3.5-turbo",
             messages=[
                 {"role": "system", "content": "Sei un esperto revisore contabile."},
                 {"role": "user",   "content": prompt}
             ],
-            temperature=0.3,
-            max_tokens=350
+            **opzioni
         )
         return res.choices[0].message.content.strip()
+
+    return cache_risposte.risposta(chiave, _genera, rigenera)
+
+def genera_commento_ai(data, rigenera=False):
+    """
+    Genera un breve commento AI utilizzando OpenAI GPT.
+    Il commento viene riusato dalla cache finché dati (arrotondati), modello e prompt
+    non cambiano; rigenera=True ne forza uno nuovo.
+    """
+    try:
+        import openai
+        openai.api_key = os.getenv("OPENAI_API_KEY", "")
+    except:
+        return "⚠️ Libreria openai non trovata."
+
+    if not openai.api_key:
+        return "⚠️ Nessuna API key impostata per OpenAI."
+
+    try:
+        return commento_ai(data, rigenera)
     except Exception as e:
         return f"Errore generazione commento AI: {e}"
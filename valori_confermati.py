@@ -0,0 +1,175 @@
+# --- valori_confermati.py ---
+# Archivio dei valori confermati dall'utente (apprendimento progressivo), in memoria e su disco.
+
+import os
+import json
+import tempfile
+import threading
+
+from ricerca_termini import AhoCorasick
+
+# Righe del log oltre le quali il log viene compattato nel file principale
+COMPATTA_OGNI = 500
+# Testi confermati dopo la costruzione dell'automa, cercati per sottostringa finché sono pochi
+MAX_NUOVI = 50
+
+
+class ArchivioConferme:
+    """
+    Valori confermati per (chiave, testo), caricati una volta per processo.
+    Su disco: il file principale (formato storico {chiave: [{"testo", "valore"}]})
+    più un log JSONL in sola aggiunta con le conferme successive, che viene
+    compattato nel file principale ogni 'compatta_ogni' righe.
+    Se uno dei due file cambia (mtime o dimensione, es. un altro processo)
+    l'archivio viene ricaricato alla lettura successiva.
+    La ricerca in un documento è una sola scansione Aho-Corasick di tutti i testi confermati.
+    L'istanza è condivisa dai thread delle sessioni Streamlit: lo stato è protetto da un lock,
+    tranne la scansione dei documenti, che usa l'automa letto sotto lock.
+    """
+
+    def __init__(self, percorso, compatta_ogni=COMPATTA_OGNI):
+        self.percorso = percorso
+        self.percorso_log = percorso + ".log"
+        self.compatta_ogni = compatta_ogni
+        self._firma = None
+        self._voci = {}       # (chiave, testo) → valore, in ordine di prima conferma
+        self._per_testo = {}  # testo → [(posizione, chiave)]
+        self._automa = None
+        self._nuovi = []      # testi non ancora nell'automa
+        self._righe_log = 0
+        self._fine_log = 0    # byte del log fino alla fine dell'ultima riga letta
+        self._lock = threading.RLock()
+
+    def _firma_file(self):
+        firma = []
+        for p in (self.percorso, self.percorso_log):
+            try:
+                st = os.stat(p)
+                firma.append((st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                firma.append(None)
+        return tuple(firma)
+
+    def _aggiungi(self, chiave, testo, valore):
+        """Registra la conferma in memoria; True se (chiave, testo) è nuova."""
+        nuova = (chiave, testo) not in self._voci
+        self._voci[(chiave, testo)] = valore
+        if nuova:
+            posizioni = self._per_testo.setdefault(testo, [])
+            posizioni.append((len(self._voci), chiave))
+            if len(posizioni) == 1 and self._automa is not None:
+                self._nuovi.append(testo)
+        return nuova
+
+    def _aggiorna(self):
+        """Ricarica file principale e log se sono cambiati dall'ultima lettura."""
+        firma = self._firma_file()
+        if firma == self._firma:
+            return
+        self._voci, self._per_testo = {}, {}
+        self._automa, self._nuovi = None, []
+        if os.path.exists(self.percorso):
+            with open(self.percorso, "r", encoding="utf-8") as f:
+                db = json.load(f)
+            for chiave, voci in db.items():
+                for entry in voci:
+                    self._aggiungi(chiave, entry["testo"], entry["valore"])
+        self._righe_log = 0
+        self._fine_log = 0
+        if os.path.exists(self.percorso_log):
+            with open(self.percorso_log, "rb") as f:
+                contenuto = f.read()
+            # una riga finale senza a capo è una scrittura ancora in corso (o interrotta)
+            self._fine_log = contenuto.rfind(b"\n") + 1
+            for riga in contenuto[:self._fine_log].splitlines():
+                try:
+                    entry = json.loads(riga)
+                except json.JSONDecodeError:
+                    # riga troncata da una scrittura interrotta
+                    continue
+                self._aggiungi(entry["chiave"], entry["testo"], entry["valore"])
+                self._righe_log += 1
+        self._firma = firma
+
+    def salva(self, chiave, testo, valore):
+        """Aggiunge una conferma al log; non scrive nulla se è già registrata con lo stesso valore."""
+        with self._lock:
+            self._aggiorna()
+            if self._voci.get((chiave, testo)) == valore:
+                return
+            with open(self.percorso_log, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"chiave": chiave, "testo": testo, "valore": valore},
+                                   ensure_ascii=False) + "\n")
+            self._aggiungi(chiave, testo, valore)
+            self._righe_log += 1
+            self._firma = self._firma_file()
+            if self._righe_log >= self.compatta_ogni:
+                self.compatta()
+
+    def compatta(self):
+        """
+        Riscrive il file principale con le conferme lette e sostituisce il log con la
+        sua coda: le righe aggiunte (anche da altri processi) dopo la lettura restano nel log.
+        """
+        with self._lock:
+            self._firma = None
+            self._aggiorna()
+            fine = self._fine_log
+            cartella = os.path.dirname(os.path.abspath(self.percorso))
+            fd, tmp = tempfile.mkstemp(dir=cartella, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self.tutte(), f, indent=2, ensure_ascii=False)
+            os.replace(tmp, self.percorso)
+            # dopo un'interruzione qui il log viene solo riapplicato: le conferme sono idempotenti
+            if os.path.exists(self.percorso_log):
+                with open(self.percorso_log, "rb") as vecchio:
+                    vecchio.seek(fine)
+                    coda = vecchio.read()
+                    fd, tmp = tempfile.mkstemp(dir=cartella, suffix=".tmp")
+                    with os.fdopen(fd, "wb") as f:
+                        f.write(coda)
+                    os.replace(tmp, self.percorso_log)
+                    # righe scritte nel vecchio log durante la sostituzione
+                    resto = vecchio.read()
+                if resto:
+                    with open(self.percorso_log, "ab") as f:
+                        f.write(resto)
+            self._firma = None
+
+    def tutte(self):
+        """Le conferme nel formato storico {chiave: [{"testo", "valore"}]}."""
+        with self._lock:
+            self._aggiorna()
+            db = {}
+            for (chiave, testo), valore in self._voci.items():
+                db.setdefault(chiave, []).append({"testo": testo, "valore": valore})
+            return db
+
+    def cerca(self, pagine):
+        """
+        Valori confermati presenti nel documento: chiave → valore.
+        Se per una chiave compaiono più testi confermati vale il primo confermato.
+        """
+        with self._lock:
+            self._aggiorna()
+            if not self._voci:
+                return {}
+            if self._automa is None or len(self._nuovi) > MAX_NUOVI:
+                # automa senza DFA: con decine di migliaia di testi la memoria resta contenuta
+                self._automa = AhoCorasick(self._per_testo, dfa=False)
+                self._nuovi = []
+            automa, nuovi = self._automa, list(self._nuovi)
+
+        # la scansione dei documenti, la parte lunga, avviene fuori dal lock
+        presenti = set()
+        for p in pagine:
+            presenti |= automa.termini_presenti(p)
+            presenti.update(t for t in nuovi if t in p)
+
+        with self._lock:
+            migliori = {}
+            for testo in presenti:
+                for posizione, chiave in self._per_testo.get(testo, ()):
+                    if chiave not in migliori or posizione < migliori[chiave][0]:
+                        migliori[chiave] = (posizione, self._voci[(chiave, testo)])
+            return {chiave: valore for chiave, (_, valore) in migliori.items()}